@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+from ultralytics.trackers.bot_sort import BOTSORT
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.utils import IterableSimpleNamespace, yaml_load
+from ultralytics.utils.checks import check_yaml
+
+from model_registry import get_model, reset_tracker
+
+TRACKER_MAP = {"bytetrack": BYTETracker, "botsort": BOTSORT}
+TRACK_CONF = 0.1  # такой же порог, какой model.track() ставит по умолчанию
+EMPTY_TRACKS = np.empty((0, 7), dtype=np.float32)
+
+
+def create_tracker(tracker="bytetrack.yaml", frame_rate=30):
+    """Создает отдельный экземпляр трекера по yaml-конфигу ultralytics."""
+    cfg = IterableSimpleNamespace(**yaml_load(check_yaml(tracker)))
+    return TRACKER_MAP[cfg.tracker_type](args=cfg, frame_rate=frame_rate)
+
+
+def update_tracker(tracker, result):
+    """Передает детекции одного кадра в трекер и возвращает массив `boxes.data`.
+
+    Формат результата как у режима трекинга: x1, y1, x2, y2, id, conf, cls.
+    """
+    det = result.boxes.cpu().numpy()
+    if len(det) == 0:
+        # model.track() в этом случае тоже не вызывает трекер
+        return EMPTY_TRACKS
+    tracks = tracker.update(det, result.orig_img)
+    return tracks[:, :-1] if len(tracks) else EMPTY_TRACKS
+
+
+def detect_batch(model, frames):
+    """Детектирует пачку кадров одним вызовом модели."""
+    return model.predict(frames, conf=TRACK_CONF, verbose=False)
+
+
+def track_batch(model, tracker, frames):
+    """Детектирует пачку кадров одним вызовом модели и прогоняет трекер по порядку."""
+    return [update_tracker(tracker, result) for result in detect_batch(model, frames)]
+
+
+class TrackingDetector:
+    """Детектор с трекером для одного задания, вызываемый пачками кадров.
+
+    При batch_size <= 1 используется обычный `model.track(persist=True)`.
+    При batch_size > 1 кадры детектируются одним вызовом модели, а детекции
+    подаются в собственный трекер по порядку, поэтому подсчет не меняется.
+    Возвращает для каждого кадра массив боксов в формате `boxes.data`.
+    """
+
+    def __init__(self, batch_size=1, weights="yolov8n.pt", tracker="bytetrack.yaml"):
+        self.batch_size = batch_size
+        self.tracker = tracker
+        if batch_size <= 1:
+            self.model = get_model(weights, tracker)
+            reset_tracker(self.model)
+            self.frame_tracker = None
+        else:
+            # Отдельный экземпляр без колбэков трекинга: трекер ведем сами
+            self.model = get_model(weights, tracker=None)
+            self.frame_tracker = create_tracker(tracker)
+        self.frame_total = 0
+        self.elapsed = 0.0
+
+    def __call__(self, frames):
+        start = time.perf_counter()
+        if self.frame_tracker is None:
+            tracked = []
+            for frame in frames:
+                results = self.model.track(frame, persist=True, tracker=self.tracker)
+                boxes = results[0].boxes
+                tracked.append(boxes.data.cpu().numpy() if boxes.id is not None else EMPTY_TRACKS)
+        else:
+            tracked = track_batch(self.model, self.frame_tracker, frames)
+        self.elapsed += time.perf_counter() - start
+        self.frame_total += len(frames)
+        return tracked
+
+    def report(self):
+        """Печатает скорость инференса в кадрах в секунду."""
+        if self.frame_total and self.elapsed > 0:
+            print(f"Инференс: {self.frame_total} кадров за {self.elapsed:.1f} с "
+                  f"({self.frame_total / self.elapsed:.1f} кадр/с, batch={self.batch_size})")
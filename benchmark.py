@@ -0,0 +1,600 @@
+"""Воспроизводимый замер скорости конвейера подсчета пешеходов.
+
+Генерирует синтетическое видео с движущимися фигурами (параметры задают
+разрешение, FPS, длительность и плотность толпы), прогоняет по нему конвейер
+целиком (FrameEngine) и по отдельным стадиям, печатает кадры в секунду,
+перцентили задержки на кадр и пиковую память процесса и сохраняет
+результат в JSON. С --detector stub модель заменяется дешевым детектором
+по порогу яркости, так что измеряются только декодирование, трекинг и подсчет.
+С --compare-backends конвейер с моделью прогоняется на каждом бэкенде
+(ONNX Runtime, OpenVINO, INT8) и сравнивается с PyTorch по скорости и
+расхождению подсчета. С --segments видео считается по сегментам в
+нескольких процессах и сравнивается с последовательным проходом.
+С --check-counting (и всегда вместе с --compare) LineCounter сверяется с
+исходным циклом подсчета на случайных `boxes.data`. С --check-metrics
+видео считается в пуле процессов, как задание почтового бота, и
+проверяется, что метрики конвейера процесса пула видны на /metrics.
+
+Пример:
+    python benchmark.py --width 1280 --height 720 --duration 60 --density 8 --output bench.json
+    python benchmark.py --detector yolo --batch-size 8 --compare bench.json
+    python benchmark.py --video street.mp4 --compare-backends onnx onnx-int8 openvino
+    python benchmark.py --check-counting
+    python benchmark.py --check-metrics
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import socket
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+import metrics
+from counting import LineCounter
+from frame_engine import DEFAULT_QUEUE_DEPTH, FrameEngine, resize_frame
+from frame_ring import shared_frame_source
+from frame_sampler import DEFAULT_FRAME_SKIP, FrameSampler
+from job_queue import create_worker_pool
+from model_export import BACKENDS, export_model
+from motion_gate import GatedDetector, MotionGate
+from roi import LineRoi
+from segments import DEFAULT_OVERLAP_SEC, Segment, count_frames, merge_counts, plan_segments
+
+BACKGROUND = 40
+FIGURE_MIN_AREA = 50  # меньшие пятна стаб-детектор считает шумом
+STUB_CONFIDENCE = 0.9
+STUB_MAX_DISTANCE = 80  # на сколько пикселей центр может сместиться между кадрами одного трека
+LINE_X_RATIO = 0.25
+
+
+def generate_video(path, width=640, height=480, fps=25, duration=30, density=5, seed=0):
+    """Записывает синтетическое видео с пешеходами и возвращает его параметры.
+
+    Пешеход — светлый прямоугольник-тело с головой, идущий по горизонтали
+    с постоянной скоростью. density — среднее число фигур в кадре.
+    В результат входит число фигур, пересекающих линию подсчета слева
+    направо (без учета перекрытий, на которых стаб-детектор путает треки).
+    """
+    rng = np.random.default_rng(seed)
+    frame_total = int(round(fps * duration))
+    figure_h = max(20, height // 5)
+    figure_w = max(8, figure_h // 3)
+    # Скорость — от 1/8 до 1/3 ширины кадра в секунду; фигура проходит кадр за 3-8 с
+    speeds = width / fps / rng.uniform(3, 8, size=max(1, int(density * duration)))
+    mean_crossing = float(np.mean(width / (speeds * fps)))
+    spawn_rate = density / mean_crossing / fps  # появлений на кадр, чтобы в кадре было около density фигур
+    spawn_frames = np.sort(rng.uniform(-mean_crossing * fps, frame_total, size=rng.poisson(
+        spawn_rate * (frame_total + mean_crossing * fps))))
+
+    figures = []
+    for spawn, speed in zip(spawn_frames, np.resize(speeds, len(spawn_frames))):
+        direction = 1 if rng.random() < 0.7 else -1
+        figures.append({
+            "spawn": spawn,
+            "speed": speed * direction,
+            "start_x": -figure_w if direction > 0 else width,
+            "y": int(rng.uniform(0, height - figure_h)),
+            "color": tuple(int(c) for c in rng.integers(150, 256, size=3)),
+        })
+
+    line_x = int(width * LINE_X_RATIO)
+    crossings = 0
+    for figure in figures:
+        if figure["speed"] > 0:
+            center_at_end = figure["start_x"] + figure_w / 2 + figure["speed"] * (frame_total - figure["spawn"])
+            crossings += center_at_end > line_x and figure["start_x"] + figure_w / 2 < line_x
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Не удалось создать видео {path}")
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    head = figure_w // 2
+    for index in range(frame_total):
+        frame[:] = BACKGROUND
+        for figure in figures:
+            x = int(figure["start_x"] + figure["speed"] * (index - figure["spawn"]))
+            if index < figure["spawn"] or x + figure_w < 0 or x >= width:
+                continue
+            y = figure["y"]
+            cv2.rectangle(frame, (x, y + head), (x + figure_w, y + figure_h), figure["color"], -1)
+            cv2.circle(frame, (x + figure_w // 2, y + head // 2), head // 2 + 1, figure["color"], -1)
+        writer.write(frame)
+    writer.release()
+    return {"path": path, "width": width, "height": height, "fps": fps, "duration": duration,
+            "density": density, "seed": seed, "frames": frame_total, "figures": len(figures),
+            "expected_crossings": int(crossings)}
+
+
+class StubDetector:
+    """Детектор-заглушка: находит светлые фигуры порогом и связывает их в треки по ближайшему центру.
+
+    Возвращает для каждого кадра массив в формате `boxes.data` режима
+    трекинга (x1, y1, x2, y2, id, conf, cls), как TrackingDetector,
+    но без нейросети — чтобы отделить накладные расходы конвейера от модели.
+    """
+
+    def __init__(self, max_distance=STUB_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.frame_total = 0
+        self.elapsed = 0.0
+        self._centers = np.empty((0, 2))
+        self._ids = np.empty(0, dtype=np.int64)
+        self._next_id = 1
+
+    def __call__(self, frames):
+        start = time.perf_counter()
+        tracked = [self._detect(frame) for frame in frames]
+        self.elapsed += time.perf_counter() - start
+        self.frame_total += len(frames)
+        return tracked
+
+    def _detect(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        _, mask = cv2.threshold(gray, BACKGROUND + 40, 255, cv2.THRESH_BINARY)
+        _, _, stats, centroids = cv2.connectedComponentsWithStats(mask)
+        keep = stats[1:, cv2.CC_STAT_AREA] >= FIGURE_MIN_AREA
+        stats, centers = stats[1:][keep], centroids[1:][keep]
+        ids = self._associate(centers)
+        data = np.empty((len(stats), 7), dtype=np.float32)
+        data[:, 0] = stats[:, cv2.CC_STAT_LEFT]
+        data[:, 1] = stats[:, cv2.CC_STAT_TOP]
+        data[:, 2] = stats[:, cv2.CC_STAT_LEFT] + stats[:, cv2.CC_STAT_WIDTH]
+        data[:, 3] = stats[:, cv2.CC_STAT_TOP] + stats[:, cv2.CC_STAT_HEIGHT]
+        data[:, 4] = ids
+        data[:, 5] = STUB_CONFIDENCE
+        data[:, 6] = 0
+        return data
+
+    def _associate(self, centers):
+        """Жадно сопоставляет центры с треками предыдущего кадра по расстоянию."""
+        ids = np.zeros(len(centers), dtype=np.int64)
+        if len(centers) and len(self._centers):
+            distance = np.linalg.norm(centers[:, None, :] - self._centers[None, :, :], axis=2)
+            taken = np.zeros(len(self._centers), dtype=bool)
+            for row, col in zip(*np.unravel_index(np.argsort(distance, axis=None), distance.shape)):
+                if distance[row, col] > self.max_distance:
+                    break
+                if ids[row] or taken[col]:
+                    continue
+                ids[row] = self._ids[col]
+                taken[col] = True
+        new = ids == 0
+        ids[new] = np.arange(self._next_id, self._next_id + new.sum())
+        self._next_id += int(new.sum())
+        self._centers, self._ids = centers, ids
+        return ids
+
+    def report(self):
+        if self.frame_total and self.elapsed > 0:
+            print(f"Стаб-детектор: {self.frame_total} кадров за {self.elapsed:.1f} с "
+                  f"({self.frame_total / self.elapsed:.1f} кадр/с)")
+
+
+def create_detector(kind, batch_size=1, motion_threshold=0, weights="yolov8n.pt"):
+    """Создает детектор для замера: stub без модели или yolo (TrackingDetector), при необходимости с MotionGate."""
+    if kind == "stub":
+        detector = StubDetector()
+    else:
+        # ultralytics импортируется только при замере с моделью
+        from batch_inference import TrackingDetector
+        detector = TrackingDetector(batch_size, weights=weights)
+    return GatedDetector(detector, MotionGate(motion_threshold)) if motion_threshold else detector
+
+
+def peak_rss_mb():
+    """Пиковый объем резидентной памяти процесса в МБ."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def create_sampler(cap, interval_sec):
+    """Выборка кадров как в скриптах; interval_sec=None — каждый кадр."""
+    return FrameSampler(cap, interval_sec, frame_skip=DEFAULT_FRAME_SKIP if interval_sec else 1)
+
+
+def summarize(latencies, elapsed=None):
+    """Считает кадры в секунду и перцентили задержки (мс) по временам на кадр."""
+    latencies = np.asarray(latencies, dtype=np.float64)
+    if not len(latencies):
+        return {"frames": 0}
+    total = elapsed if elapsed is not None else latencies.sum()
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+    return {"frames": len(latencies), "seconds": round(total, 3), "fps": round(len(latencies) / total, 1),
+            "latency_ms": {"p50": round(p50, 3), "p90": round(p90, 3), "p99": round(p99, 3),
+                           "max": round(latencies.max() * 1000, 3)}}
+
+
+def bench_stages(video_path, detector, interval_sec, batch_size, roi_margin=None):
+    """Замеряет стадии по очереди в одном потоке: декодирование, resize, детектор, подсчет."""
+    cap = cv2.VideoCapture(video_path)
+    line_x = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) * LINE_X_RATIO)
+    roi = LineRoi.from_ratio(line_x, roi_margin)
+    preprocess = roi.crop if roi else resize_frame
+    sampler = create_sampler(cap, interval_sec)
+    timings = {"decode": [], "resize": [], "infer": [], "count": []}
+    # Храним только уменьшенные кадры, чтобы замер не упирался в память на длинных видео
+    resized = []
+    start = time.perf_counter()
+    for _, frame in sampler:
+        decoded = time.perf_counter()
+        resized.append(preprocess(frame))
+        timings["decode"].append(decoded - start)
+        start = time.perf_counter()
+        timings["resize"].append(start - decoded)
+    cap.release()
+
+    tracked = []
+    for offset in range(0, len(resized), batch_size):
+        batch = resized[offset:offset + batch_size]
+        start = time.perf_counter()
+        tracked.extend(roi.to_frame(data) if roi else data for data in detector(batch))
+        timings["infer"].extend([(time.perf_counter() - start) / len(batch)] * len(batch))
+
+    counter = LineCounter(line_x)
+    for data in tracked:
+        start = time.perf_counter()
+        counter.update(data)
+        timings["count"].append(time.perf_counter() - start)
+
+    result = {stage: summarize(values) for stage, values in timings.items()}
+    result["decode"]["frames_skipped"] = sampler.frames_skipped
+    result["counts"] = list(counter.counts())
+    return result
+
+
+def bench_pipeline(video_path, detector, interval_sec, batch_size, queue_depth, roi_margin=None,
+                   decode_process=False):
+    """Замеряет конвейер целиком; задержка — от выхода кадра из декодера до подсчета.
+
+    decode_process — декодирование в отдельном процессе через FrameRing;
+    тогда задержка считается от получения кадра из разделяемой памяти.
+    """
+    cap = cv2.VideoCapture(video_path)
+    line_x = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) * LINE_X_RATIO)
+    counter = LineCounter(line_x)
+    roi = LineRoi.from_ratio(line_x, roi_margin)
+    preprocess, infer = (roi.crop, roi.wrap(detector)) if roi else (resize_frame, detector)
+    shared = None
+    if decode_process:
+        cap.release()
+        shared = shared_frame_source(video_path, interval_sec, roi, queue_depth, batch_size,
+                                     frame_skip=DEFAULT_FRAME_SKIP if interval_sec else 1)
+        frames, preprocess, infer = shared, None, shared.wrap(infer)
+    else:
+        frames = create_sampler(cap, interval_sec)
+    decoded_at = {}
+
+    def timed_frames():
+        for index, frame in frames:
+            decoded_at[index] = time.perf_counter()
+            yield index, frame
+
+    engine = FrameEngine(timed_frames(), infer, preprocess=preprocess,
+                         batch_size=batch_size, queue_depth=queue_depth)
+    latencies = []
+    start = time.perf_counter()
+    for index, _, data in engine:
+        counter.update(data)
+        latencies.append(time.perf_counter() - decoded_at.pop(index))
+    elapsed = time.perf_counter() - start
+    cap.release()
+    if shared:
+        shared.close()
+    detector.report()
+    result = summarize(latencies, elapsed)
+    result["counts"] = list(counter.counts())
+    if roi:
+        result["roi"] = {"pixel_ratio": round(roi.pixel_ratio, 3), "model_input_ratio": round(roi.model_input_ratio(), 3)}
+    return result
+
+
+def compare_backends(video_path, backends, calibration, interval_sec, batch_size, queue_depth, roi_margin=None):
+    """Прогоняет конвейер с моделью на PyTorch и на каждом бэкенде и сравнивает скорость и подсчет."""
+    results = {}
+    for backend in ["pytorch"] + [backend for backend in backends if backend != "pytorch"]:
+        weights = export_model("yolov8n.pt", backend, calibration)
+        detector = create_detector("yolo", batch_size, weights=weights)
+        results[backend] = bench_pipeline(video_path, detector, interval_sec, batch_size, queue_depth, roi_margin)
+
+    baseline = results["pytorch"]
+    print(f"{'бэкенд':>10} {'кадр/с':>8} {'ускорение':>10}  подсчет (расхождение с pytorch)")
+    for backend, result in results.items():
+        if not result.get("frames") or not baseline.get("frames"):
+            continue
+        result["speedup"] = round(result["fps"] / baseline["fps"], 2)
+        result["count_drift"] = [count - base for count, base in zip(result["counts"], baseline["counts"])]
+        drift = ", ".join(f"{count} ({delta:+d}, {delta / base * 100:+.1f}%)" if base else f"{count} ({delta:+d})"
+                          for count, base, delta in zip(result["counts"], baseline["counts"],
+                                                        result["count_drift"]))
+        print(f"{backend:>10} {result['fps']:>8} {result['speedup']:>9}x  {drift}")
+    return results
+
+
+def count_segment(video_path, segment, kind, interval_sec, batch_size, queue_depth):
+    """Считает один сегмент в процессе пула, как pedestrian_counter_email2tg.count_video."""
+    cap = cv2.VideoCapture(video_path)
+    line_x = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) * LINE_X_RATIO)
+    sampler = FrameSampler(cap, interval_sec, frame_skip=DEFAULT_FRAME_SKIP if interval_sec else 1,
+                           start_frame=segment.start, end_frame=segment.end)
+    engine = FrameEngine(sampler, create_detector(kind, batch_size), preprocess=resize_frame,
+                         batch_size=batch_size, queue_depth=queue_depth)
+    result = count_frames(engine, LineCounter(line_x), segment)
+    cap.release()
+    return result
+
+
+def bench_segments(video_path, kind, parts, overlap_sec, interval_sec, batch_size, queue_depth):
+    """Считает видео сегментами в parts процессах и возвращает время и итоговый подсчет."""
+    cap = cv2.VideoCapture(video_path)
+    sampler = create_sampler(cap, interval_sec)
+    segments = plan_segments(sampler.frame_total, sampler.step, parts, round(overlap_sec * sampler.fps))
+    cap.release()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(len(segments), mp_context=multiprocessing.get_context("spawn")) as pool:
+        counts = list(pool.map(count_segment, *zip(*[(video_path, segment, kind, interval_sec, batch_size,
+                                                      queue_depth) for segment in segments])))
+    elapsed = time.perf_counter() - start
+    return {"segments": [list(segment) for segment in segments], "seconds": round(elapsed, 3),
+            "counts": list(merge_counts(counts)), "segment_counts": [list(c) for c in counts]}
+
+
+def count_with_metrics(video_path, kind, interval_sec):
+    """Считает видео целиком в процессе пула и возвращает подсчет и метрики процесса (metrics.drain())."""
+    result = count_segment(video_path, Segment(0, 0, None), kind, interval_sec, 1, DEFAULT_QUEUE_DEPTH)
+    return result, metrics.drain()
+
+
+def check_worker_metrics(video_path, kind, interval_sec):
+    """Проверяет, что метрики конвейера из процесса пула попадают на эндпоинт /metrics родителя.
+
+    Пул создается так же, как в pedestrian_counter_email2tg (create_worker_pool
+    с collect_metrics), метрики задания переносятся через metrics.merge().
+    Возвращает значение frames_decoded на эндпоинте; если оно не выросло,
+    бросает AssertionError.
+    """
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    metrics.start(port)
+    try:
+        with create_worker_pool(1, collect_metrics=True) as pool:
+            counts, worker_metrics = pool.submit(count_with_metrics, video_path, kind, interval_sec).result()
+        metrics.merge(worker_metrics)
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            body = response.read().decode("utf-8")
+    finally:
+        metrics.stop()
+    decoded = sum(int(line.split()[-1]) for line in body.splitlines()
+                  if line.startswith(f"{metrics.PREFIX}frames_decoded_total"))
+    if not decoded:
+        raise AssertionError("Метрики процесса пула не попали на /metrics (frames_decoded = 0)")
+    return decoded, counts
+
+
+def legacy_line_counts(frames, line_x):
+    """Исходный цикл подсчета по боксам (до LineCounter) — эталон для check_line_counter."""
+    all_tracked_ids = set()
+    tracked_objects = {}
+    passed_people_count = 0
+    for data in frames:
+        boxes = data.tolist()
+        tracks = data[:, 4].tolist()
+        if not boxes or not tracks:
+            continue
+        for box, track in zip(boxes, tracks):
+            x1, y1, x2, y2, id_ = list(map(int, box[:4])) + [int(track)]
+            center_x = (x1 + x2) // 2
+            cls = int(box[5])
+            confidence = float(box[4])
+            if cls == 0 and confidence > 0.7:
+                if id_ not in tracked_objects:
+                    tracked_objects[id_] = {"passed": False, "initial_x": center_x}
+                if not tracked_objects[id_]["passed"] and center_x > tracked_objects[id_]["initial_x"] \
+                        and center_x > line_x:
+                    all_tracked_ids.add(id_)
+                    tracked_objects[id_]["passed"] = True
+                    passed_people_count += 1
+    return len(all_tracked_ids), passed_people_count
+
+
+def random_boxes(rng, frame_count, max_boxes=20, max_id=60, width=640, height=480):
+    """Случайные кадры `boxes.data` режима трекинга (x1, y1, x2, y2, id, conf, cls).
+
+    Окно ID сдвигается со временем, так что треки появляются и исчезают;
+    ID повторяются между кадрами и внутри кадра, среди них есть ID 0, а
+    колонка conf иногда >= 1 — чтобы фильтр отбрасывал часть строк.
+    """
+    frames = []
+    for index in range(frame_count):
+        count = int(rng.integers(0, max_boxes + 1))
+        x1 = rng.uniform(0, width - 20, count)
+        y1 = rng.uniform(0, height - 40, count)
+        ids = (index // 10 + rng.integers(0, max_id, count)) * (rng.random(count) > 0.05)
+        conf = np.where(rng.random(count) < 0.1, rng.uniform(1, 2, count), rng.random(count))
+        frames.append(np.column_stack([x1, y1, x1 + rng.uniform(5, 60, count), y1 + rng.uniform(20, 80, count),
+                                       ids, conf, rng.integers(0, 3, count)]))
+    return frames
+
+
+def check_line_counter(frame_count=3000, seed=0, width=640):
+    """Сверяет LineCounter с исходным циклом на случайных кадрах; при расхождении бросает AssertionError."""
+    rng = np.random.default_rng(seed)
+    line_x = int(width * LINE_X_RATIO)
+    frames = random_boxes(rng, frame_count, width=width)
+    counter = LineCounter(line_x)
+    for data in frames:
+        counter.update(data)
+    expected = legacy_line_counts(frames, line_x)
+    if counter.counts() != expected:
+        raise AssertionError(f"LineCounter {counter.counts()} расходится с исходным циклом {expected}")
+    return expected
+
+
+def git_revision():
+    """Короткий хеш текущего коммита, чтобы различать результаты версий."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    """Печатает изменение кадров в секунду относительно сохраненного результата."""
+    print(f"Сравнение с {baseline.get('revision')}:")
+    for name, result in current["results"].items():
+        stages = result.items() if name == "stages" else [(name, result)]
+        for stage, values in stages:
+            before = baseline["results"].get(name, {})
+            before = before.get(stage, {}) if name == "stages" else before
+            if not isinstance(values, dict) or "fps" not in values or "fps" not in before:
+                continue
+            change = (values["fps"] - before["fps"]) / before["fps"] * 100
+            print(f"  {stage}: {before['fps']} -> {values['fps']} кадр/с ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер скорости конвейера подсчета пешеходов")
+    parser.add_argument("--video", help="готовое видео вместо синтетического")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--duration", type=float, default=30, help="длительность синтетического видео, с")
+    parser.add_argument("--density", type=float, default=5, help="среднее число пешеходов в кадре")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--detector", choices=("stub", "yolo"), default="stub")
+    parser.add_argument("--backend", choices=BACKENDS, default="pytorch", help="бэкенд модели для --detector yolo")
+    parser.add_argument("--compare-backends", nargs="+", choices=BACKENDS,
+                        help="сравнить бэкенды модели с PyTorch по скорости и подсчету")
+    parser.add_argument("--calibration-video", help="видео для калибровки onnx-int8 (по умолчанию замеряемое)")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--interval", type=float, default=0.4, help="шаг выборки кадров, с (0 — каждый кадр)")
+    parser.add_argument("--queue-depth", type=int, default=DEFAULT_QUEUE_DEPTH)
+    parser.add_argument("--decode-process", action="store_true",
+                        help="декодирование в отдельном процессе с кадрами в разделяемой памяти")
+    parser.add_argument("--motion-threshold", type=float, default=0,
+                        help="доля изменившихся пикселей, с которой кадр идет в детектор (0 — без MotionGate)")
+    parser.add_argument("--roi-margin", type=float, default=0,
+                        help="инференс только в полосе ±доля ширины кадра вокруг линии (0 — весь кадр)")
+    parser.add_argument("--segments", type=int, default=0,
+                        help="дополнительно посчитать видео сегментами в стольких процессах")
+    parser.add_argument("--segment-overlap", type=float, default=DEFAULT_OVERLAP_SEC,
+                        help="перекрытие сегментов, с")
+    parser.add_argument("--cache-dir", default=os.path.join(tempfile.gettempdir(), "pedestrian-bench"),
+                        help="куда сохранять синтетические видео для повторных запусков")
+    parser.add_argument("--output", help="файл JSON с результатами")
+    parser.add_argument("--compare", help="файл JSON прошлого замера для сравнения")
+    parser.add_argument("--check-counting", action="store_true",
+                        help="только сверить LineCounter с исходным циклом подсчета и выйти")
+    parser.add_argument("--check-metrics", action="store_true",
+                        help="только проверить, что метрики подсчета в пуле процессов видны на /metrics, и выйти")
+    args = parser.parse_args()
+
+    if args.check_counting or args.compare:
+        for seed in range(args.seed, args.seed + 5):
+            counts = check_line_counter(seed=seed)
+            print(f"Подсчет LineCounter совпадает с исходным циклом (seed {seed}): {counts}")
+        if args.check_counting:
+            return
+
+    if args.video:
+        video = {"path": args.video}
+    else:
+        os.makedirs(args.cache_dir, exist_ok=True)
+        name = f"{args.width}x{args.height}_{args.fps}fps_{args.duration:g}s_d{args.density:g}_s{args.seed}"
+        path = os.path.join(args.cache_dir, name + ".mp4")
+        meta_path = os.path.join(args.cache_dir, name + ".json")
+        if os.path.exists(path) and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                video = json.load(f)
+        else:
+            print(f"Генерация синтетического видео {path}...")
+            video = generate_video(path, args.width, args.height, args.fps, args.duration, args.density, args.seed)
+            with open(meta_path, "w") as f:
+                json.dump(video, f)
+
+    interval = args.interval or None
+    if args.check_metrics:
+        decoded, counts = check_worker_metrics(video["path"], args.detector, interval)
+        print(f"Метрики процесса пула видны на /metrics: frames_decoded {decoded}, подсчет {counts}")
+        return
+    calibration = args.calibration_video or video["path"]
+    results = {}
+    if args.compare_backends:
+        results["backends"] = compare_backends(video["path"], args.compare_backends, calibration, interval,
+                                               args.batch_size, args.queue_depth, args.roi_margin)
+    else:
+        weights = export_model("yolov8n.pt", args.backend, calibration) if args.detector == "yolo" else None
+        # Пиковая память — на весь процесс, поэтому конвейер замеряется первым
+        detector = create_detector(args.detector, args.batch_size, args.motion_threshold, weights)
+        results["pipeline"] = bench_pipeline(video["path"], detector, interval, args.batch_size,
+                                             args.queue_depth, args.roi_margin, args.decode_process)
+        results["pipeline"]["peak_rss_mb"] = peak_rss_mb()
+        if isinstance(detector, GatedDetector):
+            results["pipeline"]["inferences_skipped"] = detector.gate.skipped
+        results["stages"] = bench_stages(video["path"], create_detector(args.detector, args.batch_size,
+                                                                        args.motion_threshold, weights),
+                                         interval, args.batch_size, args.roi_margin)
+        results["stages"]["peak_rss_mb"] = peak_rss_mb()
+        if args.segments > 1:
+            results["segments"] = bench_segments(video["path"], args.detector, args.segments, args.segment_overlap,
+                                                 interval, args.batch_size, args.queue_depth)
+
+    report = {
+        "revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "video": video,
+        "params": {"detector": args.detector, "backend": args.backend, "batch_size": args.batch_size,
+                   "interval_sec": interval,
+                   "queue_depth": args.queue_depth, "decode_process": args.decode_process,
+                   "roi_margin": args.roi_margin,
+                   "motion_threshold": args.motion_threshold},
+        "results": results,
+    }
+    for stage in ("decode", "resize", "infer", "count"):
+        values = results.get("stages", {}).get(stage, {})
+        if values.get("frames"):
+            print(f"{stage:>8}: {values['fps']:>10} кадр/с, p50 {values['latency_ms']['p50']} мс, "
+                  f"p99 {values['latency_ms']['p99']} мс")
+    pipeline = results.get("pipeline", {})
+    if pipeline.get("frames"):
+        print(f"конвейер: {pipeline['fps']:>10} кадр/с, задержка p50 {pipeline['latency_ms']['p50']} мс, "
+              f"p99 {pipeline['latency_ms']['p99']} мс, пик памяти {pipeline['peak_rss_mb']} МБ")
+    if pipeline:
+        print(f"Подсчет: {pipeline.get('counts')}, ожидалось пересечений: {video.get('expected_crossings')}")
+    if pipeline.get("roi"):
+        # Стаб-детектор работает с полосой как есть, YOLO сначала масштабирует ее до imgsz
+        print(f"ROI: полоса — {pipeline['roi']['pixel_ratio']:.0%} пикселей кадра, "
+              f"вход YOLO — {pipeline['roi']['model_input_ratio']:.0%} от входа для целого кадра")
+    segmented = results.get("segments")
+    if segmented and pipeline.get("frames"):
+        drift = [count - base for count, base in zip(segmented["counts"], pipeline["counts"])]
+        print(f"Сегменты ({len(segmented['segments'])}): {segmented['seconds']} с против {pipeline['seconds']} с "
+              f"({pipeline['seconds'] / segmented['seconds']:.2f}x), подсчет {segmented['counts']}, "
+              f"расхождение {drift}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
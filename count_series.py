@@ -0,0 +1,155 @@
+import json
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+MINUTE_SEC = 60
+HOUR_SEC = 3600
+DEFAULT_MINUTE_BUCKETS = 24 * 60  # сутки по минутам
+DEFAULT_HOUR_BUCKETS = 30 * 24  # месяц по часам
+COLUMN_LABELS = {"unique": "уникальных пешеходов", "crossings": "пересечений"}
+ZONE_DIRECTIONS = {"in": "вход", "out": "выход"}
+
+
+class CountSeries:
+    """Временной ряд счетчиков в кольцевом буфере из buckets интервалов по bucket_sec секунд.
+
+    Интервал с номером n = время // bucket_sec хранится в слоте n % buckets
+    вместе со своим номером. Когда в слот приходит следующий по кругу
+    интервал, старые значения затираются, поэтому память фиксирована и не
+    зависит от времени работы.
+    """
+
+    def __init__(self, bucket_sec, buckets, columns):
+        self.bucket_sec = bucket_sec
+        self.numbers = np.full(buckets, -1, dtype=np.int64)
+        self.values = np.zeros((buckets, columns), dtype=np.int64)
+
+    def add(self, timestamp, delta):
+        """Прибавляет delta к интервалу, в который попадает timestamp."""
+        number = int(timestamp // self.bucket_sec)
+        slot = number % len(self.numbers)
+        if self.numbers[slot] != number:
+            self.numbers[slot] = number
+            self.values[slot] = 0
+        self.values[slot] += delta
+
+    def total(self, timestamp, buckets):
+        """Сумма за последние buckets интервалов, включая текущий."""
+        number = int(timestamp // self.bucket_sec)
+        mask = (self.numbers > number - buckets) & (self.numbers <= number)
+        return self.values[mask].sum(axis=0)
+
+    def buckets(self, since, until):
+        """Непустые интервалы, пересекающиеся с [since, until], по порядку: [(начало, значения)]."""
+        mask = (self.numbers >= int(since // self.bucket_sec)) & (self.numbers <= int(until // self.bucket_sec))
+        mask &= self.values.any(axis=1)
+        order = np.argsort(self.numbers[mask])
+        return [(int(number) * self.bucket_sec, values)
+                for number, values in zip(self.numbers[mask][order], self.values[mask][order])]
+
+
+class TrafficAggregator:
+    """Инкрементальные счетчики непрерывного потока по минутам и по часам.
+
+    record() вызывается из потока подсчета с текущими накопительными
+    значениями (LineCounter.counts() и счетчики зон) и раскладывает по
+    рядам только прирост с прошлого вызова. flush() под коротким замком
+    собирает сводку с прошлого flush() и за последние час и сутки: подсчет
+    не останавливается, а поток не перечитывается. Оба ряда — CountSeries
+    фиксированного размера, так что недели работы не увеличивают память.
+    """
+
+    def __init__(self, columns, minute_buckets=DEFAULT_MINUTE_BUCKETS, hour_buckets=DEFAULT_HOUR_BUCKETS,
+                 started=None):
+        self.columns = list(columns)
+        self.minutes = CountSeries(MINUTE_SEC, minute_buckets, len(self.columns))
+        self.hours = CountSeries(HOUR_SEC, hour_buckets, len(self.columns))
+        self._totals = np.zeros(len(self.columns), dtype=np.int64)
+        self._flushed = self._totals.copy()
+        self._flushed_at = time.time() if started is None else started
+        self._lock = threading.Lock()
+
+    def record(self, totals, timestamp=None):
+        """Учитывает новые накопительные значения счетчиков (в порядке columns)."""
+        totals = np.array(totals, dtype=np.int64)
+        delta = totals - self._totals
+        if not delta.any():
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            self.minutes.add(timestamp, delta)
+            self.hours.add(timestamp, delta)
+            self._totals = totals
+
+    def _named(self, values):
+        return {column: int(value) for column, value in zip(self.columns, values)}
+
+    def flush(self, timestamp=None):
+        """Возвращает сводку с прошлого flush() и начинает новый период.
+
+        В сводке: period — прирост за период, minutes — по минутам,
+        затронутым периодом, last_hour и last_day — за последние 60 минут
+        и 24 часа, total — с начала работы.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            summary = {
+                "since": datetime.fromtimestamp(self._flushed_at).isoformat(timespec="seconds"),
+                "time": datetime.fromtimestamp(timestamp).isoformat(timespec="seconds"),
+                "period": self._named(self._totals - self._flushed),
+                "minutes": [dict(self._named(values),
+                                 start=datetime.fromtimestamp(start).isoformat(timespec="minutes"))
+                            for start, values in self.minutes.buckets(self._flushed_at, timestamp)],
+                "last_hour": self._named(self.minutes.total(timestamp, HOUR_SEC // MINUTE_SEC)),
+                "last_day": self._named(self.hours.total(timestamp, 24)),
+                "total": self._named(self._totals),
+            }
+            self._flushed = self._totals.copy()
+            self._flushed_at = timestamp
+        return summary
+
+
+def traffic_columns(zone_counter=None):
+    """Имена столбцов агрегатора: счетчики линии и вход/выход каждой зоны."""
+    columns = ["unique", "crossings"]
+    if zone_counter is not None:
+        for name in zone_counter.counts():
+            columns.extend((f"{name}/in", f"{name}/out"))
+    return columns
+
+
+def traffic_totals(counter, zone_counter=None):
+    """Накопительные значения в порядке traffic_columns."""
+    totals = list(counter.counts())
+    if zone_counter is not None:
+        for value in zone_counter.counts().values():
+            totals.extend((value["in"], value["out"]))
+    return totals
+
+
+def _label(column):
+    zone, _, direction = column.rpartition("/")
+    if zone and direction in ZONE_DIRECTIONS:
+        return f"{zone} {ZONE_DIRECTIONS[direction]}"
+    return COLUMN_LABELS.get(column, column)
+
+
+def _format_values(values):
+    return ", ".join(f"{_label(column)} {value}" for column, value in values.items())
+
+
+def format_summary(summary):
+    """Короткий текст сводки для Telegram (без разбивки по минутам)."""
+    return (f"Сводка с {summary['since']} по {summary['time']}: {_format_values(summary['period'])}\n"
+            f"За последний час: {_format_values(summary['last_hour'])}\n"
+            f"За сутки: {_format_values(summary['last_day'])}\n"
+            f"Всего: {_format_values(summary['total'])}")
+
+
+def append_summary(path, summary):
+    """Дописывает сводку строкой JSON в файл (формат JSON Lines)."""
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(summary, ensure_ascii=False) + "\n")
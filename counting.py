@@ -0,0 +1,80 @@
+import numpy as np
+
+from track_store import TrackStore
+
+PERSON_CLASS = 0
+# В режиме трекинга `boxes.data` — (x1, y1, x2, y2, id, conf, cls), поэтому фильтр исходного цикла,
+# читающий box[4] как уверенность, на деле сравнивает с порогом ID трека (отсекается только ID 0),
+# а box[5] как класс — это int(conf), почти всегда 0. Так сохранено ради совпадения подсчета со старым
+MIN_CONFIDENCE = 0.7
+
+
+class LineCounter:
+    """Векторизованный подсчет пешеходов, пересекших вертикальную линию слева направо.
+
+    Повторяет логику исходного цикла по боксам (`tracked_objects`,
+    `all_tracked_ids`, `passed_people_count`), но обрабатывает весь кадр
+    операциями над массивами. Состояние треков хранится в TrackStore;
+    итоги ведутся накопительными счетчиками и не зависят от вытеснения
+    старых треков, поэтому для бесконечных потоков можно задать ttl_frames.
+    """
+
+    def __init__(self, line_x, cls_id=PERSON_CLASS, min_confidence=MIN_CONFIDENCE, ttl_frames=None, max_tracks=None):
+        self.line_x = line_x
+        self.cls_id = cls_id
+        self.min_confidence = min_confidence
+        self.tracks = TrackStore(ttl_frames=ttl_frames, max_tracks=max_tracks)
+        self.frame_index = 0
+        self.unique_count = 0
+        self.passed_people_count = 0
+
+    def update(self, data):
+        """Обрабатывает боксы одного кадра и возвращает число новых пересечений.
+
+        data — массив N x 7 в формате `boxes.data` режима трекинга
+        (x1, y1, x2, y2, id, conf, cls). Колонки фильтра берутся по тем же
+        индексам, что и в исходном цикле (`box[5]` как класс, `box[4]` как
+        уверенность, хотя на деле это conf и ID трека), чтобы подсчет
+        совпадал с прежним бит в бит; проверка — `benchmark.py --check-counting`.
+        """
+        self.frame_index += 1
+        newly_passed = 0
+        data = np.asarray(data, dtype=np.float64)
+        if data.size:
+            # Колонка 4 — ID трека, а не уверенность (см. MIN_CONFIDENCE)
+            mask = (data[:, 5].astype(np.int64) == self.cls_id) & (data[:, 4] > self.min_confidence)
+            if mask.any():
+                newly_passed = self._update_tracks(data[mask])
+        self.tracks.evict(self.frame_index)
+        return newly_passed
+
+    def _update_tracks(self, data):
+        ids = data[:, 4].astype(np.int64)
+        x = data[:, [0, 2]].astype(np.int64)
+        center_x = (x[:, 0] + x[:, 1]) // 2
+
+        # Начальная координата фиксируется по первому появлению трека
+        unique_ids, first, inverse = np.unique(ids, return_index=True, return_inverse=True)
+        slots = self.tracks.lookup(unique_ids)
+        new = slots < 0
+        if new.any():
+            self.tracks.insert(unique_ids[new], center_x[first[new]], self.frame_index)
+            slots = self.tracks.lookup(unique_ids)
+
+        tracks = self.tracks
+        occurrence = slots[inverse]
+        crossed = (~tracks.passed[occurrence]) & (center_x > tracks.initial_x[occurrence]) & (center_x > self.line_x)
+        newly_passed = slots[np.unique(inverse[crossed])]
+        tracks.passed[newly_passed] = True
+        tracks.last_seen[slots] = self.frame_index
+        self.unique_count += len(newly_passed)
+        self.passed_people_count += len(newly_passed)
+        return len(newly_passed)
+
+    def counts(self):
+        """Возвращает (уникальные пешеходы, общее количество пересечений)."""
+        return self.unique_count, self.passed_people_count
+
+    def stats(self):
+        """Возвращает показатели хранилища треков (живые треки и память)."""
+        return self.tracks.stats()
@@ -0,0 +1,166 @@
+import queue
+import threading
+import time
+
+import cv2
+
+import metrics
+
+FRAME_SIZE = (640, 480)
+DEFAULT_QUEUE_DEPTH = 8
+_DONE = object()
+_POLL_TIMEOUT = 0.1
+
+
+def resize_frame(frame, size=FRAME_SIZE, dst=None):
+    """Приводит кадр к размеру, на котором работает детектор.
+
+    dst — готовый массив (height, width, 3), в который пишется результат
+    вместо выделения нового, например слот FrameRing.
+    """
+    return cv2.resize(frame, size, dst=dst)
+
+
+class FrameEngine:
+    """Конвейер обработки кадров: декодирование, инференс и подсчет в разных потоках.
+
+    Поток декодера читает кадры из `frames` (пары номер/кадр, например
+    FrameSampler), применяет `preprocess` и кладет их в ограниченную очередь.
+    Поток инференса забирает до `batch_size` кадров и вызывает `infer(frames)`,
+    который возвращает по результату на кадр. Подсчет выполняет вызывающий
+    код, итерируясь по движку и получая (номер, кадр, результат) по порядку.
+
+    Обе очереди ограничены `queue_depth`, поэтому при медленном инференсе
+    декодер ждет (backpressure) и память не растет на многочасовых файлах.
+
+    stage_seconds накапливает время стадий (decode, preprocess, infer, count)
+    для сводки по заданию; при включенных метриках те же замеры, глубины
+    очередей и скорость попадают в реестр metrics.
+    """
+
+    def __init__(self, frames, infer, preprocess=None, batch_size=1, queue_depth=DEFAULT_QUEUE_DEPTH):
+        self.frames = frames
+        self.infer = infer
+        self.preprocess = preprocess
+        self.batch_size = max(1, int(batch_size))
+        self.queue_depth = max(1, int(queue_depth))
+        self.frame_total = 0
+        self.elapsed = 0.0
+        self._decoded = queue.Queue(maxsize=self.queue_depth)
+        self._inferred = queue.Queue(maxsize=self.queue_depth)
+        self._stop = threading.Event()
+        self._error = None
+        self._threads = []
+        self.stage_seconds = {"decode": 0.0, "preprocess": 0.0, "infer": 0.0, "count": 0.0}
+
+    def _put(self, q, item):
+        """Кладет элемент в очередь, ожидая места, пока движок не остановлен."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        """Берет элемент из очереди, ожидая его, пока движок не остановлен."""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=_POLL_TIMEOUT)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _decode_loop(self):
+        stages = self.stage_seconds
+        try:
+            start = time.perf_counter()
+            for index, frame in self.frames:
+                decoded = time.perf_counter()
+                stages["decode"] += decoded - start
+                metrics.observe("decode", decoded - start)
+                metrics.inc("frames_decoded")
+                if self.preprocess is not None:
+                    frame = self.preprocess(frame)
+                    elapsed = time.perf_counter() - decoded
+                    stages["preprocess"] += elapsed
+                    metrics.observe("preprocess", elapsed)
+                if not self._put(self._decoded, (index, frame)):
+                    return
+                if metrics.METRICS.enabled:
+                    metrics.gauge("queue_depth", self._decoded.qsize(), queue="decoded")
+                start = time.perf_counter()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._put(self._decoded, _DONE)
+
+    def _infer_loop(self):
+        try:
+            finished = False
+            while not finished:
+                item = self._get(self._decoded)
+                if item is _DONE:
+                    break
+                batch = [item]
+                while len(batch) < self.batch_size:
+                    item = self._get(self._decoded)
+                    if item is _DONE:
+                        finished = True
+                        break
+                    batch.append(item)
+                start = time.perf_counter()
+                results = self.infer([frame for _, frame in batch])
+                elapsed = time.perf_counter() - start
+                self.stage_seconds["infer"] += elapsed
+                metrics.observe("infer", elapsed)
+                metrics.inc("frames_inferred", len(batch))
+                for (index, frame), result in zip(batch, results):
+                    if not self._put(self._inferred, (index, frame, result)):
+                        return
+                if metrics.METRICS.enabled:
+                    metrics.gauge("queue_depth", self._inferred.qsize(), queue="inferred")
+        except Exception as e:
+            self._error = e
+        finally:
+            self._put(self._inferred, _DONE)
+
+    def stop(self):
+        """Останавливает потоки конвейера и дожидается их завершения."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def __iter__(self):
+        """Запускает конвейер и выдает (номер кадра, кадр, результат) по порядку."""
+        start = time.perf_counter()
+        self._threads = [
+            threading.Thread(target=self._decode_loop, name="frame-decoder", daemon=True),
+            threading.Thread(target=self._infer_loop, name="frame-infer", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        try:
+            while True:
+                item = self._get(self._inferred)
+                if item is _DONE:
+                    break
+                self.frame_total += 1
+                handed = time.perf_counter()
+                yield item
+                # Время, пока вызывающий код обрабатывает результат кадра (подсчет, отрисовка)
+                elapsed = time.perf_counter() - handed
+                self.stage_seconds["count"] += elapsed
+                metrics.observe("count", elapsed)
+                if metrics.METRICS.enabled:
+                    metrics.gauge("pipeline_fps", round(self.frame_total / (time.perf_counter() - start), 2))
+        finally:
+            self.stop()
+            self.elapsed = time.perf_counter() - start
+        if self._error is not None:
+            raise self._error
+        if self.frame_total and self.elapsed > 0:
+            print(f"Обработано кадров: {self.frame_total} за {self.elapsed:.1f} с "
+                  f"({self.frame_total / self.elapsed:.1f} кадр/с, очередь={self.queue_depth})")
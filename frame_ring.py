@@ -0,0 +1,222 @@
+import multiprocessing
+import queue
+from collections import deque
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from frame_engine import DEFAULT_QUEUE_DEPTH, FRAME_SIZE, resize_frame
+from frame_sampler import DEFAULT_FRAME_SKIP, FrameSampler
+
+DEFAULT_SLOTS = 16
+READY_BATCH = 4  # столько готовых кадров декодер передает одним сообщением
+# Меньшие кадры декодируются и уменьшаются в потоке быстрее, чем окупается отдельный процесс
+DEFAULT_MIN_PIXELS = 1280 * 720
+_END = -1  # в очереди free — сигнал декодеру остановиться, в ready — конец видео
+_POLL_TIMEOUT = 0.5
+
+
+class FrameRing:
+    """Кольцо слотов под кадры в разделяемой памяти.
+
+    Все слоты — один заранее выделенный блок SharedMemory формы
+    (slots, высота, ширина, 3). Между процессами передаются только номера
+    слотов: очередь free — списки свободных слотов, очередь ready —
+    списки пар (номер кадра, слот) с готовыми кадрами. Владелец слота
+    один: декодер берет номера из free, пишет кадр прямо в view(slot) и
+    отдает номера в ready; потребитель читает view(slot) без копирования и
+    возвращает номера через release(). Кадры не сериализуются, а номера
+    передаются пачками, чтобы на кадр не приходилось по два обращения к
+    очередям между процессами.
+
+    Передается в дочерний процесс как аргумент Process: при распаковке
+    подключается к тому же блоку памяти по имени. Имя блока удаляет
+    создавший его процесс (unlink() или close()); после close() все view
+    слотов недействительны.
+    """
+
+    def __init__(self, frame_shape, slots=DEFAULT_SLOTS, context=None):
+        context = context or multiprocessing.get_context("spawn")
+        self.frame_shape = tuple(frame_shape)
+        self.slots = slots
+        self._shm = shared_memory.SharedMemory(create=True, size=slots * int(np.prod(self.frame_shape)))
+        self._owner = True
+        self._unlinked = False
+        self.free = context.Queue()
+        self.ready = context.Queue()
+        self.free.put(list(range(slots)))
+        self._frames = np.ndarray((slots,) + self.frame_shape, dtype=np.uint8, buffer=self._shm.buf)
+
+    def __getstate__(self):
+        return {"name": self._shm.name, "frame_shape": self.frame_shape, "slots": self.slots,
+                "free": self.free, "ready": self.ready}
+
+    def __setstate__(self, state):
+        self.frame_shape = state["frame_shape"]
+        self.slots = state["slots"]
+        self.free = state["free"]
+        self.ready = state["ready"]
+        self._shm = shared_memory.SharedMemory(name=state["name"])
+        self._owner = False
+        self._unlinked = False
+        self._frames = np.ndarray((self.slots,) + self.frame_shape, dtype=np.uint8, buffer=self._shm.buf)
+
+    def view(self, slot):
+        """Кадр слота как массив NumPy поверх разделяемой памяти (без копии)."""
+        return self._frames[slot]
+
+    def release(self, slots):
+        """Возвращает слоты декодеру одним сообщением."""
+        self.free.put(list(slots))
+
+    def unlink(self):
+        """Удаляет имя блока; память остается отображенной до close()."""
+        if self._owner and not self._unlinked:
+            self._shm.unlink()
+            self._unlinked = True
+
+    def close(self):
+        """Снимает отображение памяти (view слотов больше нельзя читать) и удаляет блок."""
+        self._frames = None
+        self._shm.close()
+        self.unlink()
+
+
+def decode_into_ring(ring, video_path, interval_sec, preprocess=resize_frame, frame_skip=DEFAULT_FRAME_SKIP):
+    """Процесс-декодер: читает выбранные кадры и пишет их preprocess-ом прямо в слоты кольца.
+
+    preprocess вызывается с dst=слот (resize_frame или LineRoi.crop), поэтому
+    на кадр не выделяется новый массив. Готовые кадры уходят в ready по
+    READY_BATCH, а раньше — когда свободные слоты кончились и потребитель
+    иначе ждал бы кадры, уже лежащие в кольце. В конце в ready кладется
+    (_END, (декодировано, пропущено)).
+    """
+    cap = cv2.VideoCapture(video_path)
+    sampler = FrameSampler(cap, interval_sec, frame_skip)
+    free = deque()
+    ready = []
+    try:
+        for index, frame in sampler:
+            if not free:
+                if ready:
+                    ring.ready.put(ready)
+                    ready = []
+                slots = ring.free.get()
+                if slots == _END:
+                    break
+                free.extend(slots)
+            slot = free.popleft()
+            preprocess(frame, dst=ring.view(slot))
+            ready.append((index, slot))
+            if len(ready) >= READY_BATCH:
+                ring.ready.put(ready)
+                ready = []
+    finally:
+        cap.release()
+        ring.ready.put(ready + [(_END, (sampler.frames_decoded, sampler.frames_skipped))])
+        ring.close()
+
+
+class SharedFrameSource:
+    """Источник кадров для FrameEngine с декодированием в отдельном процессе.
+
+    Декодирование и resize идут в дочернем процессе и не делят GIL с
+    инференсом и трекером. Кадры приходят через FrameRing: итерация выдает
+    (номер кадра, кадр-view слота) как FrameSampler, но уже после
+    preprocess, поэтому FrameEngine создается без preprocess. Детектор
+    оборачивается через wrap(): после инференса слоты пачки возвращаются
+    декодеру. Кадр в выдаче FrameEngine после этого может быть перезаписан,
+    так что в этом режиме используются только боксы.
+
+    Выигрыш есть только на больших кадрах (см. wants_decode_process): на
+    каждое видео запускается процесс, а номера слотов ходят через очереди.
+
+    Кадры последней пачки могут еще ждать инференса, когда декодер уже
+    закончил, поэтому память кольца освобождает close() — после того как
+    цикл по FrameEngine завершен.
+    """
+
+    def __init__(self, video_path, interval_sec=None, preprocess=resize_frame, frame_shape=None,
+                 slots=DEFAULT_SLOTS, frame_skip=DEFAULT_FRAME_SKIP):
+        self.video_path = video_path
+        self.interval_sec = interval_sec
+        self.frame_skip = frame_skip
+        self.preprocess = preprocess
+        self.frame_shape = frame_shape or (FRAME_SIZE[1], FRAME_SIZE[0], 3)
+        self.slots = slots
+        self.frames_decoded = 0
+        self.frames_skipped = 0
+        self._ring = None
+        self._held = deque()  # слоты, отданные в конвейер, в порядке выдачи
+
+    def __iter__(self):
+        context = multiprocessing.get_context("spawn")
+        self._ring = ring = FrameRing(self.frame_shape, self.slots, context)
+        process = context.Process(target=decode_into_ring, name="frame-decoder",
+                                  args=(ring, self.video_path, self.interval_sec, self.preprocess, self.frame_skip),
+                                  daemon=True)
+        process.start()
+        try:
+            while True:
+                try:
+                    items = ring.ready.get(timeout=_POLL_TIMEOUT)
+                except queue.Empty:
+                    if not process.is_alive():
+                        raise RuntimeError(f"Процесс декодирования {self.video_path} завершился с ошибкой")
+                    continue
+                for index, slot in items:
+                    if index == _END:
+                        self.frames_decoded, self.frames_skipped = slot
+                        return
+                    self._held.append(slot)
+                    yield index, ring.view(slot)
+        finally:
+            # Декодер может ждать свободный слот: будим его сигналом остановки
+            ring.free.put(_END)
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            # Память не отключаем: кадры последней пачки еще могут быть в конвейере
+            ring.unlink()
+
+    def close(self):
+        """Освобождает разделяемую память кольца; вызывается после завершения FrameEngine."""
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+    def wrap(self, infer):
+        """Оборачивает детектор FrameEngine так, чтобы после инференса слоты пачки освобождались."""
+        def infer_shared(frames):
+            try:
+                return infer(frames)
+            finally:
+                slots = [self._held.popleft() for _ in frames]
+                if self._ring is not None and slots:
+                    self._ring.release(slots)
+        return infer_shared
+
+
+def wants_decode_process(cap, min_pixels=DEFAULT_MIN_PIXELS):
+    """Окупается ли отдельный процесс декодирования для видео cap: кадр не меньше min_pixels.
+
+    Процесс запускается на каждое видео (spawn заново импортирует главный
+    модуль), а кадры небольших видео поток декодирует и уменьшает быстрее,
+    чем они проходят через очереди между процессами.
+    """
+    return cap.get(cv2.CAP_PROP_FRAME_WIDTH) * cap.get(cv2.CAP_PROP_FRAME_HEIGHT) >= min_pixels
+
+
+def shared_frame_source(video_path, interval_sec, roi=None, queue_depth=DEFAULT_QUEUE_DEPTH, batch_size=1,
+                        frame_skip=DEFAULT_FRAME_SKIP):
+    """Создает SharedFrameSource для полного кадра или полосы ROI.
+
+    Слотов хватает на очередь FrameEngine и две пачки: пока одна пачка
+    в инференсе, декодер заполняет следующую.
+    """
+    slots = max(DEFAULT_SLOTS, queue_depth + 2 * batch_size)
+    if roi is None:
+        return SharedFrameSource(video_path, interval_sec, slots=slots, frame_skip=frame_skip)
+    return SharedFrameSource(video_path, interval_sec, roi.crop, roi.shape, slots, frame_skip)
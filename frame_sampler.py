@@ -0,0 +1,82 @@
+import math
+
+import cv2
+
+import metrics
+
+DEFAULT_FRAME_SKIP = 10
+# Начиная с такого шага перемотка по времени дешевле, чем grab() каждого кадра:
+# seek декодирует только от ближайшего ключевого кадра
+SEEK_MIN_STEP = 60
+
+
+class FrameSampler:
+    """Выбирает кадры из видео с заданным шагом по времени, не декодируя лишние.
+
+    Шаг задается в секундах и переводится в кадры по FPS файла, поэтому ролики
+    с 25 и 60 кадр/с дают одинаковую плотность выборки. Пропускаемые кадры
+    проходятся через `cap.grab()` без `retrieve()` (без конвертации в BGR),
+    а при большом шаге и перематываемом контейнере — через seek по времени.
+    Если FPS неизвестен (часто у потоков), используется фиксированный frame_skip.
+    start_frame и end_frame ограничивают выборку отрезком [start_frame, end_frame)
+    для подсчета видео по сегментам; start_frame должен быть кратен шагу,
+    чтобы выбранные кадры совпадали с кадрами полного прохода.
+    stop — threading.Event, при котором выборка заканчивается перед
+    следующим чтением кадра.
+    """
+
+    def __init__(self, cap, interval_sec=None, frame_skip=DEFAULT_FRAME_SKIP, seek_min_step=SEEK_MIN_STEP,
+                 start_frame=0, end_frame=None, stop=None):
+        self.cap = cap
+        self.stop = stop
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and not math.isnan(fps) and 0 < fps < 1000 else None
+        if interval_sec and self.fps:
+            self.step = max(1, round(self.fps * interval_sec))
+        else:
+            self.step = max(1, int(frame_skip))
+        self.frame_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        self.use_seek = self.step >= seek_min_step and self._can_seek()
+        self.frames_decoded = 0
+        self.frames_skipped = 0
+
+    def _can_seek(self):
+        """Проверяет, поддерживает ли контейнер перемотку по времени."""
+        if not self.fps or self.frame_total <= 0:
+            return False
+        return bool(self.cap.set(cv2.CAP_PROP_POS_MSEC, 0))
+
+    def __iter__(self):
+        """Выдает пары (номер кадра, кадр) для выбранных кадров."""
+        index = self.start_frame
+        if index and not self.cap.set(cv2.CAP_PROP_POS_FRAMES, index):
+            return
+        while True:
+            if self.end_frame is not None and index >= self.end_frame:
+                return
+            if self.stop is not None and self.stop.is_set():
+                return
+            if not self.cap.grab():
+                return
+            ret, frame = self.cap.retrieve()
+            if not ret:
+                return
+            self.frames_decoded += 1
+            yield index, frame
+
+            index += self.step
+            if self.use_seek:
+                if index >= self.frame_total:
+                    return
+                if not self.cap.set(cv2.CAP_PROP_POS_MSEC, index * 1000.0 / self.fps):
+                    return
+                self.frames_skipped += self.step - 1
+                metrics.inc("frames_skipped", self.step - 1)
+            else:
+                for _ in range(self.step - 1):
+                    if self.stop is not None and self.stop.is_set() or not self.cap.grab():
+                        return
+                    self.frames_skipped += 1
+                    metrics.inc("frames_skipped")
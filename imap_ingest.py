@@ -0,0 +1,459 @@
+import binascii
+import email
+import hashlib
+import imaplib
+import json
+import os
+import re
+import select
+import socket
+import ssl
+import threading
+import time
+from email.header import decode_header, make_header
+from email.utils import decode_rfc2231
+from urllib.parse import unquote
+
+import metrics
+
+DEFAULT_IDLE_TIMEOUT = 300  # RFC 2177 советует перезапускать IDLE не реже чем раз в 29 минут
+_LITERAL_RE = re.compile(rb"\{(\d+)\}$")
+_BASE64_JUNK_RE = re.compile(rb"[^A-Za-z0-9+/=]")
+FETCH_CHUNK_SIZE = 1024 * 1024  # размер порции частичного FETCH вложения
+_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+
+
+def sanitize_filename(filename):
+    """Очищает имя файла от недопустимых символов."""
+    return re.sub(r'[^\w\.\-]', '_', filename)
+
+
+def _tokenize(response):
+    """Разбивает ответ FETCH (строки и литералы imaplib) на токены."""
+    tokens = []
+    for item in response:
+        if isinstance(item, tuple):
+            text, literal = item
+        else:
+            text, literal = item, None
+        text = _LITERAL_RE.sub(b"", text) if literal is not None else text
+        position = 0
+        while position < len(text):
+            match = _TOKEN_RE.match(text, position)
+            if not match:
+                break
+            position = match.end()
+            if match.group(1):
+                tokens.append("(")
+            elif match.group(2):
+                tokens.append(")")
+            elif match.group(3) is not None:
+                tokens.append(("str", re.sub(rb"\\(.)", rb"\1", match.group(3)).decode("utf-8", "replace")))
+            elif match.group(4):
+                atom = match.group(4).decode("utf-8", "replace")
+                tokens.append(None if atom.upper() == "NIL" else atom)
+        if literal is not None:
+            tokens.append(("str", literal.decode("utf-8", "replace")))
+    return tokens
+
+
+def _parse(tokens):
+    """Собирает токены в вложенные списки (S-выражение IMAP)."""
+    stack = [[]]
+    for token in tokens:
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            if len(stack) > 1:
+                done = stack.pop()
+                stack[-1].append(done)
+        else:
+            stack[-1].append(token[1] if isinstance(token, tuple) else token)
+    return stack[0]
+
+
+def _fetch_items(response):
+    """Возвращает словарь элементов FETCH ({'UID': ..., 'BODYSTRUCTURE': [...]})."""
+    parsed = _parse(_tokenize(response))
+    items = {}
+    for element in parsed:
+        if isinstance(element, list):
+            for key, value in zip(element[::2], element[1::2]):
+                if isinstance(key, str):
+                    items[key.upper()] = value
+    return items
+
+
+def _params(value):
+    """Превращает список параметров IMAP ["NAME", "value", ...] в словарь."""
+    if not isinstance(value, list):
+        return {}
+    return {str(k).lower(): v for k, v in zip(value[::2], value[1::2]) if isinstance(k, str)}
+
+
+def _decode_filename(params):
+    """Достает имя файла из параметров (с поддержкой RFC 2231 и RFC 2047)."""
+    for key in ("filename", "name"):
+        if params.get(key):
+            value = params[key]
+            break
+        if params.get(key + "*"):
+            charset, _, encoded = decode_rfc2231(params[key + "*"])
+            value = unquote(encoded, encoding=charset or "utf-8", errors="replace")
+            break
+    else:
+        return None
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+
+def iter_body_parts(structure, prefix=""):
+    """Обходит BODYSTRUCTURE и выдает листовые части с номерами секций.
+
+    Для каждой части выдает словарь с ключами section, type, subtype,
+    encoding, size, filename и disposition.
+    """
+    if structure and isinstance(structure[0], list):
+        index = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            index += 1
+            yield from iter_body_parts(child, f"{prefix}.{index}" if prefix else str(index))
+        return
+
+    main_type = (structure[0] or "").lower() if structure else ""
+    sub_type = (structure[1] or "").lower() if len(structure) > 1 else ""
+    params = _params(structure[2]) if len(structure) > 2 else {}
+    encoding = (structure[5] or "7bit").lower() if len(structure) > 5 else "7bit"
+    size = int(structure[6]) if len(structure) > 6 and str(structure[6]).isdigit() else 0
+    # Положение расширенных полей зависит от типа части
+    extension = 7
+    if main_type == "text":
+        extension = 8
+    elif main_type == "message" and sub_type == "rfc822":
+        extension = 10
+    disposition = None
+    disposition_params = {}
+    if len(structure) > extension + 1 and isinstance(structure[extension + 1], list):
+        disposition = (structure[extension + 1][0] or "").lower()
+        disposition_params = _params(structure[extension + 1][1]) if len(structure[extension + 1]) > 1 else {}
+    yield {
+        "section": prefix or "1",
+        "type": main_type,
+        "subtype": sub_type,
+        "encoding": encoding,
+        "size": size,
+        "disposition": disposition,
+        "filename": _decode_filename(disposition_params) or _decode_filename(params),
+    }
+
+
+class StreamDecoder:
+    """Потоковый декодер Content-Transfer-Encoding для данных, приходящих частями.
+
+    Хранит только хвост незавершенного блока: неполную четверку символов
+    base64 или незаконченную строку quoted-printable.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self._pending = b""
+
+    def feed(self, data):
+        """Декодирует очередную порцию и возвращает готовые байты."""
+        if self.encoding == "base64":
+            data = self._pending + _BASE64_JUNK_RE.sub(b"", data)
+            cut = len(data) // 4 * 4
+            self._pending = data[cut:]
+            return binascii.a2b_base64(data[:cut]) if cut else b""
+        if self.encoding == "quoted-printable":
+            data = self._pending + data
+            cut = data.rfind(b"\n") + 1
+            self._pending = data[cut:]
+            return binascii.a2b_qp(data[:cut]) if cut else b""
+        return data
+
+    def flush(self):
+        """Декодирует остаток после последней порции."""
+        pending, self._pending = self._pending, b""
+        if not pending:
+            return b""
+        if self.encoding == "base64":
+            return binascii.a2b_base64(pending + b"=" * (-len(pending) % 4))
+        if self.encoding == "quoted-printable":
+            return binascii.a2b_qp(pending)
+        return pending
+
+
+def _has_buffered_data(mail):
+    """Проверяет, не лежит ли ответ сервера уже в буфере mail.file (не блокируясь).
+
+    imaplib читает через буферизованный mail.file, поэтому `* n EXISTS`,
+    пришедший одним пакетом с `+ idling`, может уже быть в буфере, а не в
+    сокете, и select() его не увидит. peek() на время проверки идет по
+    неблокирующему сокету: он отдает буфер (и расшифрованные данные SSL),
+    а при пустом сокете сразу возвращается.
+    """
+    sock = mail.sock
+    timeout = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        return bool(mail.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        sock.settimeout(timeout)
+
+
+class MailboxWatcher:
+    """Постоянная IMAP-сессия, забирающая только новые письма с видео.
+
+    Держит одно авторизованное соединение и запоминает последний
+    обработанный UID (вместе с UIDVALIDITY) в файле состояния, поэтому после
+    перезапуска уже просмотренные письма не скачиваются повторно. UID
+    сохраняется только вызовом commit(), когда скачанные видео уже приняты
+    (поставлены в очередь заданий): если процесс упадет раньше, письма
+    будут скачаны заново. Для новых
+    писем сначала запрашиваются только тема и BODYSTRUCTURE, а тело вложения
+    загружается лишь для писем с ключом в теме. Если сервер поддерживает
+    IDLE, ожидание новых писем идет через него вместо периодического опроса.
+    """
+
+    def __init__(self, server, user, password, download_dir, subject_key="new_video",
+                 video_extension=".mp4", mailbox="inbox", state_path=None,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, fetch_chunk_size=FETCH_CHUNK_SIZE):
+        self.server = server
+        self.user = user
+        self.password = password
+        self.download_dir = download_dir
+        self.subject_key = subject_key.lower()
+        self.video_extension = video_extension.lower()
+        self.mailbox = mailbox
+        self.state_path = state_path or os.path.join(download_dir, ".imap_state.json")
+        self.idle_timeout = idle_timeout
+        self.fetch_chunk_size = fetch_chunk_size
+        self.last_uid = 0  # сохраненный в файле состояния
+        self.polled_uid = 0  # последний просмотренный poll(), еще не подтвержденный commit()
+        self.uid_validity = None
+        self._mail = None
+        self._interrupted = threading.Event()
+        self._timings = {}
+        self._load_state()
+        self.polled_uid = self.last_uid
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+            self.last_uid = int(state.get("last_uid", 0))
+            self.uid_validity = state.get("uid_validity")
+        except (OSError, ValueError):
+            pass
+
+    def _save_state(self):
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"last_uid": self.last_uid, "uid_validity": self.uid_validity}, f)
+        os.replace(temp_path, self.state_path)
+
+    def connect(self):
+        """Открывает сессию (если еще не открыта) и выбирает почтовый ящик."""
+        if self._mail is not None:
+            return self._mail
+        mail = imaplib.IMAP4_SSL(self.server)
+        mail.login(self.user, self.password)
+        mail.select(self.mailbox)
+        _, data = mail.response("UIDVALIDITY")
+        uid_validity = data[0].decode() if data and data[0] else None
+        if uid_validity != self.uid_validity:
+            if self.uid_validity is not None:
+                print("UIDVALIDITY почтового ящика изменился, письма будут просмотрены заново")
+            self.uid_validity = uid_validity
+            self.last_uid = self.polled_uid = 0
+            self._save_state()
+        self._mail = mail
+        print(f"IMAP-сессия открыта ({self.server}), последний UID: {self.polled_uid}")
+        return mail
+
+    def close(self):
+        """Закрывает сессию."""
+        if self._mail is None:
+            return
+        try:
+            self._mail.close()
+            self._mail.logout()
+        except Exception:
+            pass
+        self._mail = None
+
+    @property
+    def supports_idle(self):
+        return self._mail is not None and "IDLE" in self._mail.capabilities
+
+    def _new_uids(self):
+        _, data = self._mail.uid("search", None, f"UID {self.polled_uid + 1}:*")
+        # Диапазон N:* всегда включает последнее письмо, даже если его UID < N
+        return sorted(uid for uid in map(int, data[0].split()) if uid > self.polled_uid)
+
+    def _fetch_subject(self, uid):
+        _, data = self._mail.uid("fetch", str(uid), "(BODY.PEEK[HEADER.FIELDS (SUBJECT)])")
+        header = next((item[1] for item in data if isinstance(item, tuple)), b"")
+        return email.message_from_bytes(header).get("Subject", "Без темы")  # Получаем тему письма, если есть
+
+    def _fetch_structure(self, uid):
+        _, data = self._mail.uid("fetch", str(uid), "(BODYSTRUCTURE)")
+        return _fetch_items([item for item in data if item is not None]).get("BODYSTRUCTURE") or []
+
+    def _video_parts(self, structure):
+        for part in iter_body_parts(structure):
+            if part["type"] == "multipart" or part["disposition"] is None:
+                continue
+            if part["filename"] and part["filename"].lower().endswith(self.video_extension):
+                yield part
+
+    def _target_path(self, subject, part, uid):
+        _, ext = os.path.splitext(part["filename"])
+        new_filename = f"{sanitize_filename(subject)}{ext}"
+        if os.path.exists(os.path.join(self.download_dir, new_filename)):
+            new_filename = f"{sanitize_filename(subject)}_{uid}_{part['section']}{ext}"
+        return new_filename, os.path.join(self.download_dir, new_filename)
+
+    def _download_part(self, uid, part, file_path):
+        """Скачивает часть письма порциями, декодируя ее прямо в файл.
+
+        Вложение запрашивается частичным FETCH (`BODY.PEEK[n]<offset.size>`),
+        поэтому в памяти одновременно находится не больше одной порции.
+        SHA-256 декодированного содержимого считается в том же проходе.
+        Время загрузки и хеширования сохраняется для сводки (pop_timings).
+        """
+        decoder = StreamDecoder(part["encoding"])
+        sha256_hash = hashlib.sha256()
+        offset = 0
+        hash_seconds = 0.0
+        start = time.perf_counter()
+        with open(file_path, "wb") as f:
+            while True:
+                _, data = self._mail.uid(
+                    "fetch", str(uid), f"(BODY.PEEK[{part['section']}]<{offset}.{self.fetch_chunk_size}>)")
+                chunk = next((item[1] for item in data if isinstance(item, tuple)), b"")
+                decoded = decoder.feed(chunk)
+                f.write(decoded)
+                hash_start = time.perf_counter()
+                sha256_hash.update(decoded)
+                hash_seconds += time.perf_counter() - hash_start
+                offset += len(chunk)
+                if len(chunk) < self.fetch_chunk_size:
+                    break
+            decoded = decoder.flush()
+            f.write(decoded)
+            sha256_hash.update(decoded)
+        download_seconds = time.perf_counter() - start - hash_seconds
+        self._timings[file_path] = {"imap_download": download_seconds, "hash": hash_seconds}
+        metrics.observe("imap_download", download_seconds)
+        metrics.observe("hash", hash_seconds)
+        metrics.inc("imap_bytes", offset)
+        metrics.inc("imap_attachments")
+        return sha256_hash.hexdigest()
+
+    def pop_timings(self, file_path):
+        """Возвращает и забывает время загрузки и хеширования скачанного файла."""
+        return self._timings.pop(file_path, {})
+
+    def poll(self, limit=None):
+        """Скачивает вложения из новых писем и возвращает список (путь, имя файла, SHA-256).
+
+        limit ограничивает число скачанных видео за один вызов; оставшиеся
+        письма будут просмотрены при следующем опросе. Просмотренные письма
+        запоминаются только в памяти — после приема видео нужно вызвать commit().
+        """
+        downloaded = []
+        file_path = None
+        try:
+            self.connect()
+            for uid in self._new_uids():
+                if limit is not None and len(downloaded) >= limit or self._interrupted.is_set():
+                    break
+                subject = self._fetch_subject(uid)
+                if self.subject_key in subject.lower():
+                    for part in self._video_parts(self._fetch_structure(uid)):
+                        new_filename, file_path = self._target_path(subject, part, uid)
+                        file_hash = self._download_part(uid, part, file_path)
+                        print(f"Файл {new_filename} скачан и сохранен в {self.download_dir}")
+                        downloaded.append((file_path, new_filename, file_hash))
+                        file_path = None
+                else:
+                    print(f"Пропущено письмо с темой: {subject}. Не найден ключ '{self.subject_key}'.")
+                self.polled_uid = uid
+        except (imaplib.IMAP4.error, OSError) as e:
+            print(f"Ошибка загрузки вложений: {e}")
+            self.close()
+            if file_path is not None and os.path.exists(file_path):
+                os.remove(file_path)  # недокачанный файл; письмо будет загружено заново
+        return downloaded
+
+    def commit(self):
+        """Сохраняет в файл состояния письма, просмотренные poll(): их видео уже приняты."""
+        if self.polled_uid != self.last_uid:
+            self.last_uid = self.polled_uid
+            self._save_state()
+
+    def wait_for_new(self, poll_interval):
+        """Ждет появления новых писем: через IDLE, если он поддерживается, иначе poll_interval секунд."""
+        if self._interrupted.is_set():
+            return
+        if not self.supports_idle:
+            self._interrupted.wait(poll_interval)
+            return
+        try:
+            self._idle(self.idle_timeout)
+        except (imaplib.IMAP4.error, OSError) as e:
+            if self._interrupted.is_set():
+                return
+            print(f"Ошибка ожидания IDLE: {e}")
+            self.close()
+            self._interrupted.wait(poll_interval)
+
+    def interrupt(self):
+        """Прерывает ожидание и текущие операции сессии из другого потока (при остановке)."""
+        self._interrupted.set()
+        mail = self._mail
+        if mail is not None:
+            try:
+                mail.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _idle(self, timeout):
+        mail = self._mail
+        # EXISTS, пришедший во время SEARCH/FETCH, imaplib уже сохранил: письмо есть, IDLE не нужен
+        if mail.untagged_responses.pop("EXISTS", None):
+            return
+        tag = mail._new_tag()
+        mail.send(tag + b" IDLE\r\n")
+        line = mail.readline()
+        if not line.startswith(b"+"):
+            raise imaplib.IMAP4.error(f"Сервер отклонил IDLE: {line!r}")
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if not _has_buffered_data(mail):
+                    readable, _, _ = select.select([mail.sock], [], [], remaining)
+                    if not readable:
+                        break
+                line = mail.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("Сервер закрыл соединение")
+                if b"EXISTS" in line.upper():
+                    break
+        finally:
+            mail.send(b"DONE\r\n")
+            while True:
+                line = mail.readline()
+                if not line or line.startswith(tag):
+                    break
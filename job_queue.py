@@ -0,0 +1,200 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_MAX_PENDING = 20
+DEFAULT_MAX_ATTEMPTS = 2
+DEFAULT_WORKER_MEMORY_MB = 1500  # примерный пик памяти одного процесса с моделью и декодером
+
+
+def default_worker_count(worker_memory_mb=DEFAULT_WORKER_MEMORY_MB):
+    """Подбирает число процессов-обработчиков по ядрам и доступной памяти."""
+    cpus = os.cpu_count() or 1
+    try:
+        available_mb = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return cpus
+    return max(1, min(cpus, available_mb // worker_memory_mb))
+
+
+def create_worker_pool(workers, collect_metrics=False):
+    """Создает пул процессов для подсчета.
+
+    Используется spawn: родительский процесс уже импортировал torch, а fork
+    после этого небезопасен. Каждый процесс держит свою модель в реестре и
+    переиспользует ее между заданиями. collect_metrics включает в процессах
+    сбор метрик конвейера: задание возвращает их через metrics.drain(), а
+    родитель добавляет к своему реестру через metrics.merge().
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=metrics.collect_in_worker if collect_metrics else None)
+
+
+class Job:
+    """Задание на подсчет одного видео."""
+
+    def __init__(self, job_id, file_path, filename, file_hash, attempts):
+        self.id = job_id
+        self.file_path = file_path
+        self.filename = filename
+        self.file_hash = file_hash
+        self.attempts = attempts
+
+
+class JobQueue:
+    """Очередь заданий на подсчет с состоянием в SQLite.
+
+    Состояние заданий (pending, running, done, failed) переживает
+    перезапуск: при открытии задания, прерванные на середине, возвращаются
+    в очередь. Очередь ограничена max_pending незавершенными заданиями —
+    пока она заполнена, новые письма не скачиваются. Файл видео удаляется,
+    когда задание завершается успешно или окончательно падает.
+    """
+
+    def __init__(self, path, max_pending=DEFAULT_MAX_PENDING, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " file_path TEXT NOT NULL,"
+                " filename TEXT NOT NULL,"
+                " file_hash TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " result TEXT,"
+                " error TEXT,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_hash ON jobs (file_hash)")
+        self.recover()
+
+    def recover(self):
+        """Возвращает в очередь задания, прерванные перезапуском, и проверяет их файлы."""
+        with self._lock, self._conn:
+            recovered = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?", (PENDING, time.time(), RUNNING)
+            ).rowcount
+            missing = [
+                job_id for job_id, file_path in self._conn.execute(
+                    "SELECT id, file_path FROM jobs WHERE status = ?", (PENDING,))
+                if not os.path.exists(file_path)
+            ]
+            for job_id in missing:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                    (FAILED, "файл видео не найден", time.time(), job_id),
+                )
+        if recovered:
+            print(f"Возвращено в очередь прерванных заданий: {recovered}")
+        if missing:
+            print(f"Заданий без файла видео: {len(missing)}")
+
+    def active_count(self):
+        """Количество незавершенных заданий (в очереди и в работе)."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (PENDING, RUNNING)).fetchone()[0]
+
+    def free_slots(self):
+        """Сколько заданий еще можно добавить, не превышая max_pending."""
+        return max(0, self.max_pending - self.active_count())
+
+    def find_active(self, file_hash):
+        """Возвращает id незавершенного задания (в очереди или в работе) с таким хешем видео или None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE file_hash = ? AND status IN (?, ?) ORDER BY id LIMIT 1",
+                (file_hash, PENDING, RUNNING)).fetchone()
+        return row[0] if row else None
+
+    def add(self, file_path, filename, file_hash):
+        """Ставит видео в очередь и возвращает id задания."""
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (file_path, filename, file_hash, status, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (file_path, filename, file_hash, PENDING, now, now),
+            )
+        print(f"Файл {filename} поставлен в очередь (задание {cursor.lastrowid})")
+        return cursor.lastrowid
+
+    def claim(self, limit):
+        """Забирает до limit ожидающих заданий и помечает их как выполняемые."""
+        if limit <= 0:
+            return []
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT id, file_path, filename, file_hash, attempts FROM jobs"
+                " WHERE status = ? ORDER BY id LIMIT ?", (PENDING, limit)).fetchall()
+            for row in rows:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (RUNNING, time.time(), row[0]),
+                )
+        return [Job(job_id, file_path, filename, file_hash, attempts + 1)
+                for job_id, file_path, filename, file_hash, attempts in rows]
+
+    def complete(self, job, result):
+        """Отмечает задание выполненным и удаляет файл видео."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, updated_at = ? WHERE id = ?",
+                (DONE, json.dumps(result), time.time(), job.id),
+            )
+        self._remove_file(job)
+
+    def requeue(self, job):
+        """Возвращает задание в очередь, не засчитывая попытку: оно прервано не по своей вине."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts - 1, updated_at = ? WHERE id = ?",
+                (PENDING, time.time(), job.id),
+            )
+
+    def fail(self, job, error):
+        """Возвращает задание в очередь или, если попытки исчерпаны, отмечает его упавшим.
+
+        Возвращает True, если задание упало окончательно.
+        """
+        final = job.attempts >= self.max_attempts
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (FAILED if final else PENDING, str(error), time.time(), job.id),
+            )
+        if final:
+            self._remove_file(job)
+        return final
+
+    @staticmethod
+    def _remove_file(job):
+        try:
+            os.remove(job.file_path)
+            print(f"Файл {job.file_path} удален")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Ошибка удаления файла: {e}")
+
+    def close(self):
+        """Закрывает базу очереди."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,179 @@
+import threading
+import time
+
+import cv2
+
+import metrics
+
+COST_SMOOTHING = 0.2  # вес нового замера в скользящей оценке стоимости инференса
+_WAIT_TIMEOUT = 0.1
+# cap.read() зависшего потока не прерывается, поэтому stop() ждет фоновый поток
+# (он daemon) не дольше этого времени
+_JOIN_TIMEOUT = 2.0
+
+
+class LiveFrameGrabber:
+    """Источник кадров для живого потока: всегда отдает самый свежий кадр.
+
+    Фоновый поток непрерывно читает поток через `cap.read()`, не давая
+    внутреннему буферу OpenCV накапливать отставание, и хранит только
+    последний кадр; кадры, которые никто не успел забрать, отбрасываются.
+    Итерация выдает (номер кадра, кадр) как FrameSampler, но не чаще,
+    чем раз в interval секунд, где interval — большее из min_interval и
+    измеренной стоимости инференса одного кадра (её замеряет детектор,
+    обернутый через wrap()). Поэтому при медленном инференсе частота
+    выборки падает сама, а задержка от захвата до подсчета остается
+    ограниченной, а не растет со временем.
+
+    Номер кадра — порядковый номер прочитанного из потока кадра, так что
+    пропуски видны по номерам. mark_counted() отмечает конец обработки
+    кадра и замеряет задержку; stats() и report() возвращают фактическую
+    частоту, число отброшенных кадров и задержку.
+
+    stop — threading.Event извне (например, по Ctrl+C): итерация
+    заканчивается в пределах _WAIT_TIMEOUT, даже если поток завис и
+    новые кадры не приходят.
+    """
+
+    def __init__(self, cap, min_interval=0.0, stop=None):
+        self.cap = cap
+        self.min_interval = min_interval or 0.0
+        self.stop_event = stop
+        self.cost = 0.0  # скользящая оценка секунд инференса на кадр
+        self.frames_grabbed = 0
+        self.frames_dropped = 0
+        self.frames_yielded = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self._frame = None
+        self._index = -1
+        self._captured_at = None
+        self._captured = {}  # номер кадра -> время захвата, пока кадр в обработке
+        self._condition = threading.Condition()
+        self._finished = False
+        self._stopped = False
+        self._started = None
+        self._thread = None
+        # Для части бэкендов (V4L2, GStreamer) уменьшает внутреннюю очередь кадров
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    @property
+    def interval(self):
+        """Текущий интервал между выбранными кадрами в секундах."""
+        return max(self.min_interval, self.cost)
+
+    def _grab_loop(self):
+        try:
+            while not self._stopped:
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                with self._condition:
+                    if self._frame is not None:
+                        self.frames_dropped += 1
+                        metrics.inc("frames_dropped")
+                    self._frame = frame
+                    self.frames_grabbed += 1
+                    self._index = self.frames_grabbed - 1
+                    self._captured_at = time.monotonic()
+                    self._condition.notify_all()
+        finally:
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+
+    def _stop_requested(self):
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def _take(self):
+        """Ждет свежий кадр и забирает его; None, если поток закончился или остановлен."""
+        with self._condition:
+            while self._frame is None:
+                if self._finished or self._stopped or self._stop_requested():
+                    return None
+                self._condition.wait(_WAIT_TIMEOUT)
+            frame, self._frame = self._frame, None
+            self._captured[self._index] = self._captured_at
+            return self._index, frame
+
+    def __iter__(self):
+        """Запускает чтение потока и выдает пары (номер кадра, кадр) с адаптивной частотой."""
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._grab_loop, name="live-grabber", daemon=True)
+        self._thread.start()
+        try:
+            last = None
+            while not self._stopped:
+                if last is not None:
+                    delay = last + self.interval - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                item = self._take()
+                if item is None:
+                    return
+                last = time.monotonic()
+                self.frames_yielded += 1
+                if metrics.METRICS.enabled:
+                    metrics.gauge("live_fps", round(self.achieved_fps, 2))
+                yield item
+        finally:
+            self.stop()
+
+    def wrap(self, infer):
+        """Оборачивает детектор FrameEngine, замеряя стоимость инференса для подстройки частоты."""
+        def infer_timed(frames):
+            start = time.perf_counter()
+            results = infer(frames)
+            if frames:
+                cost = (time.perf_counter() - start) / len(frames)
+                self.cost = cost if not self.cost else self.cost + COST_SMOOTHING * (cost - self.cost)
+            return results
+        return infer_timed
+
+    def mark_counted(self, index):
+        """Отмечает, что кадр подсчитан, и обновляет задержку от захвата до подсчета."""
+        captured = self._captured.pop(index, None)
+        if captured is None:
+            return
+        self.latency = time.monotonic() - captured
+        self.max_latency = max(self.max_latency, self.latency)
+        metrics.observe("live_latency", self.latency)
+
+    @property
+    def achieved_fps(self):
+        """Фактическая частота выбранных кадров."""
+        if not self._started:
+            return 0.0
+        elapsed = time.monotonic() - self._started
+        return self.frames_yielded / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        """Возвращает фактическую частоту, число отброшенных кадров и задержку."""
+        return {
+            "achieved_fps": round(self.achieved_fps, 2),
+            "interval": round(self.interval, 3),
+            "frames_grabbed": self.frames_grabbed,
+            "frames_dropped": self.frames_dropped,
+            "latency": round(self.latency, 3),
+            "max_latency": round(self.max_latency, 3),
+        }
+
+    def report(self):
+        """Печатает сводку живого режима."""
+        stats = self.stats()
+        print(f"Живой режим: {stats['achieved_fps']} кадр/с (интервал {stats['interval']} с), "
+              f"прочитано кадров: {stats['frames_grabbed']}, отброшено: {stats['frames_dropped']}, "
+              f"задержка {stats['latency']} с (макс. {stats['max_latency']} с)")
+
+    def stop(self):
+        """Останавливает чтение потока и дожидается фонового потока (не дольше _JOIN_TIMEOUT)."""
+        self._stopped = True
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(_JOIN_TIMEOUT)
+
+    @property
+    def reading(self):
+        """Фоновый поток все еще внутри cap.read(): cap нельзя освобождать."""
+        return self._thread is not None and self._thread.is_alive()
@@ -0,0 +1,234 @@
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "pedestrian_"
+DEFAULT_DUMP_INTERVAL = 30
+
+# Названия стадий для сводки по заданию
+STAGE_NAMES = {
+    "imap_download": "загрузка",
+    "hash": "хеш",
+    "decode": "декодирование",
+    "preprocess": "resize",
+    "infer": "инференс",
+    "count": "подсчет",
+}
+
+_NULL_TIMER = nullcontext()
+
+
+class _Timer:
+    __slots__ = ("registry", "key", "start")
+
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry._observe(self.key, time.perf_counter() - self.start)
+
+
+class Metrics:
+    """Счетчики, gauge-значения и таймеры конвейера.
+
+    Пока реестр выключен, все методы сразу возвращаются (таймер — общий
+    nullcontext), так что инструментирование горячих участков почти ничего
+    не стоит. Включается через start(): метрики отдаются в формате Prometheus
+    по HTTP и/или периодически пишутся в JSON-файл.
+
+    В процессах пула реестр включается через collect(): метрики копятся
+    локально, drain() забирает их вместе с результатом задания, а
+    родительский процесс добавляет их к своему реестру через merge().
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timers = {}  # ключ -> [число, сумма секунд, максимум]
+        self._server = None
+        self._json_path = None
+        self._dump_stop = threading.Event()
+
+    def timer(self, name, **labels):
+        """Контекстный менеджер, замеряющий время блока."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, (name, tuple(sorted(labels.items()))))
+
+    def observe(self, name, seconds, **labels):
+        """Добавляет к таймеру уже измеренную длительность."""
+        if self.enabled:
+            self._observe((name, tuple(sorted(labels.items()))), seconds)
+
+    def _observe(self, key, seconds):
+        with self._lock:
+            stats = self._timers.get(key)
+            if stats is None:
+                self._timers[key] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                if seconds > stats[2]:
+                    stats[2] = seconds
+
+    def inc(self, name, value=1, **labels):
+        """Увеличивает счетчик."""
+        if self.enabled:
+            key = (name, tuple(sorted(labels.items())))
+            with self._lock:
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        """Устанавливает текущее значение (глубина очереди, кадры в секунду и т. п.)."""
+        if self.enabled:
+            with self._lock:
+                self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def collect(self):
+        """Включает сбор без эндпоинтов: накопленное забирается через drain()."""
+        self.enabled = True
+
+    def drain(self):
+        """Возвращает накопленные метрики (их можно передать в другой процесс) и обнуляет реестр."""
+        with self._lock:
+            data = {"counters": self._counters, "gauges": self._gauges, "timers": self._timers}
+            self._counters, self._gauges, self._timers = {}, {}, {}
+        return data
+
+    def merge(self, data):
+        """Добавляет метрики, полученные drain() в другом процессе: счетчики и таймеры суммируются."""
+        if not self.enabled or not data:
+            return
+        with self._lock:
+            for key, value in data["counters"].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            self._gauges.update(data["gauges"])
+            for key, (count, total, peak) in data["timers"].items():
+                stats = self._timers.get(key)
+                if stats is None:
+                    self._timers[key] = [count, total, peak]
+                else:
+                    stats[0] += count
+                    stats[1] += total
+                    stats[2] = max(stats[2], peak)
+
+    def snapshot(self):
+        """Возвращает все метрики в виде словаря для JSON."""
+        def entries(items, value):
+            return [{"name": name, "labels": dict(labels), **value(v)} for (name, labels), v in items]
+
+        with self._lock:
+            return {
+                "time": time.time(),
+                "counters": entries(self._counters.items(), lambda v: {"value": v}),
+                "gauges": entries(self._gauges.items(), lambda v: {"value": v}),
+                "timers": entries(self._timers.items(),
+                                  lambda v: {"count": v[0], "seconds": round(v[1], 6), "max": round(v[2], 6)}),
+            }
+
+    def render_prometheus(self):
+        """Возвращает метрики в текстовом формате Prometheus."""
+        def series(name, labels, value):
+            label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+            return f"{PREFIX}{name}{{{label_text}}} {value}" if label_text else f"{PREFIX}{name} {value}"
+
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(series(f"{name}_total", labels, value))
+            for (name, labels), value in sorted(self._gauges.items()):
+                lines.append(series(name, labels, value))
+            for (name, labels), (count, total, peak) in sorted(self._timers.items()):
+                lines.append(series(f"{name}_seconds_count", labels, count))
+                lines.append(series(f"{name}_seconds_sum", labels, f"{total:.6f}"))
+                lines.append(series(f"{name}_seconds_max", labels, f"{peak:.6f}"))
+        return "\n".join(lines) + "\n"
+
+    def start(self, port=None, json_path=None, interval=DEFAULT_DUMP_INTERVAL, host="127.0.0.1"):
+        """Включает сбор метрик; port — HTTP-эндпоинт /metrics, json_path — периодический дамп."""
+        if not port and not json_path:
+            return
+        self.enabled = True
+        if port:
+            self._server = ThreadingHTTPServer((host, int(port)), _make_handler(self))
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+            print(f"Метрики доступны на http://{host}:{self._server.server_port}/metrics")
+        if json_path:
+            self._json_path = json_path
+            threading.Thread(target=self._dump_loop, args=(json_path, interval), name="metrics-dump",
+                             daemon=True).start()
+
+    def _dump_loop(self, path, interval):
+        while not self._dump_stop.wait(interval):
+            self.dump(path)
+
+    def dump(self, path):
+        """Атомарно записывает снимок метрик в JSON-файл."""
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def stop(self):
+        """Останавливает HTTP-эндпоинт и периодический дамп, записывая итоговый снимок."""
+        self._dump_stop.set()
+        if self._json_path:
+            self.dump(self._json_path)
+            self._json_path = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _make_handler(registry):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return MetricsHandler
+
+
+def format_timings(timings):
+    """Форматирует секунды по стадиям задания в строку для лога."""
+    parts = [f"{STAGE_NAMES.get(stage, stage)} {seconds:.1f} с" for stage, seconds in timings.items() if seconds]
+    return ", ".join(parts)
+
+
+def collect_in_worker():
+    """Инициализатор процесса пула: включает сбор метрик для передачи родителю через drain()."""
+    METRICS.collect()
+
+
+# Реестр процесса: модули конвейера пишут в него, скрипты включают его через metrics.start()
+METRICS = Metrics()
+timer = METRICS.timer
+observe = METRICS.observe
+inc = METRICS.inc
+gauge = METRICS.gauge
+start = METRICS.start
+stop = METRICS.stop
+drain = METRICS.drain
+merge = METRICS.merge
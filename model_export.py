@@ -0,0 +1,169 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+import cv2
+import numpy as np
+
+from frame_engine import resize_frame
+
+BACKENDS = ("pytorch", "onnx", "onnx-int8", "openvino")
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pedestrian-counter", "models")
+EXPORT_IMGSZ = 640
+CALIBRATION_FRAMES = 64
+# Квантуются только свертки: голова детектора (Sigmoid, Concat, DFL) остается в float,
+# иначе заметно теряется точность координат и уверенности
+QUANTIZED_OPS = ["Conv"]
+
+_exported = {}
+_lock = threading.Lock()
+
+
+def file_digest(path, length=12):
+    """Короткий sha256 содержимого файла, чтобы кэш не путал разные веса с одним именем."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:length]
+
+
+def sample_frames(video_path, count=CALIBRATION_FRAMES):
+    """Берет count кадров, равномерно распределенных по видео, в размере кадра конвейера."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Не удалось открыть видео для калибровки {video_path}")
+    frame_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    step = max(1, frame_total // count) if frame_total > 0 else 1
+    frames = []
+    index = 0
+    while len(frames) < count:
+        if step > 1 and not cap.set(cv2.CAP_PROP_POS_FRAMES, index):
+            break
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(resize_frame(frame))
+        index += step
+    cap.release()
+    if not frames:
+        raise ValueError(f"В видео для калибровки {video_path} нет кадров")
+    return frames
+
+
+def _frames_digest(frames, length=12):
+    digest = hashlib.sha256()
+    for frame in frames:
+        digest.update(frame.tobytes())
+    return digest.hexdigest()[:length]
+
+
+def _calibration_reader(input_name, frames):
+    """Подает кадры калибровки в quantize_static в том виде, в каком их получает модель."""
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class FrameCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self._frames = iter(frames)
+
+        def get_next(self):
+            frame = next(self._frames, None)
+            if frame is None:
+                return None
+            # BGR HWC uint8 -> RGB NCHW float32 в [0, 1], как в предобработке ultralytics
+            tensor = frame[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+            return {input_name: np.ascontiguousarray(tensor)}
+
+    return FrameCalibrationReader()
+
+
+def quantize_int8(onnx_path, output_path, frames):
+    """Статически квантует ONNX-модель в INT8, калибруя активации на кадрах frames."""
+    import onnxruntime
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    session = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+    input_name = session.get_inputs()[0].name
+    del session
+    quantize_static(onnx_path, output_path, _calibration_reader(input_name, frames),
+                    quant_format=QuantFormat.QDQ, op_types_to_quantize=QUANTIZED_OPS, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+
+def _export(weights_path, backend, work_dir, imgsz, frames):
+    """Экспортирует копию весов в work_dir и возвращает путь к артефакту."""
+    from ultralytics import YOLO
+
+    local_weights = os.path.join(work_dir, os.path.basename(weights_path))
+    shutil.copy2(weights_path, local_weights)
+    model = YOLO(local_weights)
+    # dynamic: одна модель подходит для любой пачки и для полосы ROI любой ширины
+    if backend == "openvino":
+        return model.export(format="openvino", imgsz=imgsz, dynamic=True)
+    exported = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    if backend == "onnx-int8":
+        quantized = os.path.join(work_dir, os.path.splitext(os.path.basename(weights_path))[0] + "_int8.onnx")
+        quantize_int8(exported, quantized, frames)
+        return quantized
+    return exported
+
+
+def export_model(weights="yolov8n.pt", backend="pytorch", calibration=None, cache_dir=DEFAULT_CACHE_DIR,
+                 imgsz=EXPORT_IMGSZ):
+    """Возвращает путь к весам для YOLO() с нужным бэкендом, экспортируя модель при первом вызове.
+
+    pytorch — исходный чекпойнт без изменений. onnx и openvino —
+    экспорт через ultralytics (инференс идет через ONNX Runtime или
+    OpenVINO, интерфейс YOLO тот же). onnx-int8 — ONNX-модель, статически
+    квантованная на кадрах видео calibration.
+
+    Артефакт кэшируется на диске под именем с хешем весов (и кадров
+    калибровки), поэтому экспорт выполняется один раз на хост. Экспорт идет
+    во временной папке и переносится в кэш атомарно, так что параллельные
+    процессы не видят недописанных файлов.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд {backend}, доступны: {', '.join(BACKENDS)}")
+    if backend == "pytorch":
+        return weights
+    if backend == "onnx-int8" and not calibration:
+        raise ValueError("Для бэкенда onnx-int8 нужно видео для калибровки")
+
+    with _lock:
+        key = (weights, backend, calibration, cache_dir, imgsz)
+        path = _exported.get(key)
+        if path is not None:
+            return path
+
+        if not os.path.exists(weights):
+            from ultralytics import YOLO
+            # Стандартные веса ultralytics скачивает при первой загрузке
+            weights_path = str(YOLO(weights).ckpt_path)
+        else:
+            weights_path = weights
+        frames = sample_frames(calibration) if backend == "onnx-int8" else None
+        name = f"{os.path.splitext(os.path.basename(weights_path))[0]}-{file_digest(weights_path)}-{backend}-{imgsz}"
+        if frames is not None:
+            name += f"-cal{_frames_digest(frames)}"
+        extension = "_openvino_model" if backend == "openvino" else ".onnx"
+        path = os.path.join(cache_dir, name + extension)
+
+        if not os.path.exists(path):
+            os.makedirs(cache_dir, exist_ok=True)
+            print(f"Экспорт модели {weights} в {backend}...")
+            work_dir = tempfile.mkdtemp(prefix=name + ".", dir=cache_dir)
+            try:
+                exported = _export(weights_path, backend, work_dir, imgsz, frames)
+                try:
+                    os.rename(exported, path)
+                except OSError:
+                    if not os.path.exists(path):
+                        raise
+                    # Другой процесс успел экспортировать ту же модель
+                print(f"Модель {backend} сохранена в {path}")
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        _exported[key] = path
+    return path
@@ -0,0 +1,47 @@
+import threading
+
+import numpy as np
+from ultralytics import YOLO
+
+DEFAULT_WEIGHTS = "yolov8n.pt"
+DEFAULT_TRACKER = "bytetrack.yaml"
+
+_models = {}
+_lock = threading.Lock()
+
+
+def get_model(weights=DEFAULT_WEIGHTS, tracker=DEFAULT_TRACKER):
+    """Возвращает прогретую модель YOLO из общего реестра процесса.
+
+    Модель загружается один раз на пару (веса, конфиг трекера) и прогревается
+    пустым кадром, поэтому повторные вызовы не перечитывают веса и не
+    пересобирают граф.
+    """
+    key = (weights, tracker)
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            # task задан явно: у экспортированных моделей (ONNX, OpenVINO) он не всегда определяется по файлу
+            model = YOLO(weights, task="detect")
+            # Прогрев: первый вызов инициализирует предиктор и граф модели
+            model.predict(np.zeros((480, 640, 3), dtype=np.uint8), verbose=False)
+            _models[key] = model
+            print(f"Модель {weights} (трекер: {tracker}) загружена и прогрета")
+    return model
+
+
+def reset_tracker(model):
+    """Сбрасывает состояние трекера модели перед обработкой нового видео.
+
+    Без сброса `model.track(persist=True)` продолжает треки и нумерацию ID
+    из предыдущего ролика.
+    """
+    predictor = getattr(model, "predictor", None)
+    for tracker in getattr(predictor, "trackers", None) or []:
+        tracker.reset()
+
+
+def clear_models():
+    """Очищает реестр моделей (например, при завершении процесса)."""
+    with _lock:
+        _models.clear()
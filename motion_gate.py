@@ -0,0 +1,90 @@
+import cv2
+
+import metrics
+
+GATE_SIZE = (160, 120)  # кадр уменьшается до такого размера перед сравнением
+PIXEL_DELTA = 25  # изменение яркости, с которого пиксель считается изменившимся
+DEFAULT_THRESHOLD = 0.002  # доля изменившихся пикселей; пешеход в кадре 640x480 дает ~1%
+DEFAULT_MAX_GAP = 25  # после стольких пропусков подряд инференс выполняется принудительно
+
+
+class MotionGate:
+    """Дешевая проверка движения перед детектором.
+
+    Кадр уменьшается до GATE_SIZE, переводится в оттенки серого и
+    сравнивается с опорным кадром — последним, на котором выполнялся
+    инференс (а не с предыдущим кадром). Поэтому медленное движение
+    накапливается, и пешеход, вошедший во время пропусков, рано или поздно
+    превысит порог и будет обработан. Не реже чем раз в max_gap кадров
+    инференс выполняется принудительно: опорный кадр обновляется при
+    смене освещения, а трекер получает свежие детекции.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_gap=DEFAULT_MAX_GAP, pixel_delta=PIXEL_DELTA,
+                 size=GATE_SIZE):
+        self.threshold = threshold
+        self.max_gap = max_gap
+        self.pixel_delta = pixel_delta
+        self.size = size
+        self.reference = None
+        self.gap = 0
+        self.inferred = 0
+        self.skipped = 0
+
+    def _signature(self, frame):
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def should_infer(self, frame):
+        """Возвращает True, если кадр нужно отдать детектору."""
+        signature = self._signature(frame)
+        if self.reference is not None and self.gap < self.max_gap:
+            changed = cv2.countNonZero(cv2.threshold(cv2.absdiff(signature, self.reference), self.pixel_delta,
+                                                     255, cv2.THRESH_BINARY)[1])
+            if changed < self.threshold * signature.size:
+                self.gap += 1
+                self.skipped += 1
+                metrics.inc("inferences_skipped")
+                return False
+        self.reference = signature
+        self.gap = 0
+        self.inferred += 1
+        return True
+
+    def report(self):
+        """Печатает, сколько инференсов удалось пропустить."""
+        total = self.inferred + self.skipped
+        if total:
+            print(f"Пропущено инференсов без движения: {self.skipped} из {total} "
+                  f"({self.skipped / total * 100:.0f}%)")
+
+
+class GatedDetector:
+    """Детектор FrameEngine, вызывающий модель только для кадров с движением.
+
+    Кадры без движения не попадают ни в модель, ни в трекер (для трекера
+    время на неподвижной сцене не идет), а вместо результата получают
+    боксы последнего обработанного кадра: сцена не изменилась, поэтому и
+    подсчет не меняется. Кадры с движением передаются детектору пачкой
+    в исходном порядке.
+    """
+
+    def __init__(self, detector, gate):
+        self.detector = detector
+        self.gate = gate
+        self.last = None
+
+    def __call__(self, frames):
+        selected = [index for index, frame in enumerate(frames) if self.gate.should_infer(frame)]
+        detected = dict(zip(selected, self.detector([frames[index] for index in selected]))) if selected else {}
+        results = []
+        for index in range(len(frames)):
+            if index in detected:
+                self.last = detected[index]
+            results.append(self.last)
+        return results
+
+    def report(self):
+        self.gate.report()
@@ -0,0 +1,234 @@
+import queue
+import threading
+import time
+
+import cv2
+
+import metrics
+from batch_inference import create_tracker, detect_batch, update_tracker
+from counting import LineCounter
+from frame_engine import DEFAULT_QUEUE_DEPTH, resize_frame
+from frame_sampler import FrameSampler
+from model_registry import get_model
+from motion_gate import DEFAULT_MAX_GAP, MotionGate
+from roi import LineRoi
+from zones import ZoneCounter, zones_for_camera
+
+_DONE = object()
+_POLL_TIMEOUT = 0.1
+# grab() зависшей камеры не прерывается, поэтому stop() ждет потоки камер (они daemon)
+# в сумме не дольше этого времени; cap освобождает сам поток, когда grab() вернется
+_JOIN_TIMEOUT = 2.0
+
+
+def load_camera_sources(sources=None, sources_file=None):
+    """Возвращает список источников камер из строки через запятую или файла (по одному на строку)."""
+    items = []
+    if sources:
+        items.extend(sources.split(","))
+    if sources_file:
+        with open(sources_file, encoding="utf-8") as f:
+            items.extend(f.read().splitlines())
+    return [item.strip() for item in items if item.strip() and not item.strip().startswith("#")]
+
+
+class CameraState:
+    """Состояние одной камеры: собственный трекер, счетчик, зоны и статистика кадров."""
+
+    def __init__(self, name, source, tracker, line_x, ttl_frames=None, max_tracks=None, roi_margin=None,
+                 gate=None, zones=None):
+        self.name = name
+        self.source = source
+        self.tracker = tracker
+        self.counter = LineCounter(line_x, ttl_frames=ttl_frames, max_tracks=max_tracks)
+        self.zones = ZoneCounter(zones, ttl_frames=ttl_frames, max_tracks=max_tracks) if zones else None
+        # Зоны могут лежать в любом месте кадра, поэтому полоса ROI для них не подходит
+        self.roi = LineRoi.from_ratio(line_x, roi_margin) if not zones else None
+        self.gate = gate
+        self.frames_processed = 0
+        self.started = time.perf_counter()
+
+    @property
+    def fps(self):
+        elapsed = time.perf_counter() - self.started
+        return self.frames_processed / elapsed if elapsed > 0 else 0.0
+
+
+class MultiCameraEngine:
+    """Обрабатывает несколько камер одной моделью.
+
+    Каждая камера декодируется в своем потоке и кладет кадры в общую
+    ограниченную очередь. Поток инференса собирает из нее пачку кадров разных
+    камер, детектирует ее одним вызовом модели, а затем раздает детекции
+    трекерам и счетчикам соответствующих камер. Кадры одной камеры идут в
+    очереди по порядку, поэтому трекер каждой камеры получает их как прежде.
+    roi_margin включает инференс только в полосе вокруг линии подсчета (LineRoi).
+    motion_threshold включает MotionGate: кадры камеры без движения не
+    попадают в очередь, и ни модель, ни трекер, ни счетчик их не видят.
+    zones — конфигурация load_zones: камеры со своими линиями и
+    многоугольниками дополнительно считаются ZoneCounter (ROI для них
+    отключается).
+    """
+
+    def __init__(self, sources, batch_size=8, queue_depth=DEFAULT_QUEUE_DEPTH, interval_sec=None,
+                 weights="yolov8n.pt", tracker="bytetrack.yaml", ttl_frames=None, max_tracks=None,
+                 roi_margin=None, motion_threshold=None, motion_max_gap=DEFAULT_MAX_GAP, zones=None):
+        self.sources = list(sources)
+        self.batch_size = max(1, int(batch_size))
+        self.queue_depth = max(1, int(queue_depth))
+        self.interval_sec = interval_sec
+        self.weights = weights
+        self.tracker = tracker
+        self.ttl_frames = ttl_frames
+        self.max_tracks = max_tracks
+        self.roi_margin = roi_margin
+        self.motion_threshold = motion_threshold
+        self.motion_max_gap = motion_max_gap
+        self.zones = zones
+        self.cameras = []
+        self._frames = queue.Queue(maxsize=self.queue_depth * max(1, len(self.sources)))
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._frames.put(item, timeout=_POLL_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _decode_loop(self, camera_index, cap):
+        camera = self.cameras[camera_index]
+        preprocess = camera.roi.crop if camera.roi else resize_frame
+        try:
+            start = time.perf_counter()
+            for _, frame in FrameSampler(cap, self.interval_sec, stop=self._stop):
+                metrics.observe("decode", time.perf_counter() - start, camera=camera.name)
+                metrics.inc("frames_decoded", camera=camera.name)
+                with metrics.timer("preprocess"):
+                    frame = preprocess(frame)
+                if camera.gate is not None and not camera.gate.should_infer(frame):
+                    start = time.perf_counter()
+                    continue
+                if not self._put((camera_index, frame)):
+                    break
+                start = time.perf_counter()
+            else:
+                if not self._stop.is_set():
+                    print(f"Поток камеры {camera.name} завершился")
+        except Exception as e:
+            print(f"Ошибка чтения камеры {camera.name}: {e}")
+        finally:
+            cap.release()
+            self._put((camera_index, _DONE))
+
+    def _next_batch(self):
+        """Собирает до batch_size кадров: ждет первый и добирает уже готовые."""
+        batch = []
+        while not batch and not self._stop.is_set():
+            try:
+                batch.append(self._frames.get(timeout=_POLL_TIMEOUT))
+            except queue.Empty:
+                continue
+        while batch and len(batch) < self.batch_size:
+            try:
+                batch.append(self._frames.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _open_cameras(self):
+        captures = []
+        for index, source in enumerate(self.sources):
+            cap = cv2.VideoCapture(source)
+            if not cap.isOpened():
+                print(f"Не удалось открыть камеру {source}")
+                continue
+            line_x = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) / 4)
+            gate = MotionGate(self.motion_threshold, self.motion_max_gap) if self.motion_threshold else None
+            name = f"cam{index + 1}"
+            zones = zones_for_camera(self.zones, name, source)
+            if zones and self.roi_margin:
+                print(f"Для камеры {name} заданы зоны подсчета, инференс идет по всему кадру")
+            self.cameras.append(CameraState(name, source, create_tracker(self.tracker), line_x,
+                                            ttl_frames=self.ttl_frames, max_tracks=self.max_tracks,
+                                            roi_margin=self.roi_margin, gate=gate, zones=zones))
+            captures.append(cap)
+        return captures
+
+    def run(self):
+        """Запускает обработку всех камер и возвращает итоговые счетчики по камерам."""
+        model = get_model(self.weights, tracker=None)
+        captures = self._open_cameras()
+        self._threads = [
+            threading.Thread(target=self._decode_loop, args=(index, cap), name=f"camera-{index}", daemon=True)
+            for index, cap in enumerate(captures)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        active = len(captures)
+        try:
+            while active and not self._stop.is_set():
+                batch = []
+                for camera_index, frame in self._next_batch():
+                    if frame is _DONE:
+                        active -= 1
+                    else:
+                        batch.append((camera_index, frame))
+                if not batch:
+                    continue
+                with metrics.timer("infer"):
+                    results = detect_batch(model, [frame for _, frame in batch])
+                metrics.inc("frames_inferred", len(batch))
+                for (camera_index, _), result in zip(batch, results):
+                    camera = self.cameras[camera_index]
+                    with metrics.timer("count"):
+                        tracks = update_tracker(camera.tracker, result)
+                        if camera.roi:
+                            tracks = camera.roi.to_frame(tracks)
+                        camera.counter.update(tracks)
+                        if camera.zones is not None:
+                            camera.zones.update(tracks)
+                    camera.frames_processed += 1
+                if metrics.METRICS.enabled:
+                    metrics.gauge("queue_depth", self._frames.qsize(), queue="frames")
+                    for camera_index in {camera_index for camera_index, _ in batch}:
+                        camera = self.cameras[camera_index]
+                        metrics.gauge("camera_fps", round(camera.fps, 2), camera=camera.name)
+        finally:
+            self.stop()
+        return self.counts()
+
+    def stop(self, wait=True):
+        """Останавливает потоки декодирования; повторный вызов ничего не ждет.
+
+        wait=False только выставляет флаг остановки (например, из обработчика
+        сигнала): run() заканчивает цикл и сам дожидается потоков.
+        """
+        self._stop.set()
+        if not wait:
+            return
+        threads, self._threads = self._threads, []
+        deadline = time.monotonic() + _JOIN_TIMEOUT
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def counts(self):
+        """Возвращает {имя камеры: (уникальные пешеходы, общее количество)}."""
+        return {camera.name: camera.counter.counts() for camera in self.cameras}
+
+    def zone_counts(self):
+        """Возвращает {имя камеры: {зона: {"in", "out"}}} для камер с зонами."""
+        return {camera.name: camera.zones.counts() for camera in self.cameras if camera.zones is not None}
+
+    def stats(self):
+        """Возвращает по каждой камере скорость обработки и состояние треков."""
+        return {
+            camera.name: dict(camera.counter.stats(), source=camera.source, fps=round(camera.fps, 2),
+                              frames=camera.frames_processed,
+                              frames_static=camera.gate.skipped if camera.gate else 0)
+            for camera in self.cameras
+        }
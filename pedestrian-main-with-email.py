@@ -1,7 +1,10 @@
 import cv2
-from ultralytics import YOLO
+from frame_engine import FrameEngine
+from frame_sampler import FrameSampler
+from model_registry import get_model
+from renderer import AsyncRenderer, draw_annotations, resolve_view_mode
 import numpy as np
-from telegram import Bot
+from telegram_notifier import send_once
 import imaplib
 import email
 import os
@@ -12,21 +15,19 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-def send_telegram_message(bot_token, chat_id, message):
-    """Отправляет сообщение в Telegram."""
-    try:
-        bot = Bot(token=bot_token)
-        bot.send_message(chat_id=chat_id, text=message)
-        print("Сообщение в Telegram успешно отправлено!")
-    except Exception as e:
-        print(f"Ошибка отправки сообщения в Telegram: {e}")
+VIEW_MODE = os.getenv("VIEW_MODE", "auto") # window - окно с разметкой, headless - без отрисовки, auto - окно, если есть дисплей
+RENDER_PATH = os.getenv("RENDER_PATH") # MP4 с разметкой каждого RENDER_EVERY-го кадра (для отладки)
+RENDER_EVERY = int(os.getenv("RENDER_EVERY", "10"))
 
 def sanitize_filename(filename):
     """Очищает имя файла от недопустимых символов."""
     return re.sub(r'[^\w\.\-]', '_', filename)
 
-async def download_email_attachments(imap_server, imap_email, imap_password, download_dir, video_extension='.mp4'):
-    """Скачивает вложения из почты и возвращает путь к первому видеофайлу и тему письма."""
+def download_email_attachments(imap_server, imap_email, imap_password, download_dir, video_extension='.mp4'):
+    """Скачивает вложения из почты и возвращает путь к первому видеофайлу и тему письма.
+
+    imaplib блокирует, поэтому из асинхронного кода функция вызывается через asyncio.to_thread.
+    """
     try:
         mail = imaplib.IMAP4_SSL(imap_server)
         mail.login(imap_email, imap_password)
@@ -67,7 +68,7 @@ async def download_email_attachments(imap_server, imap_email, imap_password, dow
 
 def detect_pedestrian_traffic(video_path):
     """Распознает пешеходный трафик в видео."""
-    model = YOLO("yolov8n.pt")
+    model = get_model("yolov8n.pt", tracker=None)
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print(f"Не удалось открыть видео {video_path}")
@@ -76,40 +77,44 @@ def detect_pedestrian_traffic(video_path):
     tracked_ids = set()
     line_y = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) / 2)
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        results = model(frame)
-
-        for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                b = box.xyxy[0]
-                cls = int(box.cls[0])
-                confidence = float(box.conf[0])
-
-                if cls == 0 and confidence > 0.5:
-                    x1, y1, x2, y2 = map(int, b)
-                    center_x = (x1 + x2) // 2
-                    center_y = (y1 + y2) // 2
-                    obj_id = hash((center_x, center_y))
-
-                    if obj_id not in tracked_ids and center_y > line_y:
-                         tracked_ids.add(obj_id)
-                         cv2.rectangle(frame, (x1,y1), (x2,y2), (0,255,0), 2)
-                         cv2.putText(frame, f"Person", (x1,y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5,(0,255,0), 2)
-
-        cv2.line(frame, (0, line_y), (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), line_y), (0, 0, 255), 2)
-        cv2.putText(frame, f"People Count: {len(tracked_ids)}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-        cv2.imshow("Pedestrian Traffic", frame)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+    # В headless-режиме кадры не размечаются и не показываются
+    show = resolve_view_mode(VIEW_MODE) == "window"
+    renderer = None
+    if RENDER_PATH:
+        renderer = AsyncRenderer(RENDER_PATH, cap.get(cv2.CAP_PROP_FPS) / RENDER_EVERY, RENDER_EVERY, line_y)
+
+    engine = FrameEngine(FrameSampler(cap, frame_skip=1), model)
+    for _, frame, r in engine:
+        counted = []
+        boxes = r.boxes
+        for box in boxes:
+            b = box.xyxy[0]
+            cls = int(box.cls[0])
+            confidence = float(box.conf[0])
+
+            if cls == 0 and confidence > 0.5:
+                x1, y1, x2, y2 = map(int, b)
+                center_x = (x1 + x2) // 2
+                center_y = (y1 + y2) // 2
+                obj_id = hash((center_x, center_y))
+
+                if obj_id not in tracked_ids and center_y > line_y:
+                     tracked_ids.add(obj_id)
+                     counted.append((x1, y1, x2, y2))
+
+        if renderer:
+            renderer.submit(frame, counted, len(tracked_ids))
+        if show:
+            draw_annotations(frame, counted, line_y, len(tracked_ids))
+            cv2.imshow("Pedestrian Traffic", frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
 
     cap.release()
-    cv2.destroyAllWindows()
+    if show:
+        cv2.destroyAllWindows()
+    if renderer:
+        renderer.close()
     return len(tracked_ids)
 
 async def main():
@@ -126,15 +131,15 @@ async def main():
         os.makedirs(download_dir)
 
 
-    video_path, video_filename = await download_email_attachments(imap_server, imap_email, imap_password, download_dir)
+    video_path, video_filename = await asyncio.to_thread(download_email_attachments, imap_server, imap_email, imap_password, download_dir)
 
     if video_path:
-        people_count = detect_pedestrian_traffic(video_path)
+        people_count = await asyncio.to_thread(detect_pedestrian_traffic, video_path)
         if people_count is not None:
             message = f"Подсчет завершен.\n\
                        Файл: {video_filename}\n\
                        Количество пешеходов: {people_count}"
-            send_telegram_message(bot_token, chat_id, message)
+            await send_once(bot_token, chat_id, message)
 
         try:
             os.remove(video_path)
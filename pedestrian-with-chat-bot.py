@@ -1,7 +1,9 @@
 import cv2
-from ultralytics import YOLO
+from frame_engine import FrameEngine
+from frame_sampler import FrameSampler
+from model_registry import get_model
 import numpy as np
-from telegram import Bot
+from telegram_notifier import TelegramNotifier
 import imaplib
 import email
 import os
@@ -12,22 +14,15 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-def send_telegram_message(bot_token, chat_id, message):
-    """Отправляет сообщение в Telegram."""
-    try:
-        bot = Bot(token=bot_token)
-        bot.send_message(chat_id=chat_id, text=message)
-        print("Сообщение в Telegram успешно отправлено!")
-    except Exception as e:
-        print(f"Ошибка отправки сообщения в Telegram: {e}")
-
-
 def sanitize_filename(filename):
     """Очищает имя файла от недопустимых символов."""
     return re.sub(r'[^\w\.\-]', '_', filename)
 
-async def download_email_attachments(imap_server, imap_email, imap_password, download_dir, video_extension='.mp4'):
-    """Скачивает вложения из почты и возвращает путь к первому видеофайлу и тему письма."""
+def download_email_attachments(imap_server, imap_email, imap_password, download_dir, video_extension='.mp4'):
+    """Скачивает вложения из почты и возвращает путь к первому видеофайлу и тему письма.
+
+    imaplib блокирует, поэтому из асинхронного кода функция вызывается через asyncio.to_thread.
+    """
     try:
         mail = imaplib.IMAP4_SSL(imap_server)
         mail.login(imap_email, imap_password)
@@ -74,7 +69,7 @@ async def download_email_attachments(imap_server, imap_email, imap_password, dow
 
 def detect_pedestrian_traffic(video_path):
     """Распознает пешеходный трафик в видео."""
-    model = YOLO("yolov8n.pt")
+    model = get_model("yolov8n.pt", tracker=None)
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print(f"Не удалось открыть видео {video_path}")
@@ -83,32 +78,28 @@ def detect_pedestrian_traffic(video_path):
     tracked_ids = set()
     line_y = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) / 2)
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        results = model(frame)
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
 
-        for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                b = box.xyxy[0]
-                cls = int(box.cls[0])
-                confidence = float(box.conf[0])
+    engine = FrameEngine(FrameSampler(cap, frame_skip=1), model)
+    for _, frame, r in engine:
+        boxes = r.boxes
+        for box in boxes:
+            b = box.xyxy[0]
+            cls = int(box.cls[0])
+            confidence = float(box.conf[0])
 
-                if cls == 0 and confidence > 0.5:
-                    x1, y1, x2, y2 = map(int, b)
-                    center_x = (x1 + x2) // 2
-                    center_y = (y1 + y2) // 2
-                    obj_id = hash((center_x, center_y))
+            if cls == 0 and confidence > 0.5:
+                x1, y1, x2, y2 = map(int, b)
+                center_x = (x1 + x2) // 2
+                center_y = (y1 + y2) // 2
+                obj_id = hash((center_x, center_y))
 
-                    if obj_id not in tracked_ids and center_y > line_y:
-                         tracked_ids.add(obj_id)
-                         cv2.rectangle(frame, (x1,y1), (x2,y2), (0,255,0), 2)
-                         cv2.putText(frame, f"Person", (x1,y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5,(0,255,0), 2)
+                if obj_id not in tracked_ids and center_y > line_y:
+                     tracked_ids.add(obj_id)
+                     cv2.rectangle(frame, (x1,y1), (x2,y2), (0,255,0), 2)
+                     cv2.putText(frame, f"Person", (x1,y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5,(0,255,0), 2)
 
-        cv2.line(frame, (0, line_y), (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), line_y), (0, 0, 255), 2)
+        cv2.line(frame, (0, line_y), (frame_width, line_y), (0, 0, 255), 2)
         cv2.putText(frame, f"People Count: {len(tracked_ids)}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
         cv2.imshow("Pedestrian Traffic", frame)
 
@@ -132,26 +123,31 @@ async def main():
     if not os.path.exists(download_dir):
         os.makedirs(download_dir)
 
-    while True:
-      video_path, video_filename = await download_email_attachments(imap_server, imap_email, imap_password, download_dir)
+    # Один отправитель на все время работы: пул соединений, лимиты частоты и повторы
+    notifier = await TelegramNotifier(bot_token).start()
+    try:
+        while True:
+          video_path, video_filename = await asyncio.to_thread(download_email_attachments, imap_server, imap_email, imap_password, download_dir)
 
-      if video_path:
-            people_count = detect_pedestrian_traffic(video_path)
-            if people_count is not None:
-                  message = f"Подсчет завершен.\n\
+          if video_path:
+                people_count = await asyncio.to_thread(detect_pedestrian_traffic, video_path)
+                if people_count is not None:
+                      message = f"Подсчет завершен.\n\
                            Файл: {video_filename}\n\
                            Количество пешеходов: {people_count}"
-                  send_telegram_message(bot_token, chat_id, message)
-
-            try:
-                  os.remove(video_path)
-                  print(f"Файл {video_path} удален")
-            except Exception as e:
-                print(f"Ошибка удаления файла: {e}")
-      else:
-          print("Новых видеофайлов с ключем не было получено. Ожидание...")
-
-      await asyncio.sleep(300) # Пауза 5 минут (300 секунд)
+                      notifier.send(chat_id, message)
+
+                try:
+                      os.remove(video_path)
+                      print(f"Файл {video_path} удален")
+                except Exception as e:
+                    print(f"Ошибка удаления файла: {e}")
+          else:
+              print("Новых видеофайлов с ключем не было получено. Ожидание...")
+
+          await asyncio.sleep(300) # Пауза 5 минут (300 секунд)
+    finally:
+        await notifier.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -1,152 +1,143 @@
 import cv2
-from ultralytics import YOLO
-from telegram import Bot
-import imaplib
-import email
+from batch_inference import TrackingDetector
+from counting import MIN_CONFIDENCE, LineCounter
+from frame_engine import FRAME_SIZE, FrameEngine, resize_frame
+from frame_ring import DEFAULT_MIN_PIXELS, shared_frame_source, wants_decode_process
+from frame_sampler import FrameSampler
+from imap_ingest import MailboxWatcher
+from job_queue import JobQueue, create_worker_pool, default_worker_count
+import metrics
+from metrics import format_timings
+from model_export import export_model
+from motion_gate import GatedDetector, MotionGate
+from result_cache import ResultCache
+from roi import LineRoi
+from segments import count_frames, merge_counts, plan_video_segments
+from telegram_notifier import TelegramNotifier
 import os
-import re
 import asyncio
+import signal
+from asyncio import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dotenv import load_dotenv
-import hashlib
 
 load_dotenv()
 
-async def send_telegram_message(bot_token, chat_id, message):
-    """Отправляет сообщение в Telegram."""
-    try:
-        bot = Bot(token=bot_token)
-        await bot.send_message(chat_id=chat_id, text=message)
-        print("Сообщение в Telegram успешно отправлено!")
-    except Exception as e:
-        print(f"Ошибка отправки сообщения в Telegram: {e}", exc_info=True)
-
-def sanitize_filename(filename):
-    """Очищает имя файла от недопустимых символов."""
-    return re.sub(r'[^\w\.\-]', '_', filename)
-
-def calculate_file_hash(file_path):
-    """Вычисляет SHA256 хеш файла."""
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        # Читаем файл по частям, чтобы не загрузить весь файл в память
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
-
-async def download_email_attachments(imap_server, imap_email, imap_password, download_dir, processed_hashes, video_extension='.mp4'):
-    """Скачивает вложения из почты и возвращает путь к первому видеофайлу и тему письма."""
-    try:
-        mail = imaplib.IMAP4_SSL(imap_server)
-        mail.login(imap_email, imap_password)
-        mail.select("inbox")
-
-        _, data = mail.search(None, "ALL")
-        for num in data[0].split():
-            _, data = mail.fetch(num, "(RFC822)")
-            msg = email.message_from_bytes(data[0][1])
-            subject = msg.get('Subject', 'Без темы')  # Получаем тему письма, если есть
-            if "new_video" in subject.lower():
-                for part in msg.walk():
-                    if part.get_content_maintype() == 'multipart':
-                        continue
-                    if part.get('Content-Disposition') is None:
-                        continue
-
-                    filename = part.get_filename()
-                    if filename and filename.lower().endswith(video_extension):
-                        sanitized_subject = sanitize_filename(subject)
-                        base_name, ext = os.path.splitext(filename)
-                        new_filename = f"{sanitized_subject}{ext}"
-                        file_path = os.path.join(download_dir, new_filename)
-                        with open(file_path, 'wb') as f:
-                            f.write(part.get_payload(decode=True))
-                        print(f"Файл {new_filename} скачан и сохранен в {download_dir}")
-
-                        file_hash = calculate_file_hash(file_path)
-                        if file_hash not in processed_hashes:
-                           print(f"Файл с хешем {file_hash} ещё не обрабатывался. Продолжаем обработку.")
-                           processed_hashes.add(file_hash)
-                           mail.close()
-                           mail.logout()
-                           return file_path, new_filename, processed_hashes
-                        else:
-                            print(f"Файл с хешем {file_hash} уже был обработан. Пропускаем.")
-                            try:
-                                os.remove(file_path)
-                                print(f"Файл {file_path} удален")
-                            except Exception as e:
-                                print(f"Ошибка удаления файла: {e}")
-                            mail.close()
-                            mail.logout()
-                            return None, None, processed_hashes
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "1"))
+SAMPLE_INTERVAL_SEC = float(os.getenv("SAMPLE_INTERVAL_SEC", "0.4")) # 10 кадров при 25 кадр/с
+QUEUE_DEPTH = int(os.getenv("QUEUE_DEPTH", "8"))
+DECODE_PROCESS = os.getenv("DECODE_PROCESS", "0") == "1" # декодирование в отдельном процессе, кадры через разделяемую память
+DECODE_PROCESS_MIN_PIXELS = int(os.getenv("DECODE_PROCESS_MIN_PIXELS", str(DEFAULT_MIN_PIXELS))) # только для видео с кадром не меньше (меньшие быстрее в потоке, 0 - для всех)
+LINE_X_RATIO = 0.25 # линия подсчета на четверти ширины кадра
+ROI_MARGIN = float(os.getenv("ROI_MARGIN", "0")) # инференс только в полосе ±ROI_MARGIN ширины кадра вокруг линии (0 - весь кадр)
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "0")) # доля изменившихся пикселей для инференса (0 - без проверки движения, обычно 0.002)
+MOTION_MAX_GAP = int(os.getenv("MOTION_MAX_GAP", "25")) # максимум пропущенных подряд кадров без движения
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "pytorch") # pytorch, onnx, onnx-int8 или openvino (экспорт выполняется один раз и кэшируется)
+MODEL_CALIBRATION_VIDEO = os.getenv("MODEL_CALIBRATION_VIDEO") # видео с кадрами для калибровки onnx-int8
+SEGMENT_MIN_SEC = float(os.getenv("SEGMENT_MIN_SEC", "0")) # видео длиннее стольких секунд считаются по сегментам параллельно (0 - целиком)
+SEGMENT_OVERLAP_SEC = float(os.getenv("SEGMENT_OVERLAP_SEC", "10")) # перекрытие сегментов: больше времени, за которое пешеход доходит до линии
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "20")) # максимум незавершенных заданий
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "0")) # 0 - по числу ядер и доступной памяти
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+RESULT_CACHE_MAX_AGE_DAYS = int(os.getenv("RESULT_CACHE_MAX_AGE_DAYS", "180"))
+TELEGRAM_COALESCE_SEC = float(os.getenv("TELEGRAM_COALESCE_SEC", "2")) # отчеты за это время уходят одним сообщением
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0")) # 0 - без HTTP-эндпоинта /metrics
+METRICS_JSON = os.getenv("METRICS_JSON") # файл для периодического дампа метрик
+METRICS_JSON_INTERVAL = float(os.getenv("METRICS_JSON_INTERVAL", "30"))
 
-            else:
-                print(f"Пропущено письмо с темой: {subject}. Не найден ключ 'new_video'.")
-                mail.close()
-                mail.logout()
-                return None, None, processed_hashes
-        mail.close()
-        mail.logout()
-        return None, None, processed_hashes
-
-    except Exception as e:
-        print(f"Ошибка загрузки вложений: {e}")
-        return None, None, processed_hashes
-
-
-def detect_pedestrian_traffic(video_path):
-    """Распознает пешеходный трафик в видео."""
-    model = YOLO("yolov8n.pt")
+# Параметры, от которых зависит результат подсчета: при их изменении кэш результатов сбрасывается
+COUNTING_PARAMS = {
+    "weights": "yolov8n.pt",
+    "model_backend": MODEL_BACKEND,
+    "calibration_video": MODEL_CALIBRATION_VIDEO if MODEL_BACKEND == "onnx-int8" else None,
+    "tracker": "bytetrack.yaml",
+    "min_confidence": MIN_CONFIDENCE,
+    "line_x_ratio": LINE_X_RATIO,
+    "roi_margin": ROI_MARGIN,
+    "motion_threshold": MOTION_THRESHOLD,
+    "motion_max_gap": MOTION_MAX_GAP,
+    "frame_size": FRAME_SIZE,
+    "sample_interval_sec": SAMPLE_INTERVAL_SEC,
+    "segment_min_sec": SEGMENT_MIN_SEC,
+    "segment_overlap_sec": SEGMENT_OVERLAP_SEC,
+}
+
+def detect_pedestrian_traffic(video_path, batch_size=BATCH_SIZE, timings=None, segment=None):
+    """Распознает пешеходный трафик в видео.
+
+    batch_size > 1 включает пакетный режим: выбранные кадры детектируются
+    пачками, а трекер получает детекции по порядку. В словарь timings,
+    если он передан, записывается время стадий конвейера. segment (Segment)
+    ограничивает подсчет частью видео: возвращаются только пересечения
+    внутри сегмента, а перекрытие перед ним служит для заведения треков.
+    """
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print(f"Не удалось открыть видео {video_path}")
         return None
 
-    all_tracked_ids = set()
-    line_x = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) / 4)
-    tracked_objects = {}
-    frame_count = 0
-    passed_people_count = 0
-    frame_skip = 10 # увеличили интервал между кадрами в 10 раз
+    line_x = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) * LINE_X_RATIO)
+    counter = LineCounter(line_x)
+    detector = TrackingDetector(batch_size, weights=export_model(COUNTING_PARAMS["weights"], MODEL_BACKEND,
+                                                                 MODEL_CALIBRATION_VIDEO))
+    roi = LineRoi.from_ratio(line_x, ROI_MARGIN)
+    preprocess, infer = (roi.crop, roi.wrap(detector)) if roi else (resize_frame, detector)
+    gate = MotionGate(MOTION_THRESHOLD, MOTION_MAX_GAP) if MOTION_THRESHOLD else None
+    if gate:
+        infer = GatedDetector(infer, gate)
+    shared = None
+    if DECODE_PROCESS and segment is None and wants_decode_process(cap, DECODE_PROCESS_MIN_PIXELS):
+        # Декодирует и уменьшает кадры дочерний процесс; cap нужен был только для ширины кадра
+        cap.release()
+        shared = shared_frame_source(video_path, SAMPLE_INTERVAL_SEC, roi, QUEUE_DEPTH, batch_size)
+        engine = FrameEngine(shared, shared.wrap(infer), batch_size=batch_size, queue_depth=QUEUE_DEPTH)
+    else:
+        sampler = FrameSampler(cap, SAMPLE_INTERVAL_SEC, start_frame=segment.start if segment else 0,
+                               end_frame=segment.end if segment else None)
+        engine = FrameEngine(sampler, infer, preprocess=preprocess, batch_size=batch_size, queue_depth=QUEUE_DEPTH)
 
+    result = count_frames(engine, counter, segment)
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        if frame_count % frame_skip == 0:
+    cap.release()
+    if shared:
+        shared.close()
+    detector.report()
+    if gate:
+        gate.report()
+    if timings is not None:
+        timings.update(engine.stage_seconds)
+    return result
 
-            frame = cv2.resize(frame, (640, 480)) # размер можно менять
-            results = model.track(frame, persist=True)
-            boxes = results[0].boxes.data.tolist()
-            tracks = results[0].boxes.id.tolist()
 
-            if not boxes or not tracks:
-                frame_count+=1
-                continue
-            for box, track in zip(boxes, tracks):
-                x1, y1, x2, y2, id_ = list(map(int, box[:4])) + [int(track)]
-                center_x = (x1 + x2) // 2
-                cls = int(box[5])
-                confidence = float(box[4])
-                if cls == 0 and confidence > 0.7:
-                    if id_ not in tracked_objects:
-                        tracked_objects[id_] = {
-                            "passed": False,
-                            "initial_x": center_x
-                        }
-                    if not tracked_objects[id_]["passed"] and center_x > tracked_objects[id_]["initial_x"] and center_x > line_x:
-                        all_tracked_ids.add(id_)
-                        tracked_objects[id_]["passed"] = True
-                        passed_people_count += 1
-        frame_count += 1
+def count_video(video_path, segment=None):
+    """Подсчет в процессе пула: возвращает результат, время стадий и метрики конвейера процесса."""
+    timings = {}
+    result = detect_pedestrian_traffic(video_path, timings=timings, segment=segment)
+    return result, timings, metrics.drain()
 
-    cap.release()
-    return len(all_tracked_ids), passed_people_count
+
+def report_result(notifier, chat_id, video_filename, result, from_cache=False, timings=None):
+    """Ставит в очередь отправки в Telegram отчет о подсчете пешеходов в видео."""
+    people_count, all_people_count = result
+    message = f"Подсчет завершен.\nФайл: {video_filename}\nКоличество уникальных пешеходов (за весь отрезок): {people_count}, Общее количество обнаруженных пешеходов: {all_people_count}"
+    if from_cache:
+        message += "\n(видео уже обрабатывалось, результат из кэша)"
+    summary = f" ({format_timings(timings)})" if timings else ""
+    print(f"Количество уникальных пешеходов (за весь отрезок): {people_count}, Общее количество обнаруженных пешеходов: {all_people_count}{summary}")
+    notifier.send(chat_id, message)
 
 
 async def main():
-    """Основная функция для получения почты, обработки видео и отправки отчета в Telegram."""
+    """Основная функция для получения почты, обработки видео и отправки отчета в Telegram.
+
+    Новые видео ставятся в очередь заданий, а подсчет ведет пул процессов,
+    поэтому пачка писем обрабатывается параллельно, а не по одному видео за цикл.
+    Прием почты и раздача заданий — отдельные задачи asyncio: блокирующие
+    вызовы IMAP выполняются в своем потоке, подсчет — в процессах пула,
+    а отчеты уходят через очередь TelegramNotifier, так что цикл событий
+    не простаивает ни на одном из них.
+    """
 
     imap_server = os.getenv("IMAP_SERVER")
     imap_email = os.getenv("IMAP_EMAIL")
@@ -158,26 +149,212 @@ async def main():
     if not os.path.exists(download_dir):
         os.makedirs(download_dir)
 
-    processed_hashes = set()
-    while True:
-        video_path, video_filename, processed_hashes = await download_email_attachments(imap_server, imap_email, imap_password, download_dir, processed_hashes)
+    metrics.start(METRICS_PORT, METRICS_JSON, METRICS_JSON_INTERVAL)
+    # Экспорт модели до запуска пула, чтобы процессы не экспортировали ее одновременно
+    await asyncio.to_thread(export_model, COUNTING_PARAMS["weights"], MODEL_BACKEND, MODEL_CALIBRATION_VIDEO)
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # Windows: остановка по KeyboardInterrupt
 
-        if video_path:
-            people_count, all_people_count = detect_pedestrian_traffic(video_path)
-            if people_count is not None:
-                message = f"Подсчет завершен.\nФайл: {video_filename}\nКоличество уникальных пешеходов (за весь отрезок): {people_count}, Общее количество обнаруженных пешеходов: {all_people_count}"
-                print(f"Количество уникальных пешеходов (за весь отрезок): {people_count}, Общее количество обнаруженных пешеходов: {all_people_count}")
-                await send_telegram_message(bot_token, chat_id, message)
+    watcher = MailboxWatcher(imap_server, imap_email, imap_password, download_dir)
+    cache = ResultCache(os.getenv("RESULT_CACHE_PATH") or os.path.join(download_dir, "results.sqlite3"),
+                        COUNTING_PARAMS, max_entries=RESULT_CACHE_MAX_ENTRIES,
+                        max_age_days=RESULT_CACHE_MAX_AGE_DAYS)
+    jobs = JobQueue(os.getenv("JOB_QUEUE_PATH") or os.path.join(download_dir, "jobs.sqlite3"),
+                    max_pending=JOB_QUEUE_SIZE)
+    workers = JOB_WORKERS or default_worker_count()
+    pool = create_worker_pool(workers, collect_metrics=metrics.METRICS.enabled)
+    # imaplib не потокобезопасен, поэтому все обращения к почте идут через один поток
+    imap_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="imap")
+    notifier = await TelegramNotifier(bot_token, coalesce_window=TELEGRAM_COALESCE_SEC).start()
+    jobs_added = asyncio.Event()
+    slot_freed = asyncio.Event()
+    download_timings = {}  # путь к видео -> время загрузки и хеширования
+    duplicates = {}  # id задания -> имена повторно присланных файлов с тем же видео
 
+    def accept(received):
+        """Ставит скачанные видео в очередь заданий или отвечает результатом из кэша.
+
+        Видео, которое уже ждет подсчета или считается, в очередь не ставится:
+        файл присоединяется к этому заданию и получает его результат.
+
+        Только после этого письма отмечаются просмотренными (watcher.commit()):
+        видео, скачанное перед падением процесса, будет скачано заново, а не потеряно.
+        """
+        for video_path, video_filename, file_hash in received:
+            timings = watcher.pop_timings(video_path)
+            result = cache.get(file_hash)
+            metrics.inc("cache_lookups", result="miss" if result is None else "hit")
+            active_job = jobs.find_active(file_hash) if result is None else None
+            if result is None and active_job is None:
+                download_timings[video_path] = timings
+                print(f"Файл с хешем {file_hash} ещё не обрабатывался. Продолжаем обработку.")
+                jobs.add(video_path, video_filename, file_hash)
+                jobs_added.set()
+                continue
+            if active_job is not None:
+                print(f"Файл с хешем {file_hash} уже в обработке (задание {active_job}). Дождемся его результата.")
+                duplicates.setdefault(active_job, []).append(video_filename)
+            else:
+                print(f"Файл с хешем {file_hash} уже был обработан. Используем сохраненный результат.")
+                report_result(notifier, chat_id, video_filename, result, from_cache=True)
             try:
                 os.remove(video_path)
                 print(f"Файл {video_path} удален")
             except Exception as e:
                 print(f"Ошибка удаления файла: {e}")
-        else:
-            print("Новых видеофайлов с ключем не было получено. Ожидание...")
+        watcher.commit()
+
+    async def ingest():
+        """Принимает новые письма, пока в очереди заданий есть место."""
+        while True:
+            free_slots = jobs.free_slots()
+            if not free_slots:
+                slot_freed.clear()
+                await slot_freed.wait()
+                continue
+            # SHA-256 считается при загрузке вложения, без повторного чтения файла
+            poll = loop.run_in_executor(imap_executor, watcher.poll, free_slots)
+            try:
+                received = await asyncio.shield(poll)
+            except asyncio.CancelledError:
+                # Остановка: опрос прерван watcher.interrupt(), уже скачанные видео не теряем
+                accept(await poll)
+                raise
+            accept(received)
+            if not received:
+                print("Новых видеофайлов с ключем не было получено. Ожидание...")
+                # При поддержке IDLE ждем уведомления от сервера, иначе опрашиваем раз в 30 секунд
+                await loop.run_in_executor(imap_executor, watcher.wait_for_new, 30)
+
+    async def count_in_pool(*args):
+        """Запускает count_video в пуле и переносит метрики процесса пула в реестр (/metrics, JSON).
+
+        Если процесс пула упал (нехватка памяти, сбой в cv2 или torch), пул
+        больше не принимает задач: он заменяется новым, а BrokenProcessPool
+        пробрасывается, чтобы задание вернулось в очередь.
+        """
+        nonlocal pool
+        used = pool
+        try:
+            result, timings, worker_metrics = await loop.run_in_executor(used, count_video, *args)
+        except BrokenProcessPool:
+            # Задания, бывшие в сломанном пуле, получают ту же ошибку: пул пересоздает первое из них
+            if pool is used:
+                print("Процесс пула аварийно завершился, пул перезапускается")
+                metrics.inc("pool_restarts")
+                used.shutdown(wait=False, cancel_futures=True)
+                pool = create_worker_pool(workers, collect_metrics=metrics.METRICS.enabled)
+            raise
+        metrics.merge(worker_metrics)
+        return result, timings
 
-        await asyncio.sleep(30)
+    async def count_job(job):
+        """Считает видео задания целиком или, если оно длинное, сегментами в нескольких процессах пула."""
+        segments = []
+        if SEGMENT_MIN_SEC:
+            segments = await asyncio.to_thread(plan_video_segments, job.file_path, workers, SAMPLE_INTERVAL_SEC,
+                                               SEGMENT_MIN_SEC, SEGMENT_OVERLAP_SEC)
+        if not segments:
+            return await count_in_pool(job.file_path)
+        print(f"Файл {job.filename} делится на {len(segments)} сегментов")
+        # Сегменты встают в общую очередь пула; задание занимает один слот диспетчера,
+        # поэтому следующие задания ждут, пока освободятся процессы
+        parts = await asyncio.gather(*(count_in_pool(job.file_path, segment) for segment in segments))
+        if any(result is None for result, _ in parts):
+            return None, {}
+        timings = {}
+        for _, part_timings in parts:
+            for stage, seconds in part_timings.items():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+        return merge_counts([result for result, _ in parts]), timings
+
+    async def run_job(job, idle_workers):
+        """Считает пешеходов в видео задания в процессе пула."""
+        try:
+            try:
+                result, timings = await count_job(job)
+                error = "не удалось открыть видео"
+            except BrokenProcessPool:
+                # Попытка не засчитывается, иначе после падения пула задания удалялись бы одно за другим
+                jobs.requeue(job)
+                metrics.inc("jobs", status="requeued")
+                print(f"Обработка файла {job.filename} прервана падением процесса пула. Повторим.")
+                return
+            except Exception as e:
+                result, timings = None, {}
+                error = e
+            if result is None:
+                final = jobs.fail(job, error)
+                metrics.inc("jobs", status="failed" if final else "retried")
+                print(f"Ошибка обработки файла {job.filename}: {error}" + ("" if final else ". Повторим позже."))
+                if final:
+                    download_timings.pop(job.file_path, None)
+                    for filename in duplicates.pop(job.id, []):
+                        print(f"Ошибка обработки файла {filename}: {error}")
+                return
+            # Задания после перезапуска не имеют времени загрузки — в сводке только стадии подсчета
+            timings = {**download_timings.pop(job.file_path, {}), **timings}
+            for stage, seconds in timings.items():
+                metrics.observe("job_stage", seconds, stage=stage)
+            metrics.inc("jobs", status="done")
+            cache.put(job.file_hash, result)
+            jobs.complete(job, result)
+            report_result(notifier, chat_id, job.filename, result, timings=timings)
+            for filename in duplicates.pop(job.id, []):
+                report_result(notifier, chat_id, filename, result, from_cache=True)
+        finally:
+            idle_workers.release()
+            slot_freed.set()
+            jobs_added.set()  # упавшее задание могло вернуться в очередь
+
+    async def dispatch():
+        """Раздает задания из очереди процессам пула по мере их освобождения."""
+        idle_workers = asyncio.Semaphore(workers)
+        running = set()
+        try:
+            while True:
+                await idle_workers.acquire()
+                jobs_added.clear()
+                claimed = jobs.claim(1)
+                while not claimed:
+                    await jobs_added.wait()
+                    jobs_added.clear()
+                    claimed = jobs.claim(1)
+                task = asyncio.create_task(run_job(claimed[0], idle_workers))
+                running.add(task)
+                task.add_done_callback(running.discard)
+        finally:
+            # Прерванные задания остаются в статусе running и вернутся в очередь при следующем запуске
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    tasks = [asyncio.create_task(ingest()), asyncio.create_task(dispatch())]
+    stopped = asyncio.create_task(stop.wait())
+    print(f"Запущено обработчиков: {workers}")
+    try:
+        done, _ = await asyncio.wait([*tasks, stopped], return_when=FIRST_COMPLETED)
+        for task in done:
+            task.result()  # пробрасываем ошибку упавшей задачи
+        print("Остановка по сигналу...")
+    finally:
+        watcher.interrupt()
+        for task in [*tasks, stopped]:
+            task.cancel()
+        await asyncio.gather(*tasks, stopped, return_exceptions=True)
+        # Готовые отчеты отправляем до выхода
+        await notifier.close()
+        pool.shutdown(wait=False, cancel_futures=True)
+        imap_executor.shutdown(wait=True)
+        watcher.close()
+        cache.close()
+        jobs.close()
+        metrics.stop()
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -1,7 +1,17 @@
 import cv2
 import requests
-from ultralytics import YOLO
-from telegram import Bot
+from batch_inference import TrackingDetector
+from counting import LineCounter
+from frame_engine import FrameEngine, resize_frame
+from frame_ring import DEFAULT_MIN_PIXELS, shared_frame_source, wants_decode_process
+from frame_sampler import FrameSampler
+import metrics
+from metrics import format_timings
+from model_export import export_model
+from motion_gate import GatedDetector, MotionGate
+from progressive_download import ProgressiveSource
+from roi import LineRoi
+from telegram_notifier import send_once
 import os
 import re
 import asyncio
@@ -9,17 +19,25 @@ from dotenv import load_dotenv
 import hashlib
 import signal
 import tempfile
+import threading
+from urllib.parse import urlparse
 
 load_dotenv()
 
-async def send_telegram_message(bot_token, chat_id, message):
-    """Отправляет сообщение в Telegram."""
-    try:
-        bot = Bot(token=bot_token)
-        await bot.send_message(chat_id=chat_id, text=message)
-        print("Сообщение в Telegram успешно отправлено!")
-    except Exception as e:
-        print(f"Ошибка отправки сообщения в Telegram: {e}", exc_info=True)
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "1"))
+SAMPLE_INTERVAL_SEC = float(os.getenv("SAMPLE_INTERVAL_SEC", "0.4")) # 10 кадров при 25 кадр/с
+QUEUE_DEPTH = int(os.getenv("QUEUE_DEPTH", "8"))
+DECODE_PROCESS = os.getenv("DECODE_PROCESS", "0") == "1" # декодирование в отдельном процессе, кадры через разделяемую память
+DECODE_PROCESS_MIN_PIXELS = int(os.getenv("DECODE_PROCESS_MIN_PIXELS", str(DEFAULT_MIN_PIXELS))) # только для видео с кадром не меньше (меньшие быстрее в потоке, 0 - для всех)
+ROI_MARGIN = float(os.getenv("ROI_MARGIN", "0")) # инференс только в полосе ±ROI_MARGIN ширины кадра вокруг линии (0 - весь кадр)
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "0")) # доля изменившихся пикселей для инференса (0 - без проверки движения, обычно 0.002)
+MOTION_MAX_GAP = int(os.getenv("MOTION_MAX_GAP", "25")) # максимум пропущенных подряд кадров без движения
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "pytorch") # pytorch, onnx, onnx-int8 или openvino (экспорт выполняется один раз и кэшируется)
+MODEL_CALIBRATION_VIDEO = os.getenv("MODEL_CALIBRATION_VIDEO") # видео с кадрами для калибровки onnx-int8
+STREAM_DOWNLOAD = os.getenv("STREAM_DOWNLOAD", "1") == "1" # обрабатывать видео во время загрузки
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0")) # 0 - без HTTP-эндпоинта /metrics
+METRICS_JSON = os.getenv("METRICS_JSON") # файл для периодического дампа метрик
+METRICS_JSON_INTERVAL = float(os.getenv("METRICS_JSON_INTERVAL", "30"))
 
 def sanitize_filename(filename):
     """Очищает имя файла от недопустимых символов."""
@@ -51,56 +69,53 @@ def download_video_from_url(url):
         print(f"Ошибка загрузки видео по ссылке: {e}")
         return None
     
-def detect_pedestrian_traffic_from_url(video_path):
-    """Распознает пешеходный трафик в видео."""
-    model = YOLO("yolov8n.pt")
+def detect_pedestrian_traffic_from_url(video_path, batch_size=BATCH_SIZE, stop=None, timings=None):
+    """Распознает пешеходный трафик в видео.
+
+    batch_size > 1 включает пакетный режим: выбранные кадры детектируются
+    пачками, а трекер получает детекции по порядку. stop — threading.Event,
+    по которому подсчет завершается досрочно с уже накопленным результатом.
+    В словарь timings, если он передан, записывается время стадий конвейера.
+    """
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print(f"Не удалось открыть видео {video_path}")
         return None, None
 
-    all_tracked_ids = set()
     line_x = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) / 4)
-    tracked_objects = {}
-    frame_count = 0
-    passed_people_count = 0
-    frame_skip = 10
+    counter = LineCounter(line_x)
+    detector = TrackingDetector(batch_size, weights=export_model("yolov8n.pt", MODEL_BACKEND, MODEL_CALIBRATION_VIDEO))
+    roi = LineRoi.from_ratio(line_x, ROI_MARGIN)
+    preprocess, infer = (roi.crop, roi.wrap(detector)) if roi else (resize_frame, detector)
+    gate = MotionGate(MOTION_THRESHOLD, MOTION_MAX_GAP) if MOTION_THRESHOLD else None
+    if gate:
+        infer = GatedDetector(infer, gate)
+    shared = None
+    if DECODE_PROCESS and wants_decode_process(cap, DECODE_PROCESS_MIN_PIXELS):
+        # Декодирует и уменьшает кадры дочерний процесс; cap нужен был только для ширины кадра
+        cap.release()
+        shared = shared_frame_source(video_path, SAMPLE_INTERVAL_SEC, roi, QUEUE_DEPTH, batch_size)
+        engine = FrameEngine(shared, shared.wrap(infer), batch_size=batch_size, queue_depth=QUEUE_DEPTH)
+    else:
+        engine = FrameEngine(FrameSampler(cap, SAMPLE_INTERVAL_SEC), infer, preprocess=preprocess,
+                             batch_size=batch_size, queue_depth=QUEUE_DEPTH)
 
     try:
-      while True:
-          ret, frame = cap.read()
-          if not ret:
+      for _, _, boxes in engine:
+          if stop is not None and stop.is_set():
+              print("Обработка видеопотока остановлена пользователем.")
               break
-          if frame_count % frame_skip == 0:
-              frame = cv2.resize(frame, (640, 480))
-              results = model.track(frame, persist=True)
-              boxes = results[0].boxes.data.tolist()
-              tracks = results[0].boxes.id.tolist()
-
-              if not boxes or not tracks:
-                  frame_count += 1
-                  continue
-              for box, track in zip(boxes, tracks):
-                  x1, _, x2, _, id_ = list(map(int, box[:4])) + [int(track)]
-                  center_x = (x1 + x2) // 2
-                  cls = int(box[5])
-                  confidence = float(box[4])
-                  if cls == 0 and confidence > 0.7:
-                      if id_ not in tracked_objects:
-                          tracked_objects[id_] = {
-                              "passed": False,
-                              "initial_x": center_x
-                          }
-                      if not tracked_objects[id_]["passed"] and center_x > tracked_objects[id_]["initial_x"] and center_x > line_x:
-                          all_tracked_ids.add(id_)
-                          tracked_objects[id_]["passed"] = True
-                          passed_people_count += 1
-          frame_count += 1
-    except KeyboardInterrupt:
-       print("Обработка видеопотока остановлена пользователем.")
+          counter.update(boxes)
     finally:
       cap.release()
-    return len(all_tracked_ids), passed_people_count
+      if shared:
+          shared.close()
+    detector.report()
+    if gate:
+        gate.report()
+    if timings is not None:
+        timings.update(engine.stage_seconds)
+    return counter.counts()
 
 
 async def main():
@@ -109,16 +124,45 @@ async def main():
     bot_token = os.getenv("BOT_TOKEN")
     chat_id = os.getenv("CHAT_ID")
 
+    metrics.start(METRICS_PORT, METRICS_JSON, METRICS_JSON_INTERVAL)
+    # Ctrl+C завершает подсчет, и накопленный результат все равно отправляется
+    stop = threading.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGINT, stop.set)
+    except NotImplementedError:
+        pass  # Windows: остановка по KeyboardInterrupt
 
-    video_path = download_video_from_url(video_url)
-    if video_path:
-        people_count, all_people_count = detect_pedestrian_traffic_from_url(video_path)
-        if people_count is not None:
-            message = f"Подсчет завершен.\nКоличество уникальных пешеходов: {people_count}, Общее количество обнаруженных пешеходов: {all_people_count}"
-            print(f"Количество уникальных пешеходов: {people_count}, Общее количество обнаруженных пешеходов: {all_people_count}")
-            await send_telegram_message(bot_token, chat_id, message)
-    else:
-        print("Не удалось обработать видеопоток. Проверьте URL камеры и ее доступность.")
+    # Загрузка и подсчет блокируют, поэтому выполняются в потоках, а не в цикле событий
+    source = None
+    try:
+        if STREAM_DOWNLOAD:
+            # Обработка начинается, не дожидаясь окончания загрузки (если контейнер это позволяет)
+            suffix = os.path.splitext(urlparse(video_url).path)[1] or ".mp4"
+            source = ProgressiveSource(video_url, suffix=suffix)
+            video_path = await asyncio.to_thread(source.open)
+        else:
+            video_path = await asyncio.to_thread(download_video_from_url, video_url)
+        if video_path:
+            timings = {}
+            people_count, all_people_count = await asyncio.to_thread(
+                detect_pedestrian_traffic_from_url, video_path, BATCH_SIZE, stop, timings)
+            if source is not None and people_count is not None:
+                try:
+                    source.check()
+                except IOError as e:
+                    # Подсчет по обрывку видео занизил бы результат, поэтому он не отправляется
+                    print(f"{e}. Подсчет не отправлен.")
+                    people_count = None
+            if people_count is not None:
+                message = f"Подсчет завершен.\nКоличество уникальных пешеходов: {people_count}, Общее количество обнаруженных пешеходов: {all_people_count}"
+                print(f"Количество уникальных пешеходов: {people_count}, Общее количество обнаруженных пешеходов: {all_people_count} ({format_timings(timings)})")
+                await send_once(bot_token, chat_id, message)
+        else:
+            print("Не удалось обработать видеопоток. Проверьте URL камеры и ее доступность.")
+    finally:
+        if source is not None:
+            await asyncio.to_thread(source.close)
+        metrics.stop()
 
 
 
@@ -0,0 +1,86 @@
+import metrics
+from model_export import export_model
+from multi_camera import MultiCameraEngine, load_camera_sources
+from telegram_notifier import send_once
+from zones import format_zone_counts, load_zones
+import os
+import asyncio
+import signal
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "8"))
+SAMPLE_INTERVAL_SEC = float(os.getenv("SAMPLE_INTERVAL_SEC", "0.4")) # 10 кадров при 25 кадр/с
+QUEUE_DEPTH = int(os.getenv("QUEUE_DEPTH", "8"))
+TRACK_TTL_FRAMES = int(os.getenv("TRACK_TTL_FRAMES", "300"))
+MAX_TRACKS = int(os.getenv("MAX_TRACKS", "10000"))
+ROI_MARGIN = float(os.getenv("ROI_MARGIN", "0")) # инференс только в полосе ±ROI_MARGIN ширины кадра вокруг линии (0 - весь кадр)
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "0")) # доля изменившихся пикселей для инференса (0 - без проверки движения, обычно 0.002)
+MOTION_MAX_GAP = int(os.getenv("MOTION_MAX_GAP", "25")) # максимум пропущенных подряд кадров без движения
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "pytorch") # pytorch, onnx, onnx-int8 или openvino (экспорт выполняется один раз и кэшируется)
+MODEL_CALIBRATION_VIDEO = os.getenv("MODEL_CALIBRATION_VIDEO") # видео с кадрами для калибровки onnx-int8
+ZONES_FILE = os.getenv("ZONES_FILE") # JSON с линиями и многоугольниками подсчета по камерам (см. zones.load_zones)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0")) # 0 - без HTTP-эндпоинта /metrics
+METRICS_JSON = os.getenv("METRICS_JSON") # файл для периодического дампа метрик
+METRICS_JSON_INTERVAL = float(os.getenv("METRICS_JSON_INTERVAL", "30"))
+
+def create_engine(sources):
+    """Создает движок, распознающий пешеходный трафик сразу на нескольких камерах одной моделью."""
+    return MultiCameraEngine(sources, batch_size=BATCH_SIZE, queue_depth=QUEUE_DEPTH,
+                             interval_sec=SAMPLE_INTERVAL_SEC, ttl_frames=TRACK_TTL_FRAMES,
+                             max_tracks=MAX_TRACKS, roi_margin=ROI_MARGIN,
+                             motion_threshold=MOTION_THRESHOLD, motion_max_gap=MOTION_MAX_GAP,
+                             zones=load_zones(ZONES_FILE) if ZONES_FILE else None,
+                             weights=export_model("yolov8n.pt", MODEL_BACKEND, MODEL_CALIBRATION_VIDEO))
+
+
+def detect_pedestrian_traffic_multicam(engine):
+    """Обрабатывает камеры до конца потоков или остановки и возвращает счетчики, зоны и статистику."""
+    engine.run()
+    return engine.counts(), engine.zone_counts(), engine.stats()
+
+
+async def main():
+    """Основная функция для обработки нескольких камер и отправки отчета в Telegram."""
+    bot_token = os.getenv("BOT_TOKEN")
+    chat_id = os.getenv("CHAT_ID")
+    # Список камер: через запятую в CAMERA_SOURCES или по одной на строку в файле CAMERA_SOURCES_FILE
+    sources = load_camera_sources(os.getenv("CAMERA_SOURCES"), os.getenv("CAMERA_SOURCES_FILE"))
+    if not sources:
+        print("Не задан ни один источник камеры (CAMERA_SOURCES или CAMERA_SOURCES_FILE).")
+        return
+
+    metrics.start(METRICS_PORT, METRICS_JSON, METRICS_JSON_INTERVAL)
+    engine = create_engine(sources)
+    loop = asyncio.get_running_loop()
+
+    def request_stop():
+        print("Обработка видеопотоков остановлена пользователем.")
+        # Потоки камер дождется run() в потоке инференса, цикл событий не блокируется
+        engine.stop(wait=False)
+
+    try:
+        loop.add_signal_handler(signal.SIGINT, request_stop)
+    except NotImplementedError:
+        pass  # Windows: остановка по KeyboardInterrupt
+    # Инференс идет в отдельном потоке, чтобы не блокировать цикл событий
+    counts, zone_counts, stats = await asyncio.to_thread(detect_pedestrian_traffic_multicam, engine)
+    metrics.stop()
+    if not counts:
+        print("Не удалось получить данные о пешеходах.")
+        return
+
+    lines = []
+    for name, (people_count, all_people_count) in counts.items():
+        lines.append(f"{name} ({stats[name]['source']}): уникальных пешеходов: {people_count}, "
+                     f"всего обнаружено: {all_people_count}, {stats[name]['fps']} кадр/с")
+        if zone_counts.get(name):
+            lines.append(f"  зоны: {format_zone_counts(zone_counts[name])}")
+    message = "Подсчет завершен.\n" + "\n".join(lines)
+    print(message)
+    await send_once(bot_token, chat_id, message)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
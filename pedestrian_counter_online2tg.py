@@ -1,69 +1,131 @@
 import cv2
-from ultralytics import YOLO
-from telegram import Bot
+from batch_inference import TrackingDetector
+from count_series import TrafficAggregator, append_summary, format_summary, traffic_columns, traffic_totals
+from counting import LineCounter
+from frame_engine import FrameEngine, resize_frame
+from frame_sampler import FrameSampler
+from live_grabber import LiveFrameGrabber
+import metrics
+from model_export import export_model
+from motion_gate import GatedDetector, MotionGate
+from roi import LineRoi
+from telegram_notifier import TelegramNotifier
+from zones import ZoneCounter, format_zone_counts, load_zones, zones_for_camera
 import os
 import asyncio
+import signal
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
-async def send_telegram_message(bot_token, chat_id, message):
-    """Отправляет сообщение в Telegram."""
-    try:
-        bot = Bot(token=bot_token)
-        await bot.send_message(chat_id=chat_id, text=message)
-        print("Сообщение в Telegram успешно отправлено!")
-    except Exception as e:
-        print(f"Ошибка отправки сообщения в Telegram: {e}", exc_info=True)
+SAMPLE_INTERVAL_SEC = float(os.getenv("SAMPLE_INTERVAL_SEC", "0.4")) # 10 кадров при 25 кадр/с
+QUEUE_DEPTH = int(os.getenv("QUEUE_DEPTH", "8"))
+LIVE_MODE = os.getenv("LIVE_MODE", "auto") # 1 - всегда брать самый свежий кадр потока, 0 - читать кадры подряд, auto - по типу источника
+ROI_MARGIN = float(os.getenv("ROI_MARGIN", "0")) # инференс только в полосе ±ROI_MARGIN ширины кадра вокруг линии (0 - весь кадр)
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "0")) # доля изменившихся пикселей для инференса (0 - без проверки движения, обычно 0.002)
+MOTION_MAX_GAP = int(os.getenv("MOTION_MAX_GAP", "25")) # максимум пропущенных подряд кадров без движения
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "pytorch") # pytorch, onnx, onnx-int8 или openvino (экспорт выполняется один раз и кэшируется)
+MODEL_CALIBRATION_VIDEO = os.getenv("MODEL_CALIBRATION_VIDEO") # видео с кадрами для калибровки onnx-int8
+TRACK_TTL_FRAMES = int(os.getenv("TRACK_TTL_FRAMES", "300")) # треки, не встречавшиеся дольше, вытесняются
+MAX_TRACKS = int(os.getenv("MAX_TRACKS", "10000"))
+ZONES_FILE = os.getenv("ZONES_FILE") # JSON с линиями и многоугольниками подсчета (см. zones.load_zones)
+REPORT_INTERVAL_SEC = float(os.getenv("REPORT_INTERVAL_SEC", "0")) # сводка в Telegram и REPORT_FILE каждые N секунд без остановки потока (0 - только итог)
+REPORT_FILE = os.getenv("REPORT_FILE") # файл JSON Lines со сводками и счетчиками по минутам
+STATS_EVERY_FRAMES = 1000
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0")) # 0 - без HTTP-эндпоинта /metrics
+METRICS_JSON = os.getenv("METRICS_JSON") # файл для периодического дампа метрик
+METRICS_JSON_INTERVAL = float(os.getenv("METRICS_JSON_INTERVAL", "30"))
+
+def is_live_source(video_source):
+    """Определяет, включать ли живой режим для источника (по LIVE_MODE)."""
+    if LIVE_MODE == "auto":
+        return not os.path.isfile(str(video_source))
+    return LIVE_MODE == "1"
+
+
+def detect_pedestrian_traffic(video_source, stop=None, zone_counter=None, aggregator=None):
+    """Распознает пешеходный трафик в видео.
 
+    stop — threading.Event, по которому подсчет завершается досрочно
+    с уже накопленным результатом. zone_counter — ZoneCounter, который
+    получает те же треки, что и линия подсчета; ROI при нем не
+    используется, так как зоны могут быть в любом месте кадра.
+    aggregator — TrafficAggregator, в который после каждого кадра
+    записываются накопительные счетчики для периодических сводок.
 
-def detect_pedestrian_traffic(video_source):
-    """Распознает пешеходный трафик в видео."""
-    model = YOLO("yolov8n.pt")
+    Для живых потоков кадры берет LiveFrameGrabber: обрабатывается самый
+    свежий кадр, а частота выборки подстраивается под скорость инференса,
+    чтобы подсчет не отставал.
+    """
     cap = cv2.VideoCapture(video_source)
     if not cap.isOpened():
         print(f"Не удалось открыть видео {video_source}")
         return None
 
-    all_tracked_ids = set()
     line_x = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) / 4)
-    tracked_objects = {}
-    frame_count = 0
-    passed_people_count = 0
-    frame_skip = 10 # увеличили интервал между кадрами в 10 раз
+    counter = LineCounter(line_x, ttl_frames=TRACK_TTL_FRAMES, max_tracks=MAX_TRACKS)
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
+    detector = TrackingDetector(weights=export_model("yolov8n.pt", MODEL_BACKEND, MODEL_CALIBRATION_VIDEO))
+    roi = LineRoi.from_ratio(line_x, ROI_MARGIN) if zone_counter is None else None
+    preprocess, infer = (roi.crop, roi.wrap(detector)) if roi else (resize_frame, detector)
+    gate = MotionGate(MOTION_THRESHOLD, MOTION_MAX_GAP) if MOTION_THRESHOLD else None
+    if gate:
+        infer = GatedDetector(infer, gate)
+    # stop передается и источнику кадров: если поток завис и кадры не приходят,
+    # подсчет все равно завершается по Ctrl+C
+    grabber = LiveFrameGrabber(cap, SAMPLE_INTERVAL_SEC, stop) if is_live_source(video_source) else None
+    if grabber:
+        # Очередь в один кадр: кадры не ждут инференса и не устаревают
+        engine = FrameEngine(grabber, grabber.wrap(infer), preprocess=preprocess, queue_depth=1)
+    else:
+        engine = FrameEngine(FrameSampler(cap, SAMPLE_INTERVAL_SEC, stop=stop), infer, preprocess=preprocess,
+                             queue_depth=QUEUE_DEPTH)
+    for index, _, boxes in engine:
+        if stop is not None and stop.is_set():
+            if grabber:
+                grabber.stop()
             break
-        if frame_count % frame_skip == 0:
-            frame = cv2.resize(frame, (640, 480)) # размер можно менять
-            results = model.track(frame, persist=True)
-            boxes = results[0].boxes.data.tolist()
-            tracks = results[0].boxes.id.tolist()
-
-            if not boxes or not tracks:
-                frame_count+=1
-                continue
-            for box, track in zip(boxes, tracks):
-                x1, y1, x2, y2, id_ = list(map(int, box[:4])) + [int(track)]
-                center_x = (x1 + x2) // 2
-                cls = int(box[5])
-                confidence = float(box[4])
-                if cls == 0 and confidence > 0.7:
-                    if id_ not in tracked_objects:
-                        tracked_objects[id_] = {
-                            "passed": False,
-                            "initial_x": center_x
-                        }
-                    if not tracked_objects[id_]["passed"] and center_x > tracked_objects[id_]["initial_x"] and center_x > line_x:
-                        all_tracked_ids.add(id_)
-                        tracked_objects[id_]["passed"] = True
-                        passed_people_count += 1
-        frame_count += 1
-
-    cap.release()
-    return len(all_tracked_ids), passed_people_count
+        counter.update(boxes)
+        if zone_counter is not None:
+            zone_counter.update(boxes)
+        if aggregator is not None:
+            aggregator.record(traffic_totals(counter, zone_counter))
+        if grabber:
+            grabber.mark_counted(index)
+        if counter.frame_index % STATS_EVERY_FRAMES == 0:
+            stats = counter.stats()
+            metrics.gauge("live_tracks", stats["live_tracks"])
+            print(f"Живых треков: {stats['live_tracks']}, вытеснено: {stats['evicted_tracks']}, "
+                  f"память треков: {stats['memory_bytes']} байт")
+            if grabber:
+                grabber.report()
+
+    if stop is not None and stop.is_set():
+        print("Обработка видеопотока остановлена пользователем.")
+    # Зависший cap.read() еще использует cap; поток daemon и завершится вместе с процессом
+    if not (grabber and grabber.reading):
+        cap.release()
+    if grabber:
+        grabber.report()
+    detector.report()
+    if gate:
+        gate.report()
+    return counter.counts()
+
+async def report_periodically(aggregator, notifier, chat_id, interval):
+    """Каждые interval секунд ставит сводку в очередь notifier и дописывает ее в REPORT_FILE."""
+    while True:
+        await asyncio.sleep(interval)
+        summary = aggregator.flush()
+        try:
+            if REPORT_FILE:
+                await asyncio.to_thread(append_summary, REPORT_FILE, summary)
+            notifier.send(chat_id, format_summary(summary))
+        except Exception as e:
+            # Ошибка отчета не должна останавливать подсчет: следующая сводка придет по расписанию
+            print(f"Не удалось отправить сводку: {e}")
+
 
 async def main():
     """Основная функция для получения почты, обработки видео и отправки отчета в Telegram."""
@@ -71,15 +133,46 @@ async def main():
     chat_id = os.getenv("CHAT_ID")
     video_source = os.getenv("VIDEO_SOURCE")  # Получаем URL потока из .env
 
-    result = detect_pedestrian_traffic(video_source) # вызываем функцию и сохраняем результат
+    metrics.start(METRICS_PORT, METRICS_JSON, METRICS_JSON_INTERVAL)
+    # Ctrl+C завершает подсчет, и накопленный результат все равно отправляется
+    stop = threading.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGINT, stop.set)
+    except NotImplementedError:
+        pass  # Windows: остановка по KeyboardInterrupt
+    zones = zones_for_camera(load_zones(ZONES_FILE), video_source) if ZONES_FILE else []
+    zone_counter = ZoneCounter(zones, ttl_frames=TRACK_TTL_FRAMES, max_tracks=MAX_TRACKS) if zones else None
+    aggregator = TrafficAggregator(traffic_columns(zone_counter)) if REPORT_INTERVAL_SEC or REPORT_FILE else None
+    # Один отправитель на все сводки и итоговый отчет: общий пул соединений, очередь и лимиты частоты
+    notifier = await TelegramNotifier(bot_token).start()
+    reporter = None
+    if REPORT_INTERVAL_SEC:
+        reporter = asyncio.create_task(report_periodically(aggregator, notifier, chat_id, REPORT_INTERVAL_SEC))
+    try:
+        # Подсчет идет в отдельном потоке, чтобы не блокировать цикл событий
+        try:
+            result = await asyncio.to_thread(detect_pedestrian_traffic, video_source, stop, zone_counter, aggregator)
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+        metrics.stop()
+        if aggregator is not None and REPORT_FILE:
+            append_summary(REPORT_FILE, aggregator.flush())
 
-    if result is not None:  # Проверяем, не является ли результат None
-        people_count, all_people_count = result  # распаковываем результат, если он не None
-        message = f"Подсчет завершен.\nКоличество уникальных пешеходов (за весь отрезок): {people_count}, Общее количество обнаруженных пешеходов: {all_people_count}"
-        print(f"Количество уникальных пешеходов (за весь отрезок): {people_count}, Общее количество обнаруженных пешеходов: {all_people_count}")
-        await send_telegram_message(bot_token, chat_id, message)
-    else:
-        print("Не удалось получить данные о пешеходах.")
+        if result is not None:  # Проверяем, не является ли результат None
+            people_count, all_people_count = result  # распаковываем результат, если он не None
+            message = f"Подсчет завершен.\nКоличество уникальных пешеходов (за весь отрезок): {people_count}, Общее количество обнаруженных пешеходов: {all_people_count}"
+            print(f"Количество уникальных пешеходов (за весь отрезок): {people_count}, Общее количество обнаруженных пешеходов: {all_people_count}")
+            if zone_counter is not None:
+                zone_report = f"Зоны: {format_zone_counts(zone_counter.counts())}"
+                message += "\n" + zone_report
+                print(zone_report)
+            notifier.send(chat_id, message)
+        else:
+            print("Не удалось получить данные о пешеходах.")
+    finally:
+        # Дожидается отправки сводок из очереди и закрывает соединения
+        await notifier.close()
 
 
 if __name__ == '__main__':
@@ -1,8 +1,18 @@
 # use videoflow to count pedestrians
 
 import cv2
-from ultralytics import YOLO
+from frame_engine import FrameEngine
+from live_grabber import LiveFrameGrabber
+from model_registry import get_model
+from renderer import AsyncRenderer, draw_annotations, resolve_view_mode
 import numpy as np
+import os
+import signal
+import threading
+
+VIEW_MODE = os.getenv("VIEW_MODE", "auto") # window - окно с разметкой, headless - без отрисовки, auto - окно, если есть дисплей
+RENDER_PATH = os.getenv("RENDER_PATH") # MP4 с разметкой каждого RENDER_EVERY-го кадра (для отладки)
+RENDER_EVERY = int(os.getenv("RENDER_EVERY", "10"))
 
 def detect_pedestrian_traffic(video_path):
     """
@@ -13,7 +23,7 @@ def detect_pedestrian_traffic(video_path):
     """
 
     # Загрузка модели YOLO
-    model = YOLO("yolov8n.pt")
+    model = get_model("yolov8n.pt", tracker=None)
 
     # Захват видео
     cap = cv2.VideoCapture(video_path)
@@ -27,48 +37,68 @@ def detect_pedestrian_traffic(video_path):
     # Координаты линии
     line_y = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) / 2) # Примерно посередине по вертикали
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Проблемы с получением кадра с IP-камеры, проверяйте соединение")
-            break  # Выход если видео закончилось
-
-        # Обнаружение объектов
-        results = model(frame)
-
+    # Без дисплея (или в headless-режиме) кадры не размечаются и не показываются
+    show = resolve_view_mode(VIEW_MODE) == "window"
+    stop = threading.Event()
+    if not show:
+        # Без окна нет клавиши 'q': Ctrl+C завершает подсчет с выводом итога
+        signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    renderer = None
+    if RENDER_PATH:
+        renderer = AsyncRenderer(RENDER_PATH, cap.get(cv2.CAP_PROP_FPS) / RENDER_EVERY, RENDER_EVERY, line_y)
+
+    # Декодирование и обнаружение объектов идут в фоновых потоках конвейера.
+    # Берется самый свежий кадр камеры, поэтому картинка и счет не отстают от потока
+    grabber = LiveFrameGrabber(cap, stop=stop)
+    engine = FrameEngine(grabber, grabber.wrap(model), queue_depth=1)
+    for index, frame, r in engine:
         # Обработка результатов
-        for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                b = box.xyxy[0]
-                cls = int(box.cls[0])  
-                confidence = float(box.conf[0])
-
-                if cls == 0 and confidence > 0.5:  # 0 - класс "человек"
-                    x1, y1, x2, y2 = map(int, b)
-                    
-                    # Вычисление центра прямоугольника
-                    center_x = (x1 + x2) // 2
-                    center_y = (y1 + y2) // 2
-
-                    # Идентификатор для каждого объекта (мы будем использовать приблизительный центр)
-                    obj_id = hash((center_x, center_y))
-
-                    # Проверяем, был ли этот объект уже посчитан
-                    if obj_id not in tracked_ids and center_y > line_y: # считаем только тех, кто пересек линию в одном направлении
-                        tracked_ids.add(obj_id)
-                        cv2.rectangle(frame, (x1,y1), (x2,y2), (0,255,0), 2)
-                        cv2.putText(frame, f"Person", (x1,y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5,(0,255,0), 2)
-
-        cv2.line(frame, (0, line_y), (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), line_y), (0, 0, 255), 2) # отображаем линию
-        cv2.putText(frame, f"People Count: {len(tracked_ids)}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-        cv2.imshow("Pedestrian Traffic", frame)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'): # Выход по нажатию 'q'
+        counted = []
+        boxes = r.boxes
+        for box in boxes:
+            b = box.xyxy[0]
+            cls = int(box.cls[0])  
+            confidence = float(box.conf[0])
+
+            if cls == 0 and confidence > 0.5:  # 0 - класс "человек"
+                x1, y1, x2, y2 = map(int, b)
+                
+                # Вычисление центра прямоугольника
+                center_x = (x1 + x2) // 2
+                center_y = (y1 + y2) // 2
+
+                # Идентификатор для каждого объекта (мы будем использовать приблизительный центр)
+                obj_id = hash((center_x, center_y))
+
+                # Проверяем, был ли этот объект уже посчитан
+                if obj_id not in tracked_ids and center_y > line_y: # считаем только тех, кто пересек линию в одном направлении
+                    tracked_ids.add(obj_id)
+                    counted.append((x1, y1, x2, y2))
+
+        grabber.mark_counted(index)
+        if stop.is_set():
+            grabber.stop()
             break
+
+        if renderer:
+            renderer.submit(frame, counted, len(tracked_ids))
+        if show:
+            draw_annotations(frame, counted, line_y, len(tracked_ids)) # боксы, линия и счет
+            cv2.imshow("Pedestrian Traffic", frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'): # Выход по нажатию 'q'
+                grabber.stop()
+                break
+    else:
+        if not stop.is_set():
+            print("Проблемы с получением кадра с IP-камеры, проверяйте соединение")
     
-    cap.release()
-    cv2.destroyAllWindows()
+    if not grabber.reading:
+        cap.release()
+    if show:
+        cv2.destroyAllWindows()
+    if renderer:
+        renderer.close()
+    grabber.report()
     print(f"Общее количество людей: {len(tracked_ids)}")
 
 
@@ -0,0 +1,224 @@
+import os
+import re
+import struct
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+CHUNK_SIZE = 64 * 1024
+PROBE_SIZE = 256 * 1024  # столько байт нужно, чтобы понять структуру контейнера
+DOWNLOAD_TIMEOUT = (10, 60)  # секунды на соединение и на ожидание очередного блока данных
+
+# Контейнеры, которые можно декодировать по мере поступления данных
+_STREAMABLE_MAGIC = (
+    b"\x1a\x45\xdf\xa3",  # Matroska / WebM
+    b"FLV",
+)
+
+
+def is_streamable(head):
+    """Определяет по первым байтам файла, можно ли декодировать его до окончания загрузки.
+
+    MP4/MOV подходит, только если атом `moov` (индекс) стоит перед `mdat`
+    ("faststart"). MPEG-TS, Matroska/WebM и FLV читаются последовательно.
+    Для неизвестных контейнеров возвращает False.
+    """
+    if head.startswith(_STREAMABLE_MAGIC):
+        return True
+    if len(head) > 188 and head[0] == 0x47 and head[188] == 0x47:
+        return True  # MPEG-TS: пакеты по 188 байт с синхробайтом 0x47
+
+    offset = 0
+    while offset + 8 <= len(head):
+        size, box_type = struct.unpack(">I4s", head[offset:offset + 8])
+        if box_type == b"moov":
+            return True
+        if box_type == b"mdat":
+            return False
+        if size == 1 and offset + 16 <= len(head):
+            size = struct.unpack(">Q", head[offset + 8:offset + 16])[0]
+        if size < 8:
+            return False
+        offset += size
+    return False
+
+
+class ProgressiveDownload:
+    """Загружает видео во временный файл в фоновом потоке, позволяя читать его по мере роста.
+
+    Любая ошибка загрузки или записи (сеть, тайм-аут, нехватка места, файл
+    короче Content-Length) сохраняется в error: done=True при error=None
+    означает, что файл загружен полностью.
+    """
+
+    def __init__(self, url, suffix=".mp4", chunk_size=CHUNK_SIZE, timeout=DOWNLOAD_TIMEOUT):
+        self.url = url
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.total = None
+        self.bytes_written = 0
+        self.error = None
+        self.done = False
+        self._cond = threading.Condition()
+        self._cancelled = threading.Event()
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
+            self.path = temp_file.name
+        self._thread = threading.Thread(target=self._download, name="progressive-download", daemon=True)
+        self._thread.start()
+
+    def _download(self):
+        try:
+            with requests.get(self.url, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()  # Проверяем, что запрос успешен
+                length = response.headers.get("Content-Length")
+                with self._cond:
+                    self.total = int(length) if length and length.isdigit() else None
+                with open(self.path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        if self._cancelled.is_set():
+                            break
+                        f.write(chunk)
+                        f.flush()
+                        with self._cond:
+                            self.bytes_written += len(chunk)
+                            self._cond.notify_all()
+            if not self._cancelled.is_set() and self.total is not None and self.bytes_written < self.total:
+                raise IOError(f"Загружено {self.bytes_written} из {self.total} байт")
+        except requests.exceptions.RequestException as e:
+            print(f"Ошибка загрузки видео по ссылке: {e}")
+            self.error = e
+        except Exception as e:
+            # Например, нет места на диске: без этого неполный файл сошел бы за загруженный
+            print(f"Ошибка загрузки видео: {e}")
+            self.error = e
+        finally:
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+
+    def wait_for(self, size, timeout=None):
+        """Ждет, пока в файле окажется не меньше size байт или загрузка завершится.
+
+        Возвращает число байт, записанных на текущий момент.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.bytes_written >= size or self.done, timeout=timeout)
+            return self.bytes_written
+
+    def wait(self):
+        """Дожидается окончания загрузки и возвращает True при успехе."""
+        self._thread.join()
+        return self.error is None
+
+    def head(self, size=PROBE_SIZE):
+        """Возвращает первые байты файла (ожидая их поступления)."""
+        available = self.wait_for(size)
+        with open(self.path, "rb") as f:
+            return f.read(min(size, available))
+
+    def remove(self):
+        """Прерывает загрузку, если она еще идет, и удаляет временный файл."""
+        self._cancelled.set()
+        self._thread.join()
+        try:
+            os.remove(self.path)
+            print(f"Файл {self.path} удален")
+        except OSError as e:
+            print(f"Ошибка удаления файла: {e}")
+
+
+def _make_handler(download):
+    class GrowingFileHandler(BaseHTTPRequestHandler):
+        """Отдает растущий файл по HTTP, дожидаясь недостающих байт."""
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            start, end = 0, download.total
+            match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+            if match and download.total is not None:
+                start = int(match.group(1))
+                if match.group(2):
+                    end = min(int(match.group(2)) + 1, download.total)
+                if start >= download.total:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{download.total}")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end - 1}/{download.total}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            if download.total is not None:
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start))
+            self.end_headers()
+
+            position = start
+            try:
+                with open(download.path, "rb") as f:
+                    f.seek(start)
+                    while end is None or position < end:
+                        available = download.wait_for(position + 1)
+                        if available <= position:
+                            break  # загрузка завершилась (или оборвалась)
+                        size = min(download.chunk_size, available - position)
+                        if end is not None:
+                            size = min(size, end - position)
+                        chunk = f.read(size)
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+                        position += len(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # декодер закрыл соединение, например при перемотке
+
+    return GrowingFileHandler
+
+
+class ProgressiveSource:
+    """Источник видео для cv2.VideoCapture, который читается во время загрузки.
+
+    Если контейнер допускает последовательное чтение, растущий файл отдается
+    локальным HTTP-сервером, и декодер получает байты по мере их прихода, так
+    что загрузка и инференс идут одновременно. Иначе (например, MP4 с индексом
+    в конце) источник дожидается полной загрузки и отдает путь к файлу.
+    """
+
+    def __init__(self, url, suffix=".mp4"):
+        self.download = ProgressiveDownload(url, suffix=suffix)
+        self._server = None
+        self.streaming = False
+
+    def open(self):
+        """Возвращает путь или URL для cv2.VideoCapture (None при ошибке загрузки)."""
+        head = self.download.head()
+        if self.download.error is not None:
+            return None
+        if is_streamable(head) and not self.download.done:
+            self._server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(self.download))
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name="progressive-server", daemon=True).start()
+            self.streaming = True
+            print("Видео обрабатывается по мере загрузки")
+            return f"http://127.0.0.1:{self._server.server_port}/video"
+        if not self.download.wait():
+            return None
+        return self.download.path
+
+    def check(self):
+        """Бросает ошибку загрузки, если она оборвалась: декодер тогда видел только начало видео."""
+        if self.download.error is not None:
+            raise IOError(f"Видео загружено не полностью: {self.download.error}")
+
+    def close(self):
+        """Останавливает локальный сервер и удаляет временный файл."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self.download.remove()
@@ -0,0 +1,129 @@
+import math
+import os
+import queue
+import sys
+import threading
+
+import cv2
+
+DEFAULT_EVERY = 10
+DEFAULT_QUEUE_DEPTH = 4
+DEFAULT_FPS = 25.0
+BOX_COLOR = (0, 255, 0)
+LINE_COLOR = (0, 0, 255)
+TEXT_COLOR = (255, 255, 255)
+_DONE = object()
+
+
+def has_display():
+    """Проверяет, есть ли дисплей для окна OpenCV (на Linux — X11 или Wayland)."""
+    if not sys.platform.startswith("linux"):
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def resolve_view_mode(mode):
+    """Возвращает "window" или "headless"; "auto" выбирает окно только при наличии дисплея."""
+    if mode == "auto":
+        return "window" if has_display() else "headless"
+    return mode
+
+
+def draw_annotations(frame, boxes, line, count, axis="y"):
+    """Рисует на кадре засчитанные боксы, линию подсчета и текущий счет.
+
+    boxes — пары углов (x1, y1, x2, y2); axis="y" — горизонтальная линия
+    y = line, axis="x" — вертикальная x = line.
+    """
+    height, width = frame.shape[:2]
+    for x1, y1, x2, y2 in boxes:
+        cv2.rectangle(frame, (x1, y1), (x2, y2), BOX_COLOR, 2)
+        cv2.putText(frame, "Person", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, BOX_COLOR, 2)
+    if axis == "y":
+        cv2.line(frame, (0, line), (width, line), LINE_COLOR, 2)
+    else:
+        cv2.line(frame, (line, 0), (line, height), LINE_COLOR, 2)
+    cv2.putText(frame, f"People Count: {count}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, TEXT_COLOR, 2)
+    return frame
+
+
+class AsyncRenderer:
+    """Запись размеченного MP4 для отладки, не замедляющая подсчет.
+
+    submit() вызывается на каждом кадре, но берет только каждый every-й:
+    копирует кадр и кладет его в короткую очередь, не дожидаясь записи.
+    Разметку и кодирование выполняет фоновый поток. Если он не успевает,
+    кадр отбрасывается (dropped), а подсчет не ждет. Размер видео берется
+    по первому кадру; fps — частота уже прореженных кадров.
+    """
+
+    def __init__(self, path, fps=DEFAULT_FPS, every=DEFAULT_EVERY, line=0, axis="y",
+                 queue_depth=DEFAULT_QUEUE_DEPTH):
+        self.path = path
+        # У потоков FPS часто неизвестен (0 или NaN)
+        self.fps = fps if fps and math.isfinite(fps) and fps > 0 else DEFAULT_FPS
+        self.every = max(1, int(every))
+        self.line = line
+        self.axis = axis
+        self.written = 0
+        self.dropped = 0
+        self._seen = 0
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="renderer", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, boxes, count):
+        """Передает кадр на отрисовку, если это каждый every-й кадр и очередь не заполнена."""
+        self._seen += 1
+        if (self._seen - 1) % self.every:
+            return False
+        try:
+            self._queue.put_nowait((frame.copy(), list(boxes), count))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _run(self):
+        writer = None
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _DONE:
+                    break
+                frame, boxes, count = item
+                draw_annotations(frame, boxes, self.line, count, self.axis)
+                if writer is None:
+                    height, width = frame.shape[:2]
+                    writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*"mp4v"), self.fps, (width, height))
+                    if not writer.isOpened():
+                        raise RuntimeError(f"Не удалось создать видео {self.path}")
+                writer.write(frame)
+                self.written += 1
+        except Exception as e:
+            self._error = e
+            # Дальше кадры просто выбираются из очереди, чтобы submit() и close() не зависали
+            while self._queue.get() is not _DONE:
+                pass
+        finally:
+            if writer is not None:
+                writer.release()
+
+    def close(self):
+        """Дописывает оставшиеся кадры и закрывает файл."""
+        if self._thread is None:
+            return
+        self._queue.put(_DONE)
+        self._thread.join()
+        self._thread = None
+        if self._error is not None:
+            print(f"Ошибка записи размеченного видео {self.path}: {self._error}")
+        else:
+            print(f"Размеченное видео сохранено в {self.path}: кадров {self.written}, пропущено {self.dropped}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_AGE_DAYS = 180
+
+
+def params_key(params):
+    """Возвращает устойчивый ключ набора параметров подсчета."""
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Постоянный кэш результатов подсчета, адресуемый SHA-256 видео.
+
+    Хранится в SQLite: для каждого хеша видео записываются счетчики,
+    параметры подсчета (модель, порог, линия и т. п.) и время. Кэш привязан
+    к текущему набору параметров: записи, посчитанные с другими параметрами,
+    удаляются при открытии. Записи старше max_age_days удаляются, а при
+    превышении max_entries вытесняются давно не использованные.
+    """
+
+    def __init__(self, path, params, max_entries=DEFAULT_MAX_ENTRIES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.path = path
+        self.params = params
+        self.params_key = params_key(params)
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 24 * 3600 if max_age_days else None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " file_hash TEXT NOT NULL,"
+                " params_key TEXT NOT NULL,"
+                " people_count INTEGER NOT NULL,"
+                " all_people_count INTEGER NOT NULL,"
+                " params TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " PRIMARY KEY (file_hash, params_key))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            stale = self._conn.execute("DELETE FROM results WHERE params_key != ?", (self.params_key,)).rowcount
+        if stale:
+            print(f"Параметры подсчета изменились, удалено устаревших результатов из кэша: {stale}")
+        self.evict()
+
+    def get(self, file_hash):
+        """Возвращает (уникальные пешеходы, общее количество) для видео или None."""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT people_count, all_people_count FROM results WHERE file_hash = ? AND params_key = ?",
+                (file_hash, self.params_key),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE results SET last_used = ? WHERE file_hash = ? AND params_key = ?",
+                    (time.time(), file_hash, self.params_key),
+                )
+        return tuple(row) if row is not None else None
+
+    def put(self, file_hash, counts):
+        """Сохраняет результат подсчета для видео."""
+        now = time.time()
+        people_count, all_people_count = counts
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_hash, self.params_key, people_count, all_people_count,
+                 json.dumps(self.params, sort_keys=True, default=str), now, now),
+            )
+        self.evict()
+
+    def evict(self):
+        """Удаляет записи старше max_age и лишние записи сверх max_entries."""
+        with self._lock, self._conn:
+            removed = 0
+            if self.max_age:
+                removed += self._conn.execute(
+                    "DELETE FROM results WHERE created_at < ?", (time.time() - self.max_age,)).rowcount
+            if self.max_entries:
+                removed += self._conn.execute(
+                    "DELETE FROM results WHERE rowid IN ("
+                    " SELECT rowid FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                ).rowcount
+        return removed
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        """Закрывает базу кэша."""
+        with self._lock:
+            self._conn.close()
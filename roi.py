@@ -0,0 +1,98 @@
+import cv2
+
+from frame_engine import FRAME_SIZE
+
+STRIDE = 32  # ширина полосы кратна шагу сети, чтобы YOLO не добавлял поля
+MODEL_IMGSZ = 640  # imgsz, с которым ultralytics по умолчанию вызывает модель
+
+
+def _letterbox_pixels(width, height, imgsz=MODEL_IMGSZ):
+    """Пиксели входа модели для кадра width x height: letterbox ultralytics до imgsz по длинной стороне."""
+    scale = imgsz / max(width, height)
+    padded_w = -(-round(width * scale) // STRIDE) * STRIDE
+    padded_h = -(-round(height * scale) // STRIDE) * STRIDE
+    return padded_w * padded_h
+
+
+class LineRoi:
+    """Полоса кадра вокруг линии подсчета, на которой только и идет инференс.
+
+    Линия и отступ задаются в координатах кадра после resize_frame (в них
+    же работают трекер и LineCounter). crop() вырезает соответствующую
+    полосу из исходного кадра и масштабирует ее так же, как resize_frame
+    масштабирует весь кадр. to_frame() сдвигает боксы обратно в координаты
+    целого кадра.
+
+    Модель затем сама приводит полосу к imgsz по длинной стороне
+    (letterbox): вертикальная полоса в кадре 640x480 увеличивается в 4/3,
+    так что пешеходы для модели крупнее, чем в целом кадре, а вход модели
+    сокращается меньше, чем доля полосы (pixel_ratio): см. model_input_ratio().
+
+    axis="x" — вертикальная линия x = line (полоса по ширине),
+    axis="y" — горизонтальная линия y = line (полоса по высоте).
+    Отступ должен вмещать путь пешехода до линии за несколько выбранных
+    кадров, иначе трекер не успеет завести трек до пересечения.
+    """
+
+    def __init__(self, line, margin, frame_size=FRAME_SIZE, axis="x"):
+        self.frame_size = frame_size
+        self.axis = axis
+        extent = frame_size[0] if axis == "x" else frame_size[1]
+        start = max(0, int(line - margin))
+        stop = min(extent, int(line + margin))
+        # Расширяем полосу до кратной STRIDE ширины, сколько позволяет кадр
+        width = min(extent, max(STRIDE, -(-(stop - start) // STRIDE) * STRIDE))
+        start = max(0, min(start, extent - width))
+        self.start, self.stop = start, start + width
+        self._columns = [0, 2] if axis == "x" else [1, 3]
+
+    @classmethod
+    def from_ratio(cls, line, margin_ratio, frame_size=FRAME_SIZE, axis="x"):
+        """Создает полосу с отступом в долях ширины (или высоты) кадра; None, если отступ не задан."""
+        if not margin_ratio:
+            return None
+        extent = frame_size[0] if axis == "x" else frame_size[1]
+        return cls(line, margin_ratio * extent, frame_size, axis)
+
+    @property
+    def pixel_ratio(self):
+        """Доля пикселей кадра, которая уходит в инференс."""
+        extent = self.frame_size[0] if self.axis == "x" else self.frame_size[1]
+        return (self.stop - self.start) / extent
+
+    def model_input_ratio(self, imgsz=MODEL_IMGSZ):
+        """Доля входа модели для полосы от входа для целого кадра (с учетом letterbox)."""
+        height, width = self.shape[:2]
+        return _letterbox_pixels(width, height, imgsz) / _letterbox_pixels(*self.frame_size, imgsz)
+
+    @property
+    def shape(self):
+        """Форма кадра, который возвращает crop(): (высота, ширина, 3)."""
+        target_w, target_h = self.frame_size
+        if self.axis == "x":
+            return target_h, self.stop - self.start, 3
+        return self.stop - self.start, target_w, 3
+
+    def crop(self, frame, dst=None):
+        """Вырезает полосу из исходного кадра и приводит ее к масштабу resize_frame (в dst, если задан)."""
+        height, width = frame.shape[:2]
+        target_w, target_h = self.frame_size
+        if self.axis == "x":
+            x0, x1 = round(self.start * width / target_w), round(self.stop * width / target_w)
+            return cv2.resize(frame[:, x0:x1], (self.stop - self.start, target_h), dst=dst)
+        y0, y1 = round(self.start * height / target_h), round(self.stop * height / target_h)
+        return cv2.resize(frame[y0:y1], (target_w, self.stop - self.start), dst=dst)
+
+    def to_frame(self, data):
+        """Переводит боксы `boxes.data` (N x 7) из координат полосы в координаты кадра."""
+        if not len(data) or not self.start:
+            return data
+        data = data.copy()
+        data[:, self._columns] += self.start
+        return data
+
+    def wrap(self, infer):
+        """Оборачивает детектор FrameEngine так, чтобы он возвращал боксы в координатах кадра."""
+        def infer_roi(frames):
+            return [self.to_frame(data) for data in infer(frames)]
+        return infer_roi
@@ -0,0 +1,106 @@
+import math
+import subprocess
+from collections import namedtuple
+
+import cv2
+
+from frame_sampler import FrameSampler
+
+DEFAULT_OVERLAP_SEC = 10.0
+FFPROBE_TIMEOUT_SEC = 300
+
+# start — с какого кадра декодировать (начало перекрытия), count_from — с какого кадра
+# засчитываются пересечения, end — кадр, на котором сегмент заканчивается (None — до конца видео)
+Segment = namedtuple("Segment", "start count_from end")
+
+
+def probe_keyframes(video_path, fps):
+    """Возвращает номера ключевых кадров видео по ffprobe или None, если ffprobe недоступен.
+
+    Читаются только заголовки пакетов, без декодирования, поэтому даже
+    многочасовой файл проверяется за секунды.
+    """
+    command = ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags",
+               "-of", "csv=p=0", video_path]
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, check=True,
+                                timeout=FFPROBE_TIMEOUT_SEC).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    keyframes = set()
+    for line in output.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags:
+            try:
+                keyframes.add(round(float(pts_time) * fps))
+            except ValueError:
+                continue
+    return sorted(keyframes) or None
+
+
+def plan_segments(frame_total, step, parts, overlap_frames, keyframes=None):
+    """Делит видео на parts сегментов с перекрытием overlap_frames перед каждой границей.
+
+    Границы подсчета (count_from) выровнены по шагу выборки, так что
+    сегменты вместе выбирают ровно те же кадры, что и полный проход.
+    Декодирование сегмента начинается на overlap_frames раньше границы:
+    за это время трекер заводит треки пешеходов, уже идущих к линии, и
+    пересечение на стыке засчитывается один раз — тем сегментом, в чей
+    отрезок [count_from, end) оно попало. Если известны ключевые кадры,
+    начало перекрытия сдвигается к ближайшему ключевому кадру перед ним,
+    чтобы перемотка не декодировала лишний GOP.
+    """
+    parts = max(1, min(int(parts), frame_total // max(1, step)))
+    bounds = [math.ceil(frame_total * part / parts / step) * step for part in range(parts)]
+    segments = []
+    for part, count_from in enumerate(bounds):
+        end = bounds[part + 1] if part + 1 < parts else None
+        start = max(0, count_from - overlap_frames)
+        if part and keyframes:
+            before = [frame for frame in keyframes if frame <= start]
+            if before:
+                start = before[-1]
+        # Начало тоже на сетке выборки, иначе трекер в перекрытии видит другие кадры
+        start = min(count_from, math.ceil(start / step) * step) if part else 0
+        segments.append(Segment(start, count_from, end))
+    return segments
+
+
+def plan_video_segments(video_path, parts, interval_sec, min_duration_sec, overlap_sec=DEFAULT_OVERLAP_SEC):
+    """Планирует сегменты для файла; пустой список — видео считается целиком."""
+    if parts <= 1:
+        return []
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return []
+    sampler = FrameSampler(cap, interval_sec)
+    fps, frame_total, step = sampler.fps, sampler.frame_total, sampler.step
+    cap.release()
+    if not fps or frame_total <= 0 or frame_total / fps < min_duration_sec:
+        return []
+    segments = plan_segments(frame_total, step, parts, round(overlap_sec * fps), probe_keyframes(video_path, fps))
+    return segments if len(segments) > 1 else []
+
+
+def count_frames(engine, counter, segment=None):
+    """Прогоняет результаты FrameEngine через counter и возвращает (уникальные, пересечения).
+
+    Для сегмента кадры перекрытия (до count_from) только обновляют треки,
+    а в результат идут пересечения начиная с count_from.
+    """
+    baseline = None
+    for index, _, boxes in engine:
+        if segment is not None and baseline is None and index >= segment.count_from:
+            baseline = counter.counts()
+        counter.update(boxes)
+    counts = counter.counts()
+    if segment is None:
+        return counts
+    if baseline is None:
+        return 0, 0
+    return tuple(total - before for total, before in zip(counts, baseline))
+
+
+def merge_counts(results):
+    """Складывает результаты сегментов (уникальные, пересечения)."""
+    return tuple(sum(values) for values in zip(*results))
@@ -0,0 +1,172 @@
+import asyncio
+import random
+import time
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, InvalidToken, NetworkError, RetryAfter, TelegramError
+from telegram.request import HTTPXRequest
+
+MESSAGE_LIMIT = 4096  # максимальная длина сообщения Telegram
+COALESCE_WINDOW_SEC = 2.0
+CHAT_INTERVAL_SEC = 1.0  # не чаще одного сообщения в секунду в один чат
+GLOBAL_RATE = 25  # сообщений в секунду на бота (лимит Telegram — около 30)
+MAX_RETRIES = 5
+BACKOFF_BASE_SEC = 1.0
+BACKOFF_MAX_SEC = 60.0
+POOL_SIZE = 4
+_CLOSE = object()
+
+
+def split_message(texts, limit=MESSAGE_LIMIT, separator="\n\n"):
+    """Склеивает отчеты в сообщения не длиннее limit символов."""
+    messages = []
+    current = ""
+    for text in texts:
+        while len(text) > limit:
+            if current:
+                messages.append(current)
+                current = ""
+            messages.append(text[:limit])
+            text = text[limit:]
+        if current and len(current) + len(separator) + len(text) > limit:
+            messages.append(current)
+            current = ""
+        current = current + separator + text if current else text
+    if current:
+        messages.append(current)
+    return messages
+
+
+async def send_once(bot_token, chat_id, text):
+    """Отправляет одно сообщение и дожидается доставки (с повторами при ошибках сети и флуд-контроле).
+
+    Для скриптов, которые шлют один итоговый отчет; если сообщений много,
+    нужен один долгоживущий TelegramNotifier.
+    """
+    async with TelegramNotifier(bot_token, coalesce_window=0) as notifier:
+        notifier.send(chat_id, text)
+
+
+def _retry_after_seconds(error):
+    delay = error.retry_after
+    return delay.total_seconds() if hasattr(delay, "total_seconds") else float(delay)
+
+
+class TelegramNotifier:
+    """Долгоживущий отправитель сообщений в Telegram с очередью.
+
+    Один Bot с пулом HTTP-соединений используется для всех сообщений.
+    send() только кладет сообщение в очередь и сразу возвращается, поэтому
+    подсчет не ждет Telegram. Фоновая задача объединяет сообщения в один чат,
+    пришедшие в пределах coalesce_window секунд, соблюдает лимиты частоты
+    (в чат и на бота), а при ошибках сети и флуд-контроле повторяет отправку
+    с экспоненциальной задержкой или ждет указанное сервером время.
+
+    Используется как асинхронный контекстный менеджер; при выходе
+    дожидается отправки всех сообщений из очереди.
+    """
+
+    def __init__(self, bot_token, coalesce_window=COALESCE_WINDOW_SEC, chat_interval=CHAT_INTERVAL_SEC,
+                 global_rate=GLOBAL_RATE, max_retries=MAX_RETRIES, pool_size=POOL_SIZE):
+        self.coalesce_window = coalesce_window
+        self.chat_interval = chat_interval
+        self.send_interval = 1.0 / global_rate if global_rate else 0.0
+        self.max_retries = max_retries
+        self.sent = 0
+        self.failed = 0
+        self._request = HTTPXRequest(connection_pool_size=pool_size)
+        self._bot = Bot(token=bot_token, request=self._request)
+        self._queue = asyncio.Queue()
+        self._pending = {}  # chat_id -> накопленные тексты
+        self._deadlines = {}  # chat_id -> когда отправлять накопленное
+        self._next_allowed = {}  # chat_id -> не раньше этого времени (лимит чата)
+        self._last_send = 0.0
+        self._task = None
+
+    async def start(self):
+        """Открывает пул соединений и запускает фоновую отправку."""
+        await self._request.initialize()
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def send(self, chat_id, text):
+        """Ставит сообщение в очередь на отправку, не дожидаясь ее."""
+        self._queue.put_nowait((chat_id, text))
+
+    async def close(self):
+        """Отправляет все, что осталось в очереди, и закрывает соединения."""
+        if self._task is not None:
+            self._queue.put_nowait(_CLOSE)
+            await self._task
+            self._task = None
+        await self._request.shutdown()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _run(self):
+        closing = False
+        while not (closing and not self._pending):
+            timeout = None
+            if self._deadlines and not closing:
+                timeout = max(0.0, min(self._deadlines.values()) - time.monotonic())
+            item = None
+            if not closing:
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            if item is _CLOSE:
+                closing = True
+            elif item is not None:
+                chat_id, text = item
+                self._pending.setdefault(chat_id, []).append(text)
+                self._deadlines.setdefault(chat_id, max(time.monotonic() + self.coalesce_window,
+                                                        self._next_allowed.get(chat_id, 0.0)))
+            now = time.monotonic()
+            due = [chat_id for chat_id, deadline in self._deadlines.items() if closing or deadline <= now]
+            for chat_id in due:
+                del self._deadlines[chat_id]
+                for message in split_message(self._pending.pop(chat_id)):
+                    await self._deliver(chat_id, message)
+
+    async def _throttle(self, chat_id):
+        now = time.monotonic()
+        delay = max(self._last_send + self.send_interval, self._next_allowed.get(chat_id, 0.0)) - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _deliver(self, chat_id, text):
+        for attempt in range(self.max_retries + 1):
+            await self._throttle(chat_id)
+            try:
+                await self._bot.send_message(chat_id=chat_id, text=text)
+                self.sent += 1
+                print("Сообщение в Telegram успешно отправлено!")
+                return True
+            except RetryAfter as e:
+                delay = _retry_after_seconds(e)
+                print(f"Флуд-контроль Telegram, повтор через {delay:.0f} с")
+            except (BadRequest, Forbidden, InvalidToken) as e:
+                # BadRequest — подкласс NetworkError, но повтор не поможет (нет чата, плохой текст),
+                # а пока идут повторы, очередь стоит для всех чатов
+                print(f"Telegram отклонил сообщение: {e}")
+                break
+            except NetworkError as e:
+                delay = min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * 2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"Ошибка сети при отправке в Telegram: {e}. Повтор через {delay:.1f} с")
+            except TelegramError as e:
+                print(f"Ошибка отправки сообщения в Telegram: {e}")
+                break
+            finally:
+                now = time.monotonic()
+                self._last_send = now
+                self._next_allowed[chat_id] = now + self.chat_interval
+            if attempt < self.max_retries:
+                await asyncio.sleep(delay)
+        self.failed += 1
+        print(f"Сообщение в чат {chat_id} не отправлено")
+        return False
@@ -0,0 +1,105 @@
+import numpy as np
+
+_INITIAL_CAPACITY = 256
+
+
+class TrackStore:
+    """Компактное хранилище состояния треков в виде struct-of-arrays.
+
+    Записи хранятся в массивах, отсортированных по ID трека, поэтому поиск
+    выполняется векторно через `np.searchsorted`. ID трекера растут монотонно,
+    так что новые треки почти всегда дописываются в конец.
+
+    Треки, которые не появлялись дольше `ttl_frames` обработанных кадров,
+    вытесняются; при превышении `max_tracks` вытесняются самые давние.
+    TTL должен быть больше `track_buffer` трекера (30 кадров для bytetrack):
+    после этого трекер сам теряет трек, и его ID больше не возвращается.
+    При ttl_frames=None и max_tracks=None хранилище ничего не вытесняет.
+    """
+
+    def __init__(self, ttl_frames=None, max_tracks=None, capacity=_INITIAL_CAPACITY):
+        self.ttl_frames = ttl_frames
+        self.max_tracks = max_tracks
+        self.size = 0
+        self.evicted_total = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.initial_x = np.zeros(capacity, dtype=np.int64)
+        self.passed = np.zeros(capacity, dtype=bool)
+        self.last_seen = np.zeros(capacity, dtype=np.int64)
+
+    def _columns(self):
+        return ("ids", "initial_x", "passed", "last_seen")
+
+    def _reserve(self, size):
+        capacity = len(self.ids)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in self._columns():
+            column = getattr(self, name)
+            grown = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def lookup(self, ids):
+        """Возвращает индексы записей для ids (-1 для неизвестных треков)."""
+        live = self.ids[:self.size]
+        slots = np.searchsorted(live, ids)
+        found = slots < self.size
+        found[found] = live[slots[found]] == ids[found]
+        return np.where(found, slots, -1)
+
+    def insert(self, ids, initial_x, frame_index):
+        """Добавляет новые треки (ids отсортированы и отсутствуют в хранилище)."""
+        count = len(ids)
+        if count == 0:
+            return
+        self._reserve(self.size + count)
+        start, end = self.size, self.size + count
+        self.ids[start:end] = ids
+        self.initial_x[start:end] = initial_x
+        self.passed[start:end] = False
+        self.last_seen[start:end] = frame_index
+        self.size = end
+        if start and ids[0] < self.ids[start - 1]:
+            # Редкий случай: ID пришли не по возрастанию, восстанавливаем порядок
+            order = np.argsort(self.ids[:end], kind="stable")
+            for name in self._columns():
+                column = getattr(self, name)
+                column[:end] = column[:end][order]
+
+    def evict(self, frame_index):
+        """Удаляет устаревшие треки и возвращает число вытесненных записей."""
+        if self.size == 0:
+            return 0
+        keep = np.ones(self.size, dtype=bool)
+        if self.ttl_frames is not None:
+            keep &= self.last_seen[:self.size] > frame_index - self.ttl_frames
+        if self.max_tracks is not None and np.count_nonzero(keep) > self.max_tracks:
+            recent = np.argsort(self.last_seen[:self.size], kind="stable")[::-1]
+            recent = recent[keep[recent]][:self.max_tracks]
+            keep[:] = False
+            keep[recent] = True
+        evicted = self.size - int(np.count_nonzero(keep))
+        if evicted:
+            size = self.size - evicted
+            for name in self._columns():
+                column = getattr(self, name)
+                column[:size] = column[:self.size][keep]
+            self.size = size
+            self.evicted_total += evicted
+        return evicted
+
+    @property
+    def nbytes(self):
+        """Объем памяти, занятый массивами хранилища, в байтах."""
+        return sum(getattr(self, name).nbytes for name in self._columns())
+
+    def stats(self):
+        """Возвращает показатели хранилища: живые треки, вытесненные и память."""
+        return {
+            "live_tracks": self.size,
+            "evicted_tracks": self.evicted_total,
+            "memory_bytes": self.nbytes,
+        }
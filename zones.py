@@ -0,0 +1,218 @@
+import json
+from collections import namedtuple
+
+import numpy as np
+
+from counting import MIN_CONFIDENCE, PERSON_CLASS
+from frame_engine import FRAME_SIZE
+from track_store import TrackStore
+
+ZONE_TYPES = ("line", "polygon")
+
+# kind — "line" (отрезок из двух точек) или "polygon"; points — координаты в долях кадра (0..1)
+Zone = namedtuple("Zone", "name kind points")
+
+
+def _parse_zones(items):
+    zones = []
+    for number, item in enumerate(items, 1):
+        kind = item.get("type", "line")
+        if kind not in ZONE_TYPES:
+            raise ValueError(f"Неизвестный тип зоны {kind}, доступны: {', '.join(ZONE_TYPES)}")
+        points = [(float(x), float(y)) for x, y in item["points"]]
+        if kind == "line" and len(points) != 2:
+            raise ValueError(f"Линия {item.get('name', number)} задается двумя точками")
+        if kind == "polygon" and len(points) < 3:
+            raise ValueError(f"Многоугольник {item.get('name', number)} задается минимум тремя точками")
+        zones.append(Zone(item.get("name") or f"{kind}{number}", kind, points))
+    return zones
+
+
+def load_zones(path):
+    """Читает файл зон подсчета и возвращает {камера: [Zone, ...]} с ключом "default".
+
+    Формат JSON:
+        {"default": [{"name": "вход", "type": "line", "points": [[0.25, 0], [0.25, 1]]}],
+         "cameras": {"cam2": [{"name": "касса", "type": "polygon",
+                               "points": [[0.1, 0.5], [0.4, 0.5], [0.4, 0.9], [0.1, 0.9]]}]}}
+
+    Камера в "cameras" задается именем (cam1, cam2, ...) или строкой
+    источника; камеры без своего списка получают "default". Координаты —
+    доли ширины и высоты кадра, поэтому не зависят от разрешения.
+    """
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    zones = {key: _parse_zones(items) for key, items in config.get("cameras", {}).items()}
+    zones["default"] = _parse_zones(config.get("default", []))
+    return zones
+
+
+def zones_for_camera(config, *keys):
+    """Возвращает зоны камеры по первому найденному ключу (имя, источник) или зоны по умолчанию."""
+    if not config:
+        return []
+    for key in keys:
+        if key in config:
+            return config[key]
+    return config.get("default", [])
+
+
+def format_zone_counts(counts):
+    """Форматирует {зона: {"in", "out"}} в строку для отчета."""
+    return ", ".join(f"{name}: вход {value['in']}, выход {value['out']}" for name, value in counts.items())
+
+
+class ZoneTrackStore(TrackStore):
+    """TrackStore с последним центром трека и признаком нахождения в каждом многоугольнике."""
+
+    def __init__(self, polygons, ttl_frames=None, max_tracks=None):
+        super().__init__(ttl_frames=ttl_frames, max_tracks=max_tracks)
+        capacity = len(self.ids)
+        self.center = np.zeros((capacity, 2), dtype=np.float64)
+        self.inside = np.zeros((capacity, polygons), dtype=bool)
+
+    def _columns(self):
+        return super()._columns() + ("center", "inside")
+
+
+class ZoneCounter:
+    """Подсчет входов и выходов для любого числа линий и многоугольников.
+
+    Для каждого трека хранится центр бокса на предыдущем кадре, где он
+    появлялся. На каждом кадре все треки проверяются против всех зон
+    сразу, операциями над массивами треки x зоны: пересечение отрезка
+    движения с отрезками-линиями (знак векторного произведения) и
+    попадание центра в многоугольники (четность пересечений луча с
+    ребрами). Поэтому новая зона почти ничего не добавляет ко времени
+    кадра по сравнению с инференсом.
+
+    Направление линии задается порядком точек: "in" — переход с правой
+    стороны на левую, если идти по линии от первой точки ко второй. Для
+    вертикальной линии сверху вниз это движение по кадру слева направо
+    (как у LineCounter), для горизонтальной слева направо — движение снизу
+    вверх. Каждое пересечение считается событием,
+    повторные пересечения тоже. Для многоугольника "in" — центр трека
+    оказался внутри, "out" — вышел наружу. Трек, впервые появившийся
+    внутри, входом не считается.
+
+    Учитываются только боксы класса cls_id с уверенностью выше
+    min_confidence по настоящим колонкам режима трекинга (conf — колонка 5,
+    класс — 6), в отличие от LineCounter, который ради совпадения со старым
+    подсчетом сохраняет фильтр исходного цикла. Координаты — в кадре после
+    resize_frame.
+    """
+
+    def __init__(self, zones, frame_size=FRAME_SIZE, cls_id=PERSON_CLASS, min_confidence=MIN_CONFIDENCE,
+                 ttl_frames=None, max_tracks=None):
+        self.cls_id = cls_id
+        self.min_confidence = min_confidence
+        scale = np.array(frame_size, dtype=np.float64)
+        lines = [zone for zone in zones if zone.kind == "line"]
+        polygons = [zone for zone in zones if zone.kind == "polygon"]
+        self.line_names = [zone.name for zone in lines]
+        self.polygon_names = [zone.name for zone in polygons]
+
+        points = np.array([zone.points for zone in lines], dtype=np.float64).reshape(-1, 2, 2) * scale
+        self._line_start = points[:, 0]
+        self._line_vector = points[:, 1] - points[:, 0]
+
+        # Ребра многоугольников дополняются вырожденными ребрами до одной длины,
+        # чтобы все многоугольники проверялись одним массивом (зоны x ребра)
+        edges = max((len(zone.points) for zone in polygons), default=0)
+        self._edge_a = np.zeros((len(polygons), edges, 2))
+        self._edge_b = np.zeros((len(polygons), edges, 2))
+        for index, zone in enumerate(polygons):
+            vertices = np.array(zone.points, dtype=np.float64) * scale
+            self._edge_a[index] = vertices[0]
+            self._edge_b[index] = vertices[0]
+            self._edge_a[index, :len(vertices)] = vertices
+            self._edge_b[index, :len(vertices)] = np.roll(vertices, -1, axis=0)
+
+        self.line_in = np.zeros(len(lines), dtype=np.int64)
+        self.line_out = np.zeros(len(lines), dtype=np.int64)
+        self.polygon_in = np.zeros(len(polygons), dtype=np.int64)
+        self.polygon_out = np.zeros(len(polygons), dtype=np.int64)
+        self.tracks = ZoneTrackStore(len(polygons), ttl_frames=ttl_frames, max_tracks=max_tracks)
+        self.frame_index = 0
+
+    def update(self, data):
+        """Обрабатывает боксы одного кадра (`boxes.data`, N x 7) и обновляет счетчики зон."""
+        self.frame_index += 1
+        data = np.asarray(data, dtype=np.float64)
+        if data.size:
+            mask = (data[:, 6].astype(np.int64) == self.cls_id) & (data[:, 5] > self.min_confidence)
+            if mask.any():
+                self._update_tracks(data[mask])
+        self.tracks.evict(self.frame_index)
+
+    def _inside(self, centers):
+        """Матрица треки x многоугольники: лежит ли центр внутри (правило четности)."""
+        if not len(self.polygon_names):
+            return np.zeros((len(centers), 0), dtype=bool)
+        x = centers[:, 0, None, None]
+        y = centers[:, 1, None, None]
+        ax, ay = self._edge_a[None, :, :, 0], self._edge_a[None, :, :, 1]
+        bx, by = self._edge_b[None, :, :, 0], self._edge_b[None, :, :, 1]
+        spans = (ay > y) != (by > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crossing_x = ax + (bx - ax) * (y - ay) / (by - ay)
+        return np.count_nonzero(spans & (x < crossing_x), axis=2) % 2 == 1
+
+    def _count_lines(self, start, end):
+        """Считает пересечения отрезков движения start -> end (треки) со всеми линиями."""
+        origin, vector = self._line_start[None], self._line_vector[None]
+        side_before = vector[..., 0] * (start[:, None, 1] - origin[..., 1]) - \
+            vector[..., 1] * (start[:, None, 0] - origin[..., 0])
+        side_after = vector[..., 0] * (end[:, None, 1] - origin[..., 1]) - \
+            vector[..., 1] * (end[:, None, 0] - origin[..., 0])
+        # Концы линии должны лежать по разные стороны от отрезка движения
+        motion = (end - start)[:, None]
+        to_start = origin - start[:, None]
+        to_end = origin + vector - start[:, None]
+        ends_before = motion[..., 0] * to_start[..., 1] - motion[..., 1] * to_start[..., 0]
+        ends_after = motion[..., 0] * to_end[..., 1] - motion[..., 1] * to_end[..., 0]
+        crossed = ((side_before > 0) != (side_after > 0)) & (ends_before * ends_after <= 0)
+        inward = crossed & (side_before > 0)
+        self.line_in += np.count_nonzero(inward, axis=0)
+        self.line_out += np.count_nonzero(crossed & ~inward, axis=0)
+
+    def _update_tracks(self, data):
+        ids = data[:, 4].astype(np.int64)
+        centers = np.column_stack(((data[:, 0] + data[:, 2]) / 2, (data[:, 1] + data[:, 3]) / 2))
+        unique_ids, first = np.unique(ids, return_index=True)
+        centers = centers[first]
+        inside = self._inside(centers)
+
+        tracks = self.tracks
+        slots = tracks.lookup(unique_ids)
+        known = slots >= 0
+        if known.any():
+            previous = slots[known]
+            if len(self.line_names):
+                self._count_lines(tracks.center[previous], centers[known])
+            if len(self.polygon_names):
+                was, now = tracks.inside[previous], inside[known]
+                self.polygon_in += np.count_nonzero(~was & now, axis=0)
+                self.polygon_out += np.count_nonzero(was & ~now, axis=0)
+        if not known.all():
+            new = ~known
+            tracks.insert(unique_ids[new], centers[new, 0].astype(np.int64), self.frame_index)
+            slots = tracks.lookup(unique_ids)
+        tracks.center[slots] = centers
+        tracks.inside[slots] = inside
+        tracks.last_seen[slots] = self.frame_index
+
+    def counts(self):
+        """Возвращает {зона: {"in": входы, "out": выходы}}: сначала линии, затем многоугольники."""
+        counts = {}
+        for name, entered, left in zip(self.line_names, self.line_in, self.line_out):
+            counts[name] = {"in": int(entered), "out": int(left)}
+        for name, entered, left in zip(self.polygon_names, self.polygon_in, self.polygon_out):
+            counts[name] = {"in": int(entered), "out": int(left)}
+        return counts
+
+    def occupancy(self):
+        """Число треков последнего кадра, центр которых внутри каждого многоугольника."""
+        size = self.tracks.size
+        inside = self.tracks.inside[:size][self.tracks.last_seen[:size] == self.frame_index]
+        return {name: int(count) for name, count in zip(self.polygon_names, np.count_nonzero(inside, axis=0))}